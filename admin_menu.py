@@ -1,10 +1,26 @@
+import os
+
 from utils import read_json, save_json
+import bookings_store
+import colunas
+import edicoes
+import importar_reservas
+import instrumentacao
+import ocupacao
+import paralelo
+import referencias
+import resumos
+from modelos import Booking, Vehicle, VehicleClass, registos
+from bisect import insort
 from datetime import datetime
-from typing import List, Dict, Tuple
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 
 ## FORMATO DA DATA (igual ao usado no menu do cliente)
 DATE_FMT = "%Y-%m-%d"
 
+## Nº de processos para ler o histórico nas estatísticas (RENTACAR_PROCESSOS; 1 = em série)
+PROCESSOS = int(os.environ.get("RENTACAR_PROCESSOS", "1") or 1)
+
 
 ## ---------- FUNÇÕES DE LEITURA/ESCRITA DE FICHEIROS ----------
 
@@ -23,39 +39,18 @@ def save_definitions(defs: Dict) -> None:
 
 
 ## Lê classes como lista
-def load_classes() -> List[Dict]:
-    classes = read_json("data/classes.json")
-    if isinstance(classes, list):
-        return classes
-    else:
-        return[]
-
-
-## Guarda classes
-def save_classes(classes: List[Dict]) -> None:
-    save_json("data/classes.json", classes)
+def load_classes() -> List[VehicleClass]:
+    return registos(read_json("data/classes.json"), VehicleClass)
 
 
 ## Lê viaturas como lista
-def load_vehicles() -> List[Dict]:
-    vehicles = read_json("data/vehicles.json")
-    if isinstance(vehicles, list):
-        return vehicles
-    else:
-        return[]
+def load_vehicles() -> List[Vehicle]:
+    return registos(read_json("data/vehicles.json"), Vehicle)
 
-## Guarda viaturas
-def save_vehicles(vehicles: List[Dict]) -> None:
-    save_json("data/vehicles.json", vehicles)
 
-
-## Lê reservas como lista
-def load_bookings() -> List[Dict]:
-    bookings = read_json("data/bookings.json")
-    if isinstance(bookings, list):
-        return bookings
-    else:
-        return[]
+## Lê reservas como lista (snapshot + journal)
+def load_bookings() -> List[Booking]:
+    return bookings_store.load_bookings()
 
 
 ## ---------- FUNÇÕES AUXILIARES DE DATAS ----------
@@ -75,13 +70,13 @@ def input_data(mensagem: str) -> datetime:
             print("Data inválida. Use o formato YYYY-MM-DD.")
 
 
-## Calcula nº de dias de interseção entre dois intervalos [ini, fim)
-def dias_intersecao(ini1: datetime, fim1: datetime, ini2: datetime, fim2: datetime) -> int:
+## Calcula nº de dias de interseção entre dois intervalos [ini, fim) em ordinais
+def dias_intersecao(ini1: int, fim1: int, ini2: int, fim2: int) -> int:
     inicio = max(ini1, ini2)
     fim = min(fim1, fim2)
     if fim <= inicio:
         return 0
-    return (fim - inicio).days
+    return fim - inicio
 
 
 ## ---------- DEFINIÇÕES GERAIS ----------
@@ -136,21 +131,21 @@ def gerir_definicoes() -> None:
 ## ---------- GESTÃO DE CLASSES ----------
 
 ## Lista classes (id, nome, descrição, preco_diario)
-def listar_classes(classes: List[Dict]) -> None:
+def listar_classes(classes: List[VehicleClass]) -> None:
     print("\n------ Lista de Classes ------")
     if not classes:
         print("Não existem classes definidas.")
         return
     for c in classes:
         print(
-            f"ID {c.get('id')} | {c.get('nome')} - {c.get('descrição')} "
-            f"| {c.get('preco_diario')} €/dia"
+            f"ID {c.id} | {c.nome} - {c.descricao} "
+            f"| {c.preco_diario} €/dia"
         )
 
 
 ## Cria nova classe garantindo unicidade do id
-def criar_classe() -> None:
-    classes = load_classes()
+def criar_classe(sessao: Dict) -> None:
+    classes = sessao["registos"]
     listar_classes(classes)
 
     try:
@@ -160,7 +155,7 @@ def criar_classe() -> None:
         return
 
     ## Validar unicidade do ID
-    if any(str(c.get("id")) == str(novo_id) for c in classes):
+    if existe_classe(novo_id, classes):
         print("Já existe uma classe com esse ID.")
         return
 
@@ -179,131 +174,203 @@ def criar_classe() -> None:
         print("Preço inválido.")
         return
 
-    nova = {
+    nova = VehicleClass.from_dict({
         "id": novo_id,
         "nome": nome,
         "descrição": descricao,
         "preco_diario": preco,
-    }
-    classes.append(nova)
-    save_classes(classes)
+    })
+    edicoes.guardar_registo(sessao, nova)
     print("Classe criada com sucesso.\n")
 
 
 ## Edita uma classe existente
-def editar_classe() -> None:
-    classes = load_classes()
+def editar_classe(sessao: Dict) -> None:
+    classes = sessao["registos"]
     if not classes:
         print("Não existem classes para editar.")
         return
 
     listar_classes(classes)
     id_txt = input("\nID da classe a editar: ").strip()
-    classe = next((c for c in classes if str(c.get("id")) == id_txt), None)
+    classe = next((c for c in classes if c.chave == id_txt), None)
     if not classe:
         print("Classe não encontrada.")
         return
 
     print("ENTER para manter o valor atual.")
-    nome = input(f"Nome [{classe.get('nome')}]: ").strip() or classe.get("nome")
+    nome = input(f"Nome [{classe.nome}]: ").strip() or classe.nome
     descricao = (
-        input(f"Descrição [{classe.get('descrição')}]: ").strip()
-        or classe.get("descrição")
+        input(f"Descrição [{classe.descricao}]: ").strip()
+        or classe.descricao
     )
-    preco_txt = input(f"Preço diário [{classe.get('preco_diario')}]: ").strip()
+    preco_txt = input(f"Preço diário [{classe.preco_diario}]: ").strip()
 
     if preco_txt:
         try:
             preco = float(preco_txt)
         except ValueError:
             print("Preço inválido, mantém-se o anterior.")
-            preco = classe.get("preco_diario")
+            preco = classe.preco_diario
     else:
-        preco = classe.get("preco_diario")
+        preco = classe.preco_diario
 
     ## Atualizar valores
-    classe["nome"] = nome
-    classe["descrição"] = descricao
-    classe["preco_diario"] = preco
+    classe.nome = nome
+    classe.descricao = descricao
+    classe.preco_diario = preco
 
-    save_classes(classes)
+    edicoes.guardar_registo(sessao, classe)
     print("Classe atualizada com sucesso.\n")
 
 
-## Remove uma classe
-def remover_classe() -> None:
-    classes = load_classes()
+## O que fazer aos registos que dependem do que vai ser removido:
+## "1" cancelar, "2" reatribuir, "3" remover também (cascata)
+def escolher_modo(dependentes: str) -> str:
+    print("1. Cancelar a remoção")
+    print(f"2. Reatribuir {dependentes}")
+    print(f"3. Remover também {dependentes} (cascata)")
+    modo = input("Opção: ").strip()
+    return modo if modo in ("2", "3") else "1"
+
+
+## Remove uma classe; se ainda tem viaturas, estas passam para outra classe ou são removidas
+## também (só se nenhuma tiver reservas ativas ou futuras)
+## As viaturas mudam na sessão da frota (ligada à das classes): são gravadas com a remoção da classe
+def remover_classe(sessao: Dict, frota: Dict) -> None:
+    classes = sessao["registos"]
     if not classes:
         print("Não existem classes para remover.")
         return
 
     listar_classes(classes)
     id_txt = input("\nID da classe a remover: ").strip()
-    nova_lista = [c for c in classes if str(c.get("id")) != id_txt]
 
-    if len(nova_lista) == len(classes):
+    if not any(c.chave == id_txt for c in classes):
         print("Classe não encontrada.")
         return
 
-    save_classes(nova_lista)
+    viaturas = [v for v in frota["registos"] if v.classe == id_txt]
+    if viaturas:
+        matriculas = [v.matricula for v in viaturas]
+        print(f"A classe tem {len(viaturas)} viatura(s): {', '.join(matriculas)}")
+        modo = escolher_modo("as viaturas")
+        if modo == "1":
+            print("Remoção cancelada.")
+            return
+        if modo == "2":
+            destino_txt = input("ID da classe de destino: ").strip()
+            destino = next((c for c in classes if c.chave == destino_txt), None)
+            if destino is None or destino_txt == id_txt:
+                print("Classe de destino inválida. Remoção cancelada.")
+                return
+        else:
+            com_reservas = [mat for mat in matriculas if referencias.reservas_futuras(mat)]
+            if com_reservas:
+                print(
+                    "Estas viaturas têm reservas ativas ou futuras: "
+                    f"{', '.join(com_reservas)}. Remoção cancelada."
+                )
+                return
+
+    ## A gravação periódica não separa as viaturas da remoção da classe
+    with edicoes.lote(sessao):
+        for v in viaturas:
+            if modo == "2":
+                v.id_classe = destino.id
+                edicoes.guardar_registo(frota, v)
+            else:
+                edicoes.remover_registo(frota, v.matricula)
+        edicoes.remover_registo(sessao, id_txt)
+    if viaturas:
+        print(
+            f"{len(viaturas)} viatura(s) passaram para a classe {destino.id}."
+            if modo == "2" else f"{len(viaturas)} viatura(s) removida(s)."
+        )
     print("Classe removida com sucesso.\n")
 
 
+## Avisa das alterações recuperadas de uma sessão que terminou sem gravar
+def avisar_recuperadas(sessao: Dict) -> None:
+    if sessao["recuperadas"]:
+        print(
+            f"\nRecuperadas {sessao['recuperadas']} alterações não gravadas de uma sessão anterior "
+            "(são gravadas com as restantes)."
+        )
+
+
+## Grava as alterações pendentes da sessão
+def guardar_alteracoes(sessao: Dict) -> None:
+    n = edicoes.gravar(sessao)
+    print(f"{n} registo(s) gravado(s)." if n else "Não há alterações por gravar.")
+
+
 ## Menu de gestão de classes
+## As alterações são gravadas ao voltar, com "Guardar alterações" ou periodicamente (edicoes)
 def menu_classes() -> None:
-    while True:
-        print("\n------ Gestão de Classes ------")
-        print("1. Listar classes")
-        print("2. Criar classe")
-        print("3. Editar classe")
-        print("4. Remover classe")
-        print("5. Voltar")
-        op = input("Opção: ").strip()
-
-        if op == "1":
-            listar_classes(load_classes())
-        elif op == "2":
-            criar_classe()
-        elif op == "3":
-            editar_classe()
-        elif op == "4":
-            remover_classe()
-        elif op == "5":
-            break
-        else:
-            print("Opção inválida.")
+    with edicoes.sessao("data/classes.json", VehicleClass) as sessao, \
+            edicoes.sessao("data/vehicles.json", Vehicle) as frota:
+        ## Classes gravadas antes das viaturas, para nenhuma viatura referir uma classe por gravar
+        edicoes.ligar(sessao, frota)
+        avisar_recuperadas(sessao)
+        avisar_recuperadas(frota)
+        while True:
+            print("\n------ Gestão de Classes ------")
+            print("1. Listar classes")
+            print("2. Criar classe")
+            print("3. Editar classe")
+            print("4. Remover classe")
+            print(f"5. Guardar alterações ({edicoes.pendentes(sessao)} por gravar)")
+            print("6. Voltar")
+            op = input("Opção: ").strip()
+
+            if op == "1":
+                listar_classes(sessao["registos"])
+            elif op == "2":
+                criar_classe(sessao)
+            elif op == "3":
+                editar_classe(sessao)
+            elif op == "4":
+                remover_classe(sessao, frota)
+            elif op == "5":
+                guardar_alteracoes(sessao)
+            elif op == "6":
+                break
+            else:
+                print("Opção inválida.")
 
 
 ## ---------- GESTÃO DE FROTA ----------
 
 ## Lista viaturas (matricula, marca, modelo, id_classe, estado)
-def listar_viaturas(vehicles: List[Dict]) -> None:
+def listar_viaturas(vehicles: List[Vehicle]) -> None:
     print("\n------ Frota de Viaturas ------")
     if not vehicles:
         print("Não existem viaturas.")
         return
     for v in vehicles:
         print(
-            f"{v.get('matricula')} | {v.get('marca')} {v.get('modelo')} "
-            f"| classe {v.get('id_classe')} | estado: {v.get('estado')}"
+            f"{v.matricula} | {v.marca} {v.modelo} "
+            f"| classe {v.id_classe} | estado: {v.estado}"
         )
 
 
 ## Verifica se existe classe com dado id
-def existe_classe(id_classe, classes: List[Dict]) -> bool:
-    return any(str(c.get("id")) == str(id_classe) for c in classes)
+def existe_classe(id_classe, classes: List[VehicleClass]) -> bool:
+    chave = str(id_classe)
+    return any(c.chave == chave for c in classes)
 
 
 ## Adiciona nova viatura
-def adicionar_viatura() -> None:
-    vehicles = load_vehicles()
+def adicionar_viatura(sessao: Dict) -> None:
+    vehicles = sessao["registos"]
     classes = load_classes()
 
     listar_viaturas(vehicles)
 
     matricula = input("\nMatrícula: ").strip().upper()
     ## Validar unicidade da matrícula
-    if any(v.get("matricula") == matricula for v in vehicles):
+    if any(v.matricula == matricula for v in vehicles):
         print("Já existe uma viatura com essa matrícula.")
         return
 
@@ -323,7 +390,7 @@ def adicionar_viatura() -> None:
         return
 
     ## Validar existência da classe
-    if not existe_classe(id_classe, classes):
+    if str(id_classe) not in referencias.chaves_classes(classes):
         print("Não existe nenhuma classe com esse ID.")
         return
 
@@ -331,21 +398,20 @@ def adicionar_viatura() -> None:
         print("Estado inválido, será considerado 'ativo'.")
         estado = "ativo"
 
-    nova = {
-        "matricula": matricula,
-        "marca": marca,
-        "modelo": modelo,
-        "id_classe": id_classe,
-        "estado": estado,
-    }
-    vehicles.append(nova)
-    save_vehicles(vehicles)
+    nova = Vehicle(
+        matricula=matricula,
+        marca=marca,
+        modelo=modelo,
+        id_classe=id_classe,
+        estado=estado,
+    )
+    edicoes.guardar_registo(sessao, nova)
     print("Viatura adicionada com sucesso.\n")
 
 
 ## Edita uma viatura
-def editar_viatura() -> None:
-    vehicles = load_vehicles()
+def editar_viatura(sessao: Dict) -> None:
+    vehicles = sessao["registos"]
     if not vehicles:
         print("Não existem viaturas para editar.")
         return
@@ -354,143 +420,222 @@ def editar_viatura() -> None:
     listar_viaturas(vehicles)
 
     mat = input("\nMatrícula da viatura a editar: ").strip().upper()
-    v = next((x for x in vehicles if x.get("matricula") == mat), None)
+    v = next((x for x in vehicles if x.matricula == mat), None)
     if not v:
         print("Viatura não encontrada.")
         return
 
     print("ENTER para manter o valor atual.")
-    marca = input(f"Marca [{v.get('marca')}]: ").strip() or v.get("marca")
-    modelo = input(f"Modelo [{v.get('modelo')}]: ").strip() or v.get("modelo")
-    id_txt = input(f"ID classe [{v.get('id_classe')}]: ").strip()
-    estado = input(f"Estado (ativo/inativo) [{v.get('estado')}]: ").strip() or v.get(
-        "estado"
-    )
+    marca = input(f"Marca [{v.marca}]: ").strip() or v.marca
+    modelo = input(f"Modelo [{v.modelo}]: ").strip() or v.modelo
+    id_txt = input(f"ID classe [{v.id_classe}]: ").strip()
+    estado = input(f"Estado (ativo/inativo) [{v.estado}]: ").strip() or v.estado
 
     if id_txt:
         try:
             id_classe = int(id_txt)
         except ValueError:
             print("ID de classe inválido, mantém-se o anterior.")
-            id_classe = v.get("id_classe")
+            id_classe = v.id_classe
         else:
-            if not existe_classe(id_classe, classes):
+            if str(id_classe) not in referencias.chaves_classes(classes):
                 print("Classe inexistente, mantém-se o anterior.")
-                id_classe = v.get("id_classe")
+                id_classe = v.id_classe
+            elif str(id_classe) != v.classe:
+                ## Reservas já feitas mantêm o preço da classe anterior
+                futuras = referencias.reservas_futuras(v.matricula)
+                if futuras and input(
+                    f"A viatura tem {len(futuras)} reserva(s) ativas ou futuras. "
+                    "Mudar a classe mesmo assim? (s/N): "
+                ).strip().lower() != "s":
+                    id_classe = v.id_classe
     else:
-        id_classe = v.get("id_classe")
+        id_classe = v.id_classe
 
     if estado not in ("ativo", "inativo"):
         print("Estado inválido, mantém-se o anterior.")
-        estado = v.get("estado")
+        estado = v.estado
 
     ## Atualizar
-    v["marca"] = marca
-    v["modelo"] = modelo
-    v["id_classe"] = id_classe
-    v["estado"] = estado
+    v.marca = marca
+    v.modelo = modelo
+    v.id_classe = id_classe
+    v.estado = estado
 
-    save_vehicles(vehicles)
+    edicoes.guardar_registo(sessao, v)
     print("Viatura atualizada com sucesso.\n")
 
 
 ## Remove uma viatura
-def remover_viatura() -> None:
-    vehicles = load_vehicles()
+def remover_viatura(sessao: Dict) -> None:
+    vehicles = sessao["registos"]
     if not vehicles:
         print("Não existem viaturas para remover.")
         return
 
     listar_viaturas(vehicles)
     mat = input("\nMatrícula da viatura a remover: ").strip().upper()
-    nova_lista = [v for v in vehicles if v.get("matricula") != mat]
 
-    if len(nova_lista) == len(vehicles):
+    if not any(v.matricula == mat for v in vehicles):
         print("Viatura não encontrada.")
         return
 
-    save_vehicles(nova_lista)
+    ## Reservas ativas ou futuras: passam para outra viatura ou são canceladas (numa só escrita)
+    futuras = referencias.reservas_futuras(mat)
+    if futuras:
+        print(f"A viatura tem {len(futuras)} reserva(s) ativas ou futuras:")
+        for b in futuras:
+            print(f"  {b.data_inicio} a {b.data_fim} | {b.email}")
+        modo = escolher_modo("as reservas")
+        if modo == "1":
+            print("Remoção cancelada.")
+            return
+        if modo == "2":
+            destino = input("Matrícula da viatura de destino: ").strip().upper()
+            viatura = next((x for x in vehicles if x.matricula == destino), None)
+            if viatura is None or destino == mat or viatura.estado != "ativo":
+                print("Viatura de destino inválida. Remoção cancelada.")
+                return
+            ## A viatura de destino tem de estar gravada antes das reservas a referirem
+            if destino in sessao["sujos"]:
+                edicoes.gravar(sessao)
+            alteracoes = {
+                (b.matricula, b.data_inicio, b.data_fim): {**b.to_dict(), "matricula": destino} for b in futuras
+            }
+        else:
+            if input("Cancelar estas reservas? (s/N): ").strip().lower() != "s":
+                print("Remoção cancelada.")
+                return
+            alteracoes = {(b.matricula, b.data_inicio, b.data_fim): None for b in futuras}
+        try:
+            n = bookings_store.alterar_reservas(alteracoes)
+        except ValueError as erro:
+            print(f"{erro} Remoção cancelada.")
+            return
+        print(f"{n} reserva(s) {'reatribuída(s)' if modo == '2' else 'cancelada(s)'}.")
+
+    edicoes.remover_registo(sessao, mat)
     print("Viatura removida com sucesso.\n")
 
 
-## Menu de gestão de frota
+## Menu de gestão de frota (gravação como em menu_classes)
 def menu_frota() -> None:
-    while True:
-        print("\n------ Gestão de Frota ------")
-        print("1. Listar viaturas")
-        print("2. Adicionar viatura")
-        print("3. Editar viatura")
-        print("4. Remover viatura")
-        print("5. Voltar")
-        op = input("Opção: ").strip()
-
-        if op == "1":
-            listar_viaturas(load_vehicles())
-        elif op == "2":
-            adicionar_viatura()
-        elif op == "3":
-            editar_viatura()
-        elif op == "4":
-            remover_viatura()
-        elif op == "5":
-            break
-        else:
-            print("Opção inválida.")
+    with edicoes.sessao("data/vehicles.json", Vehicle) as sessao:
+        avisar_recuperadas(sessao)
+        while True:
+            print("\n------ Gestão de Frota ------")
+            print("1. Listar viaturas")
+            print("2. Adicionar viatura")
+            print("3. Editar viatura")
+            print("4. Remover viatura")
+            print(f"5. Guardar alterações ({edicoes.pendentes(sessao)} por gravar)")
+            print("6. Voltar")
+            op = input("Opção: ").strip()
+
+            if op == "1":
+                listar_viaturas(sessao["registos"])
+            elif op == "2":
+                adicionar_viatura(sessao)
+            elif op == "3":
+                editar_viatura(sessao)
+            elif op == "4":
+                remover_viatura(sessao)
+            elif op == "5":
+                guardar_alteracoes(sessao)
+            elif op == "6":
+                break
+            else:
+                print("Opção inválida.")
 
 
 ## ---------- EXTRATO DIÁRIO ----------
 
-## Mostra reservas de uma determinada data e resumo
-def extrato_diario() -> None:
-    bookings = load_bookings()
-    if not bookings:
-        print("Não existem reservas.")
+## Índice diário: ordinal do dia -> reservas ativas nesse dia (ordenadas por data_inicio)
+## Usado por quem mantém o histórico em memória (servicos); o menu lê o histórico em fluxo
+
+## Acrescenta uma reserva a todos os dias em que está ativa [inicio, fim)
+def indexar_dia(indice: Dict[int, List[Booking]], b: Booking) -> None:
+    if b.inicio is None or b.fim is None:
         return
+    for dia in range(b.inicio, b.fim):
+        insort(indice.setdefault(dia, []), b, key=lambda x: x.data_inicio or "")
+
+
+## Constrói o índice diário a partir do histórico completo
+def construir_indice_diario(bookings: List[Booking]) -> Dict[int, List[Booking]]:
+    indice = {}
+    for b in bookings:
+        indexar_dia(indice, b)
+    return indice
 
-    data = input_data("Data para extrato diário (YYYY-MM-DD): ")
-    vehicles = load_vehicles()
-    classes = load_classes()
 
+## Reservas ativas num dia [inicio, fim), lidas em fluxo do histórico (ordenadas por data_inicio)
+## Só são abertas as partições que podem ter reservas nesse dia
+def reservas_do_dia(dia: int) -> Iterator[Booking]:
+    return (
+        b for b in bookings_store.iterar_reservas(dia, dia + 1)
+        if b.inicio is not None and b.fim is not None and b.inicio <= dia < b.fim
+    )
+
+
+## Resume as reservas ativas num dia: reservas, total, dias e total por classe
+def calcular_extrato(reservas: Iterable[Booking], vehicles: List[Vehicle]) -> Dict:
     ## Mapa matricula -> id_classe
-    mapa_viaturas = {v.get("matricula"): v.get("id_classe") for v in vehicles}
+    mapa_viaturas = {v.matricula: v.id_classe for v in vehicles}
 
-    print(f"\n------ Extrato do dia {data.strftime(DATE_FMT)} ------")
     selecionadas = []
     total = 0.0
     total_dias = 0
     por_classe = {}
 
-    for b in bookings:
-        try:
-            ini = parse_date(b.get("data_inicio"))
-            fim = parse_date(b.get("data_fim"))
-        except Exception:
-            continue
-
-        ## Verificar se a reserva inicia ou ocorre nessa data
-        ocorre = ini <= data < fim
-        if not ocorre:
-            continue
-
+    ## Reservas que iniciam ou ocorrem nessa data
+    for b in reservas:
         selecionadas.append(b)
-        valor = float(b.get("total", 0))
-        dias = int(b.get("dias", 0))
+        valor = float(b.total or 0)
+        dias = int(b.dias or 0)
         total += valor
         total_dias += dias
 
-        id_classe = mapa_viaturas.get(b.get("matricula"))
+        id_classe = mapa_viaturas.get(b.matricula)
         if id_classe is not None:
             por_classe[id_classe] = por_classe.get(id_classe, 0) + valor
 
+    return {
+        "reservas": selecionadas,
+        "total": total,
+        "dias": total_dias,
+        "por_classe": por_classe,
+    }
+
+
+## Mostra reservas de uma determinada data e resumo
+## (o histórico é percorrido em fluxo; em memória ficam só as reservas desse dia)
+@instrumentacao.medir("extrato_diario")
+def extrato_diario() -> None:
+    if not bookings_store.existem_reservas():
+        print("Não existem reservas.")
+        return
+
+    data = input_data("Data para extrato diário (YYYY-MM-DD): ")
+    vehicles = load_vehicles()
+    classes = load_classes()
+
+    print(f"\n------ Extrato do dia {data.strftime(DATE_FMT)} ------")
+    extrato = calcular_extrato(reservas_do_dia(data.toordinal()), vehicles)
+    selecionadas = extrato["reservas"]
+    total = extrato["total"]
+    total_dias = extrato["dias"]
+    por_classe = extrato["por_classe"]
+
     if not selecionadas:
         print("Não existem reservas para essa data.")
         return
 
     for i, b in enumerate(selecionadas, 1):
         print(
-            f"{i}. {b.get('email')} | {b.get('matricula')} | "
-            f"{b.get('data_inicio')} -> {b.get('data_fim')} | "
-            f"{b.get('dias')} dias | total {b.get('total')}€"
+            f"{i}. {b.email} | {b.matricula} | "
+            f"{b.data_inicio} -> {b.data_fim} | "
+            f"{b.dias} dias | total {b.total}€"
         )
 
     print("\nResumo do dia:")
@@ -503,7 +648,7 @@ def extrato_diario() -> None:
         print("  Distribuição por classe:")
         for id_classe, valor in por_classe.items():
             nome = next(
-                (c.get("nome") for c in classes if str(c.get("id")) == str(id_classe)),
+                (c.nome for c in classes if c.chave == str(id_classe)),
                 f"Classe {id_classe}",
             )
             print(f"    {nome}: {valor}€")
@@ -511,31 +656,11 @@ def extrato_diario() -> None:
 
 ## ---------- ESTATÍSTICAS ----------
 
-## Calcula e mostra estatísticas globais, por classe e por viatura
-def estatisticas() -> None:
-    bookings = load_bookings()
-    if not bookings:
-        print("Não existem reservas.")
-        return
-
-    print("\n------ Estatísticas ------")
-    print("Indique o intervalo de datas para análise.")
-    ini = input_data("Data início (YYYY-MM-DD): ")
-    fim = input_data("Data fim (YYYY-MM-DD): ")
-
-    if fim <= ini:
-        print("Data fim deve ser posterior à data início.")
-        return
-
-    vehicles = load_vehicles()
-    classes = load_classes()
-    periodo_dias = (fim - ini).days
-
-    ## Mapas auxiliares
-    mapa_viaturas = {v.get("matricula"): v for v in vehicles}
-    mapa_classe_por_mat = {v.get("matricula"): v.get("id_classe") for v in vehicles}
-
-    total_faturado = 0.0
+## Acumula linhas (matricula, valor, dias na interseção) pela ordem dada:
+## globais, por classe e por viatura
+def acumular_estatisticas(linhas: Iterable[Tuple[str, float, int]], mapa_classe_por_mat: Dict) -> Dict:
+    ## Faturação somada em cêntimos (como nos resumos e no motor em colunas)
+    total_faturado = 0
     num_reservas = 0
     dias_alugados_total = 0
 
@@ -543,30 +668,18 @@ def estatisticas() -> None:
     por_classe = {}  # id_classe -> dict
     por_viatura = {}  # matricula -> dict
 
-    for b in bookings:
-        try:
-            b_ini = parse_date(b.get("data_inicio"))
-            b_fim = parse_date(b.get("data_fim"))
-        except Exception:
-            continue
-
-        ## Verificar se há interseção com o período escolhido
-        dias_int = dias_intersecao(b_ini, b_fim, ini, fim)
-        if dias_int <= 0:
-            continue
-
+    for mat, valor, dias_int in linhas:
         num_reservas += 1
-        valor = float(b.get("total", 0))
+        valor = resumos.em_centimos(valor)
         total_faturado += valor
         dias_alugados_total += dias_int
 
-        mat = b.get("matricula")
         id_classe = mapa_classe_por_mat.get(mat)
 
         ## Por classe
         if id_classe is not None:
             dados = por_classe.setdefault(
-                id_classe, {"total": 0.0, "reservas": 0, "dias": 0}
+                id_classe, {"total": 0, "reservas": 0, "dias": 0}
             )
             dados["total"] += valor
             dados["reservas"] += 1
@@ -574,12 +687,127 @@ def estatisticas() -> None:
 
         ## Por viatura
         dados_v = por_viatura.setdefault(
-            mat, {"total": 0.0, "reservas": 0, "dias": 0}
+            mat, {"total": 0, "reservas": 0, "dias": 0}
         )
         dados_v["total"] += valor
         dados_v["reservas"] += 1
         dados_v["dias"] += dias_int
 
+    for dados in list(por_classe.values()) + list(por_viatura.values()):
+        dados["total"] /= 100
+    return {
+        "total_faturado": total_faturado / 100,
+        "num_reservas": num_reservas,
+        "dias_alugados_total": dias_alugados_total,
+        "por_classe": por_classe,
+        "por_viatura": por_viatura,
+    }
+
+
+## Agrega as reservas que intersetam [ini, fim): globais, por classe e por viatura
+## bookings pode ser um gerador (percorrido uma só vez)
+## Usa o motor em colunas (NumPy, por blocos) quando disponível; o resultado é o mesmo do ciclo
+def calcular_estatisticas(bookings: Iterable[Booking], vehicles: List[Vehicle], ini: datetime, fim: datetime) -> Dict:
+    mapa_classe_por_mat = {v.matricula: v.id_classe for v in vehicles}
+
+    if colunas.np is not None:
+        return colunas.agregar(bookings, ini.toordinal(), fim.toordinal(), mapa_classe_por_mat)
+
+    ini = ini.toordinal()
+    fim = fim.toordinal()
+
+    ## Verificar se há interseção com o período escolhido
+    def linhas():
+        for b in bookings:
+            if b.inicio is None or b.fim is None:
+                continue
+            dias_int = dias_intersecao(b.inicio, b.fim, ini, fim)
+            if dias_int > 0:
+                yield b.matricula, float(b.total or 0), dias_int
+
+    return acumular_estatisticas(linhas(), mapa_classe_por_mat)
+
+
+## Igual a calcular_estatisticas sobre o histórico completo, mas lido por vários processos
+## (None se não for possível: backend sqlite ou snapshot noutro formato)
+def calcular_estatisticas_paralelo(vehicles: List[Vehicle], ini: datetime, fim: datetime, processos: int) -> Optional[Dict]:
+    return paralelo.estatisticas_do_periodo(
+        ini.toordinal(), fim.toordinal(), processos, {v.matricula: v.id_classe for v in vehicles}
+    )
+
+
+## Estatísticas a partir dos resumos mensais: os meses inteiros do período vêm dos resumos
+## e só as reservas das bordas são lidas do histórico (None se o período não tem nenhum mês
+## inteiro ou não há resumos; nesse caso lê-se o histórico todo do período)
+## A faturação é somada em cêntimos
+def calcular_estatisticas_resumos(vehicles: List[Vehicle], ini: datetime, fim: datetime) -> Optional[Dict]:
+    ini, fim = ini.toordinal(), fim.toordinal()
+    meses = resumos.meses_inteiros(ini, fim)
+    if meses is None:
+        return None
+    a, b = meses
+    resumo = bookings_store.ler_resumos(a, b)
+    if resumo is None:
+        return None
+
+    ## Reservas que começam antes dos meses inteiros (com os dias nas duas bordas)
+    ## e as restantes que têm dias depois deles
+    def bordas():
+        for r in bookings_store.iterar_reservas(ini, max(a, ini + 1)):
+            if r.inicio is not None and r.fim is not None and r.inicio < a and r.fim > ini:
+                yield r
+        if b < fim:
+            for r in bookings_store.iterar_reservas(b, fim):
+                if r.inicio is not None and r.fim is not None and a <= r.inicio < fim and r.fim > b:
+                    yield r
+
+    return resumos.agregar(resumo, ini, fim, bordas(), {v.matricula: v.id_classe for v in vehicles})
+
+
+## Estatísticas do histórico em [ini, fim): pelos resumos mensais, por vários processos
+## (RENTACAR_PROCESSOS) ou lendo as reservas do período em fluxo, por esta ordem
+def calcular_estatisticas_periodo(vehicles: List[Vehicle], ini: datetime, fim: datetime) -> Dict:
+    resultado = calcular_estatisticas_resumos(vehicles, ini, fim)
+    if resultado is None and PROCESSOS > 1:
+        resultado = calcular_estatisticas_paralelo(vehicles, ini, fim, PROCESSOS)
+    if resultado is None:
+        resultado = calcular_estatisticas(
+            bookings_store.iterar_reservas(ini.toordinal(), fim.toordinal()), vehicles, ini, fim
+        )
+    return resultado
+
+
+## Calcula e mostra estatísticas globais, por classe e por viatura
+## (o histórico é lido em fluxo: a memória não cresce com o nº de reservas)
+@instrumentacao.medir("estatisticas")
+def estatisticas() -> None:
+    if not bookings_store.existem_reservas():
+        print("Não existem reservas.")
+        return
+
+    print("\n------ Estatísticas ------")
+    print("Indique o intervalo de datas para análise.")
+    ini = input_data("Data início (YYYY-MM-DD): ")
+    fim = input_data("Data fim (YYYY-MM-DD): ")
+
+    if fim <= ini:
+        print("Data fim deve ser posterior à data início.")
+        return
+
+    vehicles = load_vehicles()
+    classes = load_classes()
+    periodo_dias = (fim - ini).days
+
+    ## Mapas auxiliares
+    mapa_viaturas = {v.matricula: v for v in vehicles}
+
+    resultado = calcular_estatisticas_periodo(vehicles, ini, fim)
+    total_faturado = resultado["total_faturado"]
+    num_reservas = resultado["num_reservas"]
+    dias_alugados_total = resultado["dias_alugados_total"]
+    por_classe = resultado["por_classe"]
+    por_viatura = resultado["por_viatura"]
+
     if num_reservas == 0:
         print("Não existem reservas no intervalo indicado.")
         return
@@ -596,7 +824,7 @@ def estatisticas() -> None:
     print("\n--- Por classe ---")
     for id_classe, dados in por_classe.items():
         nome = next(
-            (c.get("nome") for c in classes if str(c.get("id")) == str(id_classe)),
+            (c.nome for c in classes if c.chave == str(id_classe)),
             f"Classe {id_classe}",
         )
         dias = dados["dias"]
@@ -609,14 +837,96 @@ def estatisticas() -> None:
     ## Estatísticas por viatura
     print("\n--- Por viatura (matrícula) ---")
     for mat, dados in por_viatura.items():
-        info = mapa_viaturas.get(mat, {})
+        info = mapa_viaturas.get(mat)
+        marca = info.marca if info else ""
+        modelo = info.modelo if info else ""
         print(
-            f"{mat} ({info.get('marca','')} {info.get('modelo','')}): "
+            f"{mat} ({marca} {modelo}): "
             f"reservas {dados['reservas']} | dias alugados {dados['dias']} | "
             f"total faturado {dados['total']}€ | "
+            f"ocupação {dados['dias'] / periodo_dias * 100:.1f}%"
         )
 
 
+## ---------- OCUPAÇÃO DA FROTA ----------
+
+## Taxa de ocupação por viatura e por classe, maiores paragens, pico de viaturas alugadas
+## em simultâneo e viaturas paradas o período todo (ocupacao)
+@instrumentacao.medir("ocupacao_frota")
+def ocupacao_frota() -> None:
+    vehicles = load_vehicles()
+    if not vehicles:
+        print("Não existem viaturas.")
+        return
+
+    print("\n------ Ocupação da Frota ------")
+    print("Indique o intervalo de datas para análise.")
+    ini = input_data("Data início (YYYY-MM-DD): ")
+    fim = input_data("Data fim (YYYY-MM-DD): ")
+
+    if fim <= ini:
+        print("Data fim deve ser posterior à data início.")
+        return
+
+    ini, fim = ini.toordinal(), fim.toordinal()
+    resultado = ocupacao.ocupacao(bookings_store.iterar_reservas(ini, fim), vehicles, ini, fim)
+    classes = load_classes()
+
+    def data(dia: int) -> str:
+        return datetime.fromordinal(dia).strftime(DATE_FMT)
+
+    print("\n--- Global ---")
+    print(f"Dias no período: {resultado['dias']}")
+    print(f"Taxa de ocupação: {resultado['taxa'] * 100:.1f}%")
+    pico = resultado["pico"]
+    if pico["dia"] is not None:
+        print(f"Pico: {pico['viaturas']} viaturas alugadas em {data(pico['dia'])}")
+
+    print("\n--- Por classe ---")
+    for id_classe, dados in resultado["por_classe"].items():
+        nome = next(
+            (c.nome for c in classes if c.chave == str(id_classe)),
+            f"Classe {id_classe}",
+        )
+        print(
+            f"{nome}: {dados['viaturas']} viaturas | dias ocupados {dados['dias_ocupados']} | "
+            f"ocupação {dados['taxa'] * 100:.1f}%"
+        )
+
+    print("\n--- Por viatura (matrícula) ---")
+    for v in vehicles:
+        dados = resultado["por_viatura"][v.matricula]
+        paragem = ""
+        if dados["inicio_paragem"] is not None:
+            paragem = f" | maior paragem {dados['maior_paragem']} dias desde {data(dados['inicio_paragem'])}"
+        print(
+            f"{v.matricula} ({v.marca} {v.modelo}): ocupação {dados['taxa'] * 100:.1f}% "
+            f"({dados['dias_ocupados']} dias){paragem}"
+        )
+
+    print("\n--- Viaturas paradas todo o período ---")
+    if resultado["paradas"]:
+        for mat in resultado["paradas"]:
+            print(mat)
+    else:
+        print("Nenhuma.")
+
+
+## ---------- INSTRUMENTAÇÃO ----------
+
+## Mostra o que foi medido até agora (com a instrumentação desligada, permite ligá-la)
+def relatorio_desempenho() -> None:
+    if not instrumentacao.ativo():
+        print("Instrumentação desligada (RENTACAR_PROFILE=1 ou --profile).")
+        if input("Ligar agora? (s/N): ").strip().lower() == "s":
+            instrumentacao.ativar()
+            print("Instrumentação ligada.")
+        return
+    instrumentacao.mostrar_relatorio()
+    if input("Limpar as medições? (s/N): ").strip().lower() == "s":
+        instrumentacao.limpar()
+
+
 ## ---------- MENU PRINCIPAL DO ADMINISTRADOR ----------
 
 ## Mostra o menu do administrador
@@ -628,7 +938,10 @@ def menu_admin(current_user=None):
         print("3. Gestão de frota")
         print("4. Extrato diário")
         print("5. Estatísticas")
-        print("6. Sair")
+        print("6. Importar reservas (CSV/JSONL)")
+        print("7. Relatório de desempenho")
+        print("8. Ocupação da frota")
+        print("9. Sair")
         escolha = input("Escolha uma opção: ").strip()
 
         if escolha == "1":
@@ -642,6 +955,12 @@ def menu_admin(current_user=None):
         elif escolha == "5":
             estatisticas()
         elif escolha == "6":
+            importar_reservas.menu_importar()
+        elif escolha == "7":
+            relatorio_desempenho()
+        elif escolha == "8":
+            ocupacao_frota()
+        elif escolha == "9":
             print("A sair do menu de administrador...")
             break
         else:
@@ -0,0 +1 @@
+## Benchmarks: gerador de dados sintéticos e medição dos caminhos críticos
@@ -0,0 +1,197 @@
+## Benchmarks dos caminhos críticos (reservas e relatórios), sem interação
+## Uso: python -m benchmarks.executar [--veiculos N] [--reservas M] [--utilizadores U]
+##                                    [--seed S] [--repeticoes R] [--processos P] [--saida resultados.json]
+## Os dados são gerados numa pasta temporária; o resultado é JSON para comparar entre execuções.
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+## Os módulos da aplicação são importados já dentro da pasta dos dados gerados
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.gerar_dados import gerar
+
+
+## Corre fn com as respostas dadas ao input() e sem escrever no ecrã
+@contextlib.contextmanager
+def respostas(*valores):
+    it = iter(valores)
+    original = builtins.input
+    builtins.input = lambda mensagem="": next(it)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original
+
+
+## Mede fn(i) para i em range(n); devolve estatísticas em milissegundos
+def medir(fn, n: int) -> dict:
+    tempos = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return {
+        "n": n,
+        "min_ms": round(min(tempos), 4),
+        "mediana_ms": round(statistics.median(tempos), 4),
+        "media_ms": round(statistics.fmean(tempos), 4),
+        "max_ms": round(max(tempos), 4),
+        "total_ms": round(sum(tempos), 4),
+    }
+
+
+def executar(veiculos: int, reservas: int, utilizadores: int, seed: int, repeticoes: int, processos: int = 1) -> dict:
+    pasta = tempfile.mkdtemp(prefix="rentacar-bench-")
+    origem = os.getcwd()
+    try:
+        meta = gerar(pasta, veiculos, reservas, utilizadores, seed)
+        os.chdir(pasta)
+        ## Importar depois de mudar de pasta (os caminhos data/... são relativos)
+        import admin_menu
+        import bookings_store
+        import client_menu
+        import main
+
+        admin_menu.PROCESSOS = processos
+        ## Os dados gerados estão no formato antigo (um só ficheiro): passar a partições mensais
+        bookings_store.compactar()
+        rnd = random.Random(seed)
+        resultados = {}
+        carros = client_menu.load_vehicles()
+        classes = client_menu.load_classes()
+        defs = client_menu.load_definitions()
+        ativos = [c.matricula for c in carros if c.estado == "ativo"]
+        primeira = date.fromisoformat(meta["primeira_data"]) if meta["primeira_data"] else date(2020, 1, 1)
+        ultima = date.fromisoformat(meta["ultima_data"]) if meta["ultima_data"] else date(2021, 1, 1)
+        span = max((ultima - primeira).days, 1)
+
+        def dia_aleatorio() -> date:
+            return primeira + timedelta(days=rnd.randint(0, span))
+
+        ## Abrir o histórico e construir o índice (arranque da sessão de cliente)
+        estado = {}
+        indice = {}
+
+        def abrir(_):
+            estado.update(bookings_store.abrir())
+            indice.clear()
+            indice.update(client_menu.construir_indice(estado["reservas"]))
+        resultados["abrir_sessao_cliente"] = medir(abrir, max(1, repeticoes // 10))
+
+        ## esta_disponivel: consultas aleatórias sobre o índice
+        consultas = []
+        for _ in range(repeticoes * 10):
+            ini = dia_aleatorio()
+            consultas.append((rnd.choice(ativos), ini.isoformat(), (ini + timedelta(days=rnd.randint(1, 7))).isoformat()))
+        resultados["esta_disponivel"] = medir(
+            lambda i: client_menu.esta_disponivel(*consultas[i], indice), len(consultas)
+        )
+
+        ## reservar_viatura de ponta a ponta (inclui a gravação), em datas futuras livres
+        futuro = ultima + timedelta(days=30)
+
+        def reservar(i):
+            ini = futuro + timedelta(days=3 * i)
+            with respostas(ativos[i % len(ativos)], ini.isoformat(), (ini + timedelta(days=2)).isoformat()):
+                client_menu.reservar_viatura({"email": "bench@exemplo.pt"}, carros, classes, defs, estado, indice)
+        resultados["reservar_viatura"] = medir(reservar, repeticoes)
+
+        ## main.login: cliente existente e administrador com password
+        emails = [f"cliente{rnd.randrange(max(utilizadores, 1))}@exemplo.pt" for _ in range(repeticoes)]
+
+        def login_cliente(i):
+            with respostas(emails[i]):
+                main.login()
+        resultados["login_cliente"] = medir(login_cliente, repeticoes)
+
+        def login_admin(_):
+            with respostas("rentacar@staff.pt", "portugal"):
+                main.login()
+        resultados["login_admin"] = medir(login_admin, repeticoes)
+
+        ## extrato_diario em datas aleatórias (percorre o histórico em fluxo)
+        datas = [dia_aleatorio().isoformat() for _ in range(repeticoes)]
+
+        def extrato(i):
+            with respostas(datas[i]):
+                admin_menu.extrato_diario()
+        resultados["extrato_diario"] = medir(extrato, repeticoes)
+
+        ## estatisticas num intervalo de ~3 meses e em todo o histórico
+        intervalos = []
+        for _ in range(repeticoes):
+            ini = dia_aleatorio()
+            intervalos.append((ini.isoformat(), (ini + timedelta(days=90)).isoformat()))
+
+        def estatisticas_trimestre(i):
+            with respostas(*intervalos[i]):
+                admin_menu.estatisticas()
+        resultados["estatisticas_trimestre"] = medir(estatisticas_trimestre, repeticoes)
+
+        tudo = (primeira.isoformat(), (ultima + timedelta(days=1)).isoformat())
+
+        def estatisticas_tudo(_):
+            with respostas(*tudo):
+                admin_menu.estatisticas()
+        resultados["estatisticas_tudo"] = medir(estatisticas_tudo, max(1, repeticoes // 5))
+
+        try:
+            import numpy
+            versao_numpy = numpy.__version__
+        except ImportError:
+            versao_numpy = None
+        import utils
+        return {
+            "meta": {
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "numpy": versao_numpy,
+                "backend": utils.BACKEND,
+                "repeticoes": repeticoes,
+                "processos": processos,
+                **meta,
+            },
+            "resultados": resultados,
+        }
+    finally:
+        os.chdir(origem)
+        ## Compactações ainda em curso escrevem na pasta: esperar por elas antes de a apagar
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks das reservas e relatórios")
+    parser.add_argument("--veiculos", type=int, default=200)
+    parser.add_argument("--reservas", type=int, default=20000)
+    parser.add_argument("--utilizadores", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--processos", type=int, default=1, help="processos nas estatísticas")
+    parser.add_argument("--saida", help="ficheiro JSON de saída (por omissão, o ecrã)")
+    args = parser.parse_args()
+
+    relatorio = executar(args.veiculos, args.reservas, args.utilizadores, args.seed, args.repeticoes, args.processos)
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        sys.stdout.write(texto + "\n")
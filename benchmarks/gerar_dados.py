@@ -0,0 +1,98 @@
+## Gerador de dados sintéticos (com semente) para os benchmarks
+## Uso: python -m benchmarks.gerar_dados PASTA [--veiculos N] [--reservas M] [--utilizadores U] [--seed S]
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+from client_menu import calcular_preco
+
+DEFINICOES = {
+    "max_dias_reserva": 15,
+    "descontos": {"ate_3_dias": 0, "de_4_a_7_dias": 5, "mais_de_7_dias": 15},
+}
+CLASSES = [
+    ("Económico", 30), ("Compactos", 50), ("Familiares", 70), ("Carrinhas", 90),
+    ("Premium", 120), ("Exóticos", 200),
+]
+MARCAS = [("Toyota", "Yaris"), ("Fiat", "500"), ("Renault", "Clio"), ("Ford", "Focus"),
+          ("Mercedes", "CLA"), ("BMW", "Série 3"), ("Porsche", "911"), ("Ferrari", "488")]
+ADMIN = {"email": "rentacar@staff.pt", "tipo": "admin", "senha": "portugal"}
+INICIO = date(2020, 1, 1)
+
+
+def _gravar(pasta: str, nome: str, data) -> None:
+    with open(os.path.join(pasta, "data", nome), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+## Escreve pasta/data/*.json: N viaturas pelas classes, M reservas sem sobreposições, U clientes
+def gerar(pasta: str, veiculos: int = 200, reservas: int = 20000, utilizadores: int = 2000, seed: int = 42) -> dict:
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(pasta, "data"), exist_ok=True)
+
+    classes = [
+        {"id": i, "nome": nome, "descrição": f"Classe {nome}", "preco_diario": preco}
+        for i, (nome, preco) in enumerate(CLASSES, 1)
+    ]
+    frota = []
+    for i in range(veiculos):
+        marca, modelo = rnd.choice(MARCAS)
+        frota.append({
+            "matricula": f"{i // 10000 % 100:02d}-{i // 100 % 100:02d}-{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}",
+            "marca": marca,
+            "modelo": modelo,
+            "id_classe": rnd.randint(1, len(classes)),
+            "estado": "ativo" if rnd.random() < 0.95 else "inativo",
+        })
+    users = [ADMIN] + [{"email": f"cliente{i}@exemplo.pt", "tipo": "cliente"} for i in range(utilizadores)]
+
+    ## Reservas: cada viatura tem uma linha temporal com intervalos e pausas aleatórias
+    preco_classe = {c["id"]: c["preco_diario"] for c in classes}
+    proximo = {v["matricula"]: INICIO + timedelta(days=rnd.randint(0, 30)) for v in frota}
+    bookings = []
+    for _ in range(reservas):
+        v = rnd.choice(frota)
+        ini = proximo[v["matricula"]] + timedelta(days=rnd.randint(0, 10))
+        dias = rnd.randint(1, DEFINICOES["max_dias_reserva"])
+        fim = ini + timedelta(days=dias)
+        proximo[v["matricula"]] = fim
+        preco_diario = float(preco_classe[v["id_classe"]])
+        desconto, total = calcular_preco(dias, preco_diario, DEFINICOES)
+        bookings.append({
+            "email": rnd.choice(users[1:])["email"] if utilizadores else ADMIN["email"],
+            "matricula": v["matricula"],
+            "data_inicio": ini.isoformat(),
+            "data_fim": fim.isoformat(),
+            "dias": dias,
+            "preco_diario": preco_diario,
+            "desconto": desconto,
+            "total": total,
+        })
+    bookings.sort(key=lambda b: b["data_inicio"])
+
+    _gravar(pasta, "settings.json", [DEFINICOES])
+    _gravar(pasta, "classes.json", classes)
+    _gravar(pasta, "vehicles.json", frota)
+    _gravar(pasta, "users.json", users)
+    _gravar(pasta, "bookings.json", bookings)
+    return {
+        "veiculos": veiculos,
+        "reservas": reservas,
+        "utilizadores": utilizadores,
+        "seed": seed,
+        "primeira_data": bookings[0]["data_inicio"] if bookings else None,
+        "ultima_data": max(b["data_fim"] for b in bookings) if bookings else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera data/*.json sintéticos")
+    parser.add_argument("pasta")
+    parser.add_argument("--veiculos", type=int, default=200)
+    parser.add_argument("--reservas", type=int, default=20000)
+    parser.add_argument("--utilizadores", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(gerar(args.pasta, args.veiculos, args.reservas, args.utilizadores, args.seed), indent=2))
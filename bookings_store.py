@@ -0,0 +1,1043 @@
+import heapq
+import json
+import os
+import threading
+import zlib
+from bisect import insort
+from datetime import date
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+import instrumentacao
+import resumos
+import storage_sqlite
+import utils
+from utils import read_json, bloquear, escrever_temporario, assinatura_ficheiro
+from modelos import Booking, ordinal
+
+## FICHEIROS DO HISTÓRICO DE RESERVAS
+## snapshot em partições mensais (pelo mês de data_inicio, cada uma ordenada) com um manifesto,
+## + journal append-only com as reservas novas
+PARTICOES_DIR = "data/bookings"
+MANIFEST_FILE = "data/bookings/manifest.json"
+## resumos mensais de cada partição para as estatísticas (ver resumos.py): {mês da partição: resumo}
+RESUMOS_FILE = "data/bookings/resumos.json"
+## snapshot num só ficheiro (formato antigo: é lido e passa a partições na compactação seguinte)
+BOOKINGS_FILE = "data/bookings.json"
+JOURNAL_FILE = "data/bookings.jsonl"
+## journal "congelado" enquanto está a ser compactado para o snapshot
+COMPACTING_FILE = "data/bookings.jsonl.compactar"
+## partição das reservas sem data_inicio válida
+SEM_DATA = "sem_data"
+
+## índice por email de todo o histórico, repartido pelo hash do email (ver historico_cliente)
+EMAILS_DIR = "data/bookings/emails"
+FRAGMENTOS_EMAIL = 256
+
+## Tamanho do journal (bytes) a partir do qual se compacta em segundo plano
+LIMITE_JOURNAL = 256 * 1024
+## Caracteres lidos de cada vez do snapshot ao percorrê-lo sem o carregar
+TAMANHO_BLOCO = 64 * 1024
+
+## Bloqueios: BOOKINGS_FILE protege o histórico (leitores partilhado, escritores exclusivo);
+## COMPACTING_FILE garante uma só compactação de cada vez entre sessões
+_compactacao = threading.Lock()
+
+
+## Chave de ordenação do histórico (dicionários lidos e registos em memória)
+def _ordem(b: Dict) -> str:
+    return b.get("data_inicio", "")
+
+
+def _ordem_registo(b: Booking) -> str:
+    return b.data_inicio or ""
+
+
+## Identifica uma reserva (uma viatura não tem duas reservas no mesmo intervalo)
+def _chave(b: Dict) -> tuple:
+    return b.get("matricula"), b.get("data_inicio"), b.get("data_fim")
+
+
+## Lê um journal JSONL a partir de um offset; devolve (registos, offset final)
+## Uma última linha incompleta (escrita interrompida) é ignorada
+@instrumentacao.medir("ler_journal")
+def _ler_journal(filename: str, offset: int = 0) -> tuple:
+    registos = []
+    if not os.path.exists(filename):
+        return registos, 0
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        inicio = offset
+        for linha in f:
+            if not linha.endswith(b"\n"):
+                break
+            offset += len(linha)
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registos.append(json.loads(linha))
+            except ValueError:
+                continue
+    instrumentacao.transferidos("ler_journal", lidos=offset - inicio)
+    return registos, offset
+
+
+## Acrescenta as linhas ao journal com uma só escrita (e fsync); devolve o tamanho final
+## Uma linha incompleta de uma escrita interrompida (depois de offset) sai antes de acrescentar
+## (senão a primeira linha nova ficava colada a ela e perdia-se)
+@instrumentacao.medir("acrescentar_journal")
+def _acrescentar_journal(filename: str, offset: int, dados: bytes) -> int:
+    with open(filename, "ab") as f:
+        if f.tell() > offset:
+            f.truncate(offset)
+        f.write(dados)
+        f.flush()
+        os.fsync(f.fileno())
+        tamanho = f.tell()
+    instrumentacao.transferidos("acrescentar_journal", escritos=len(dados))
+    return tamanho
+
+
+## ---------- PARTIÇÕES ----------
+
+## Partição de uma reserva: "YYYY-MM" de data_inicio (SEM_DATA se a data não é válida)
+def _mes(b: Dict) -> str:
+    inicio = ordinal(b.get("data_inicio"))
+    if inicio is None:
+        return SEM_DATA
+    return resumos.mes_de(inicio)
+
+
+## Ordem das partições (SEM_DATA primeiro, como "" no histórico)
+def _ordem_mes(mes: str) -> tuple:
+    return mes != SEM_DATA, mes
+
+
+def _ficheiro_particao(mes: str) -> str:
+    return os.path.join(PARTICOES_DIR, mes + ".json")
+
+
+## Manifesto: {"particoes": [{"mes", "reservas", "primeiro_inicio", "ultimo_fim"}, ...]}
+## por ordem de mês; None enquanto o histórico está no formato antigo
+def _ler_manifesto() -> Optional[Dict]:
+    manifesto = read_json(MANIFEST_FILE) if os.path.exists(MANIFEST_FILE) else None
+    return manifesto if isinstance(manifesto, dict) else None
+
+
+## Entrada do manifesto de uma partição (registos não vazios)
+def _entrada(mes: str, registos: List[Dict]) -> Dict:
+    inicios = [o for o in (ordinal(b.get("data_inicio")) for b in registos) if o is not None]
+    fins = [o for o in (ordinal(b.get("data_fim")) for b in registos) if o is not None]
+    return {
+        "mes": mes,
+        "reservas": len(registos),
+        "primeiro_inicio": date.fromordinal(min(inicios)).isoformat() if inicios else None,
+        "ultimo_fim": date.fromordinal(max(fins)).isoformat() if fins else None,
+    }
+
+
+## Partições que podem ter reservas a intersetar [ini, fim) (ordinais; None = sem limite)
+## Uma reserva que atravessa meses fica na partição do início: conta pelo ultimo_fim da partição
+def _particoes(manifesto: Dict, ini: Optional[int] = None, fim: Optional[int] = None) -> List[Dict]:
+    if ini is None and fim is None:
+        return list(manifesto.get("particoes", []))
+    escolhidas = []
+    for p in manifesto.get("particoes", []):
+        ## Sem datas válidas não interseta nenhum período
+        primeiro = ordinal(p.get("primeiro_inicio"))
+        ultimo = ordinal(p.get("ultimo_fim"))
+        if primeiro is None or ultimo is None:
+            continue
+        if (fim is None or primeiro < fim) and (ini is None or ultimo > ini):
+            escolhidas.append(p)
+    return escolhidas
+
+
+## Ficheiros do snapshot a ler para [ini, fim): [(mês, ficheiro)] por ordem
+## (no formato antigo é sempre o ficheiro completo, com mês None)
+def _fontes(ini: Optional[int] = None, fim: Optional[int] = None) -> List[Tuple[Optional[str], str]]:
+    manifesto = _ler_manifesto()
+    if manifesto is None:
+        return [(None, BOOKINGS_FILE)] if os.path.exists(BOOKINGS_FILE) else []
+    return [(p["mes"], _ficheiro_particao(p["mes"])) for p in _particoes(manifesto, ini, fim)]
+
+
+## Lista guardada num ficheiro do snapshot ([] se não existe)
+@instrumentacao.medir("ler_lista")
+def _ler_lista(filename: str) -> List[Dict]:
+    data = read_json(filename)
+    return data if isinstance(data, list) else []
+
+
+## Lê as fontes do snapshot mais o journal em compactação (sem reservas repetidas)
+## As chaves das pendentes que ficam guardam-se em estado["pendentes"] (para partições lidas depois)
+def _ler_snapshot(fontes: List[Tuple[Optional[str], str]], estado: Optional[Dict] = None) -> List[Dict]:
+    snapshot = []
+    for _, filename in fontes:
+        snapshot.extend(_ler_lista(filename))
+
+    pendentes, _ = _ler_journal(COMPACTING_FILE)
+    ## Se a compactação foi interrompida depois de gravar o snapshot,
+    ## as reservas pendentes já lá estão
+    if pendentes:
+        existentes = {_chave(b) for b in snapshot}
+        pendentes = [b for b in pendentes if _chave(b) not in existentes]
+        pendentes.sort(key=_ordem)
+    if estado is not None:
+        estado["pendentes"] = {_chave(b) for b in pendentes}
+    if not pendentes:
+        return snapshot
+    return list(heapq.merge(snapshot, pendentes, key=_ordem))
+
+
+## Grava uma partição num ficheiro temporário; devolve o caminho
+def _escrever_particao(mes: str, registos: List[Dict]) -> str:
+    os.makedirs(PARTICOES_DIR, exist_ok=True)
+    return escrever_temporario(_ficheiro_particao(mes), json.dumps(registos, ensure_ascii=False, indent=2))
+
+
+## Grava o manifesto num ficheiro temporário; devolve o caminho
+def _escrever_manifesto(entradas: Dict[str, Dict]) -> str:
+    os.makedirs(PARTICOES_DIR, exist_ok=True)
+    manifesto = {"particoes": [entradas[mes] for mes in sorted(entradas, key=_ordem_mes)]}
+    return escrever_temporario(MANIFEST_FILE, json.dumps(manifesto, ensure_ascii=False, indent=2))
+
+
+## Resumos guardados por partição ({} se ainda não existem)
+def _ler_resumos_guardados() -> Dict[str, Dict]:
+    guardados = read_json(RESUMOS_FILE) if os.path.exists(RESUMOS_FILE) else None
+    return guardados if isinstance(guardados, dict) else {}
+
+
+## Grava os resumos por partição num ficheiro temporário; devolve o caminho
+def _escrever_resumos(por_particao: Dict[str, Dict]) -> str:
+    os.makedirs(PARTICOES_DIR, exist_ok=True)
+    return escrever_temporario(RESUMOS_FILE, json.dumps(por_particao, ensure_ascii=False, sort_keys=True))
+
+
+## Instala partições, resumos e manifesto já escritos (chamar com o bloqueio exclusivo do histórico):
+## primeiro as partições, depois o manifesto, por fim remove o formato antigo e os ficheiros dados
+## (com os snapshots binários). Devolve a assinatura de cada partição instalada
+def _instalar(temporarios: Dict[str, str], resumos_tmp: str, manifesto_tmp: str, remover: List[str]) -> Dict[str, tuple]:
+    assinaturas = {}
+    for mes, tmp in temporarios.items():
+        os.replace(tmp, _ficheiro_particao(mes))
+        assinaturas[mes] = assinatura_ficheiro(_ficheiro_particao(mes))
+    os.replace(resumos_tmp, RESUMOS_FILE)
+    os.replace(manifesto_tmp, MANIFEST_FILE)
+    for filename in remover:
+        emails = _ficheiro_emails(filename)
+        for caminho in (filename, utils.ficheiro_snapshot(filename), emails, utils.ficheiro_snapshot(emails)):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    return assinaturas
+
+
+## Snapshots binários e índices por email das partições acabadas de instalar (fora do bloqueio:
+## cada um leva a assinatura da partição tirada na instalação, por isso um atrasado nunca é usado)
+def _gravar_snapshots(por_mes: Dict[str, List[Dict]], assinaturas: Dict[str, tuple]) -> None:
+    for mes, assinatura in assinaturas.items():
+        utils.gravar_snapshot(_ficheiro_particao(mes), por_mes[mes], assinatura)
+        _indexar_emails(mes, por_mes[mes], assinatura)
+
+
+## Descarta ficheiros temporários de uma escrita abandonada
+def _descartar(temporarios: List[Optional[str]]) -> None:
+    for tmp in temporarios:
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+## ---------- ÍNDICE POR EMAIL ----------
+
+## Cada partição tem ao lado o seu índice por email (YYYY-MM.emails.json):
+## {"assinatura": assinatura da partição, "emails": {email: [[data_inicio, data_fim, matricula,
+## posição, tamanho], ...]}} com a posição e o tamanho (bytes) de cada reserva no ficheiro.
+## Tal como os snapshots binários é só uma cache: é gravado a cada escrita da partição
+## e refeito quando não corresponde à partição atual
+def _ficheiro_emails(filename: str) -> str:
+    return os.path.splitext(filename)[0] + ".emails.json"
+
+
+## (posição, tamanho) de cada reserva de uma partição gravada por _escrever_particao
+## (json.dumps com indent=2: cada reserva começa numa linha "  {" e acaba numa "  }")
+## None se o ficheiro não é uma lista
+def _posicoes(conteudo: bytes) -> Optional[List[Tuple[int, int]]]:
+    if not conteudo.startswith(b"["):
+        return None
+    posicoes = []
+    pos, inicio = 0, None
+    for linha in conteudo.splitlines(keepends=True):
+        texto = linha.rstrip(b"\r\n")
+        if texto == b"  {":
+            inicio = pos
+        elif inicio is not None and texto in (b"  }", b"  },"):
+            posicoes.append((inicio, pos + 3 - inicio))
+            inicio = None
+        pos += len(linha)
+    return posicoes
+
+
+## Constrói e grava o índice por email da partição a partir do ficheiro. registos são os da
+## partição pela ordem do ficheiro (senão cada reserva é lida da sua posição) e reservas o nº
+## esperado. None se a partição não existe, mudou (não tem a assinatura dada) ou as posições
+## não batem certo com as reservas
+@instrumentacao.medir("indexar_emails")
+def _indexar_emails(mes: str, registos: Optional[List[Dict]] = None, assinatura: Optional[tuple] = None,
+                    reservas: Optional[int] = None) -> Optional[Dict]:
+    filename = _ficheiro_particao(mes)
+    try:
+        with open(filename, "rb") as f:
+            st = os.fstat(f.fileno())
+            atual = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if assinatura is not None and tuple(assinatura) != atual:
+                return None
+            conteudo = f.read()
+    except FileNotFoundError:
+        return None
+    instrumentacao.transferidos("indexar_emails", lidos=len(conteudo))
+    posicoes = _posicoes(conteudo)
+    if registos is not None:
+        reservas = len(registos)
+    if posicoes is None or (reservas is not None and len(posicoes) != reservas):
+        return None
+
+    emails = {}
+    for i, (posicao, tamanho) in enumerate(posicoes):
+        if registos is not None:
+            b = registos[i]
+        else:
+            try:
+                b = json.loads(conteudo[posicao:posicao + tamanho])
+            except ValueError:
+                return None
+        if not isinstance(b, dict):
+            return None
+        email = b.get("email")
+        if isinstance(email, str):
+            emails.setdefault(email, []).append(
+                [b.get("data_inicio"), b.get("data_fim"), b.get("matricula"), posicao, tamanho]
+            )
+    indice = {"assinatura": list(atual), "emails": emails}
+    try:
+        utils.escrever_atomico(_ficheiro_emails(filename), json.dumps(indice, ensure_ascii=False))
+    except OSError:
+        pass
+    return indice
+
+
+## Índice por email atual de uma entrada do manifesto (o guardado, ou refeito se está velho)
+@instrumentacao.medir("emails_particao")
+def _emails_particao(p: Dict) -> Optional[Dict]:
+    filename = _ficheiro_particao(p["mes"])
+    indice_file = _ficheiro_emails(filename)
+    if os.path.exists(indice_file):
+        indice = read_json(indice_file)
+        if isinstance(indice, dict) and tuple(indice.get("assinatura") or ()) == assinatura_ficheiro(filename):
+            return indice
+    return _indexar_emails(p["mes"], reservas=p.get("reservas"))
+
+
+## Fragmentos do índice global por email: FRAGMENTOS_EMAIL ficheiros (data/bookings/emails/xx.json),
+## cada um com os emails que lhe calham pelo hash:
+## {"particoes": {mês: assinatura da partição indexada}, "sem_indice": [meses a ler por inteiro],
+##  "emails": {email: [[mês, data_inicio, data_fim, matricula, posição, tamanho], ...]}}
+## Uma página lê e grava só o fragmento do cliente: é posto em dia quando é lido, a partir do índice
+## das partições que mudaram desde então (ou de todas, se ainda não existe). Os outros fragmentos
+## ficam como estão até serem lidos (a assinatura das partições diz se estão desatualizados)
+def _fragmento(email: str) -> int:
+    return zlib.crc32(email.encode("utf-8")) % FRAGMENTOS_EMAIL
+
+
+def _ficheiro_fragmento(k: int) -> str:
+    return os.path.join(EMAILS_DIR, f"{k:02x}.json")
+
+
+@instrumentacao.medir("ler_fragmento")
+def _ler_fragmento(k: int) -> Optional[Dict]:
+    filename = _ficheiro_fragmento(k)
+    fragmento = read_json(filename) if os.path.exists(filename) else None
+    return fragmento if isinstance(fragmento, dict) and "particoes" in fragmento else None
+
+
+## Fragmento k em dia com as partições do manifesto (chamar com o bloqueio do histórico)
+def _fragmento_atual(manifesto: Dict, k: int) -> Dict:
+    particoes = {p["mes"]: p for p in manifesto.get("particoes", [])}
+    assinaturas = {mes: assinatura_ficheiro(_ficheiro_particao(mes)) for mes in particoes}
+
+    fragmento = _ler_fragmento(k) or {"particoes": {}, "sem_indice": [], "emails": {}}
+    guardadas = fragmento["particoes"]
+    tocadas = {mes for mes in particoes if tuple(guardadas.get(mes) or ()) != assinaturas[mes]} | {
+        mes for mes in guardadas if mes not in particoes
+    }
+    if not tocadas:
+        return fragmento
+    return _atualizar_fragmento(k, fragmento, tocadas, particoes, assinaturas)
+
+
+## Tira do fragmento k as entradas dos meses tocados e junta as das partições atuais desses meses
+## (lidas do índice de cada partição); grava e devolve o fragmento (uma cópia: o lido pode estar
+## na cache de read_json)
+def _atualizar_fragmento(k: int, fragmento: Dict, tocadas: set, particoes: Dict[str, Dict],
+                         assinaturas: Dict[str, tuple]) -> Dict:
+    emails = {}
+    for email, entradas in fragmento["emails"].items():
+        ficam = [e for e in entradas if e[0] not in tocadas]
+        if ficam:
+            emails[email] = ficam
+    novo = {
+        "particoes": {mes: a for mes, a in fragmento["particoes"].items() if mes not in tocadas},
+        "sem_indice": [mes for mes in fragmento["sem_indice"] if mes not in tocadas],
+        "emails": emails,
+    }
+
+    for mes in sorted(tocadas & set(particoes), key=_ordem_mes):
+        indice = _emails_particao(particoes[mes])
+        ## A assinatura guardada é a do índice lido (a partição não muda com o bloqueio)
+        if indice is None:
+            novo["particoes"][mes] = list(assinaturas[mes] or ())
+            novo["sem_indice"].append(mes)
+            continue
+        novo["particoes"][mes] = list(indice["assinatura"])
+        for email, entradas in indice["emails"].items():
+            if _fragmento(email) == k:
+                emails.setdefault(email, []).extend([mes] + e for e in entradas)
+
+    try:
+        os.makedirs(EMAILS_DIR, exist_ok=True)
+        utils.escrever_atomico(_ficheiro_fragmento(k), json.dumps(novo, ensure_ascii=False))
+    except OSError:
+        pass
+    return novo
+
+
+## Lê um array JSON elemento a elemento, em blocos de TAMANHO_BLOCO caracteres
+## (em memória fica só o bloco atual); um ficheiro que não é uma lista não tem elementos
+@instrumentacao.medir_iterador("iterar_array")
+def _iterar_array(f) -> Iterator:
+    descodificar = json.JSONDecoder().raw_decode
+    texto, pos, inicio = "", 0, True
+    while True:
+        while pos < len(texto) and texto[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(texto):
+            if inicio:
+                if texto[pos] != "[":
+                    return
+                inicio = False
+                pos += 1
+                continue
+            if texto[pos] == "]":
+                return
+            try:
+                valor, pos = descodificar(texto, pos)
+            except ValueError:
+                ## Elemento cortado a meio do bloco: ler mais (no fim do ficheiro é JSON inválido)
+                bloco = f.read(TAMANHO_BLOCO)
+                if not bloco:
+                    raise
+                texto, pos = texto[pos:] + bloco, 0
+                continue
+            yield valor
+            continue
+        bloco = f.read(TAMANHO_BLOCO)
+        if not bloco:
+            return
+        texto, pos = bloco, 0
+
+
+## Com o backend sqlite as reservas vivem na tabela "bookings": a versão é a geração
+## da tabela, o offset é o último id lido e o bloqueio é uma transação
+def _sqlite() -> bool:
+    return utils.BACKEND == "sqlite"
+
+
+## Bloqueio do histórico (partilhado para leitura, exclusivo para escrita)
+def _bloqueio(partilhado: bool):
+    if _sqlite():
+        return storage_sqlite.transacao(imediata=not partilhado)
+    return bloquear(BOOKINGS_FILE, partilhado=partilhado)
+
+
+## Versão do histórico: muda sempre que o snapshot é reescrito ou começa uma compactação
+## (o journal só cresce entre versões; a posição lida fica em estado["offset"])
+def _versao() -> tuple:
+    if _sqlite():
+        return storage_sqlite.geracao()
+    return (
+        assinatura_ficheiro(MANIFEST_FILE),
+        assinatura_ficheiro(BOOKINGS_FILE),
+        assinatura_ficheiro(COMPACTING_FILE),
+    )
+
+
+## Lê as partições do período da sessão e o journal (chamar com o bloqueio do histórico)
+def _carregar(estado: Dict) -> None:
+    if _sqlite():
+        reservas, offset = storage_sqlite.ler_reservas()
+        estado["periodo"] = (None, None)
+    else:
+        ini, fim = estado.setdefault("periodo", (None, None))
+        snapshot = _ler_snapshot(_fontes(ini, fim), estado)
+        novas, offset = _ler_journal(JOURNAL_FILE)
+        novas.sort(key=_ordem)
+        reservas = heapq.merge(snapshot, novas, key=_ordem)
+    estado["reservas"][:] = [Booking.from_dict(b) for b in reservas]
+    estado["versao"] = _versao()
+    estado["offset"] = offset
+
+
+## Abre o histórico para uma sessão: {"reservas": [Booking...], "versao", "offset", "periodo"}
+## Com ini/fim (ordinais) só lê as partições que podem intersetar esse período (mais o journal);
+## carregar_periodo acrescenta outras mais tarde
+def abrir(ini: Optional[int] = None, fim: Optional[int] = None) -> Dict:
+    estado = {"reservas": [], "periodo": (ini, fim)}
+    with _bloqueio(partilhado=True):
+        _carregar(estado)
+    ## Histórico ainda no formato antigo (ou partições sem resumos): converter em segundo plano
+    if not _sqlite():
+        if _ler_manifesto() is None:
+            if os.path.exists(BOOKINGS_FILE):
+                compactar_em_segundo_plano()
+        elif not os.path.exists(RESUMOS_FILE):
+            compactar_em_segundo_plano()
+    return estado
+
+
+## Garante em memória as reservas que podem intersetar [ini, fim) (ordinais; None = sem limite)
+## Devolve as reservas acrescentadas, ou None se foi preciso recarregar tudo
+def carregar_periodo(estado: Dict, ini: Optional[int] = None, fim: Optional[int] = None) -> Optional[List[Booking]]:
+    atual_ini, atual_fim = estado["periodo"]
+    if (atual_ini is None or (ini is not None and atual_ini <= ini)) and \
+            (atual_fim is None or (fim is not None and fim <= atual_fim)):
+        return []
+    periodo = (
+        None if ini is None or atual_ini is None else min(ini, atual_ini),
+        None if fim is None or atual_fim is None else max(fim, atual_fim),
+    )
+
+    with _bloqueio(partilhado=True):
+        estado["periodo"] = periodo
+        if _versao() != estado["versao"]:
+            _carregar(estado)
+            return None
+        lidas = {mes for mes, _ in _fontes(atual_ini, atual_fim)}
+        pendentes = estado.get("pendentes", set())
+        novas = [
+            Booking.from_dict(b)
+            for mes, filename in _fontes(*periodo) if mes not in lidas
+            for b in _ler_lista(filename) if _chave(b) not in pendentes
+        ]
+    if novas:
+        _juntar(estado, novas)
+    return novas
+
+
+## Lê o histórico completo: snapshot + journal, ordenado por data_inicio
+def load_bookings() -> List[Booking]:
+    return abrir()["reservas"]
+
+
+## Percorre o histórico reserva a reserva, por ordem de data_inicio, sem o carregar todo:
+## cada partição é lida em blocos e só os journals (limitados por LIMITE_JOURNAL) ficam em memória.
+## Com ini/fim (ordinais) só abre as partições que podem intersetar [ini, fim)
+## (as reservas não são filtradas: quem chama verifica a interseção).
+## O bloqueio partilhado dura apenas a leitura do manifesto e dos journals.
+def iterar_reservas(ini: Optional[int] = None, fim: Optional[int] = None) -> Iterator[Booking]:
+    if _sqlite():
+        for dados in storage_sqlite.iterar_reservas():
+            yield Booking.from_dict(dados)
+        return
+
+    with bloquear(BOOKINGS_FILE, partilhado=True):
+        fontes = _fontes(ini, fim)
+        ## O ficheiro do formato antigo é aberto já (a compactação pode removê-lo)
+        antigo = open(BOOKINGS_FILE, "r", encoding="utf-8") if fontes and fontes[0][0] is None else None
+        pendentes, _ = _ler_journal(COMPACTING_FILE)
+        novas, _ = _ler_journal(JOURNAL_FILE)
+    try:
+        ## Reservas dos journals que já estão no snapshot saem uma só vez: acontece com uma
+        ## compactação interrompida, ou com uma partição reescrita depois de lido o journal.
+        ## No merge o snapshot vem primeiro em empates, por isso a cópia dele já foi vista
+        journal = pendentes + novas
+        chaves_journal = {_chave(b) for b in journal}
+        ids_journal = {id(b) for b in journal}
+        vistas = set()
+
+        def snapshot():
+            for mes, filename in fontes:
+                if mes is None:
+                    f = antigo
+                else:
+                    try:
+                        f = open(filename, "r", encoding="utf-8")
+                    except FileNotFoundError:
+                        continue
+                with f:
+                    for b in _iterar_array(f):
+                        if chaves_journal and _chave(b) in chaves_journal:
+                            vistas.add(_chave(b))
+                        yield b
+                    if instrumentacao.ativo():
+                        instrumentacao.transferidos("iterar_array", lidos=os.fstat(f.fileno()).st_size)
+
+        pendentes.sort(key=_ordem)
+        novas.sort(key=_ordem)
+        for b in heapq.merge(snapshot(), pendentes, novas, key=_ordem):
+            if id(b) in ids_journal and _chave(b) in vistas:
+                continue
+            yield Booking.from_dict(b)
+    finally:
+        if antigo is not None:
+            antigo.close()
+
+
+## Resumos mensais (resumos.resumir) das reservas que podem intersetar [ini, fim), somados:
+## os guardados das partições mais os das reservas do journal (ainda não compactadas).
+## None se não for possível (backend sqlite, formato antigo, partições sem resumo
+## ou compactação em curso)
+def ler_resumos(ini: int, fim: int) -> Optional[Dict]:
+    if _sqlite():
+        return None
+    with bloquear(BOOKINGS_FILE, partilhado=True):
+        manifesto = _ler_manifesto()
+        if manifesto is None or os.path.exists(COMPACTING_FILE):
+            return None
+        guardados = _ler_resumos_guardados()
+        particoes = _particoes(manifesto, ini, fim)
+        novas, _ = _ler_journal(JOURNAL_FILE)
+
+    total = {}
+    for p in particoes:
+        resumo = guardados.get(p["mes"])
+        if resumo is None:
+            return None
+        resumos.juntar(total, resumo)
+    novas.sort(key=_ordem)
+    return resumos.juntar(total, resumos.resumir(novas, 1))
+
+
+## Há pelo menos uma reserva no histórico?
+def existem_reservas() -> bool:
+    reservas = iterar_reservas()
+    try:
+        return next(reservas, None) is not None
+    finally:
+        reservas.close()
+
+
+## Página do histórico de um cliente, da reserva mais recente para a mais antiga (por data_inicio;
+## em empate a gravada depois primeiro): (reservas da página, nº total de reservas do cliente).
+## Com ini/fim (ordinais) só conta as reservas que intersetam [ini, fim).
+## Usa o fragmento do índice global por email onde calha o cliente: do disco só se leem esse
+## fragmento, as reservas da página e os journals
+def historico_cliente(email: str, pagina: int = 1, por_pagina: int = 10,
+                      ini: Optional[int] = None, fim: Optional[int] = None) -> Tuple[List[Booking], int]:
+    if pagina < 1 or por_pagina < 1:
+        raise ValueError("Página inválida.")
+    salto = (pagina - 1) * por_pagina
+    if _sqlite():
+        registos, total = storage_sqlite.historico_cliente(
+            email,
+            None if ini is None else date.fromordinal(ini).isoformat(),
+            None if fim is None else date.fromordinal(fim).isoformat(),
+            por_pagina, salto,
+        )
+        return [Booking.from_dict(b) for b in registos], total
+
+    def no_periodo(data_inicio, data_fim) -> bool:
+        if ini is None and fim is None:
+            return True
+        inicio, final = ordinal(data_inicio), ordinal(data_fim)
+        if inicio is None or final is None:
+            return False
+        return (fim is None or inicio < fim) and (ini is None or final > ini)
+
+    with bloquear(BOOKINGS_FILE, partilhado=True):
+        manifesto = _ler_manifesto()
+        if manifesto is None:
+            ## Formato antigo (sem partições nem índice): percorre o histórico fora do bloqueio
+            encontradas = None
+        else:
+            ## Referências com a chave de ordem do histórico (data_inicio; partições antes dos
+            ## journals; mês e posição): (chave, ficheiro e assinatura, posição, tamanho) das
+            ## partições ou (chave, None, registo) de partições sem índice e dos journals
+            encontradas = []
+            chaves = set()
+            fragmento = _fragmento_atual(manifesto, _fragmento(email))
+            for mes, data_inicio, data_fim, matricula, posicao, tamanho in fragmento["emails"].get(email, ()):
+                if no_periodo(data_inicio, data_fim):
+                    chaves.add((matricula, data_inicio, data_fim))
+                    filename = _ficheiro_particao(mes)
+                    encontradas.append((
+                        (data_inicio or "", 0, _ordem_mes(mes), posicao),
+                        (filename, tuple(fragmento["particoes"][mes])), posicao, tamanho,
+                    ))
+            for mes in fragmento["sem_indice"]:
+                for i, b in enumerate(_ler_lista(_ficheiro_particao(mes))):
+                    if b.get("email") == email and no_periodo(b.get("data_inicio"), b.get("data_fim")):
+                        chaves.add(_chave(b))
+                        encontradas.append(((b.get("data_inicio") or "", 0, _ordem_mes(mes), i), None, b))
+            ## Reservas dos journals que já estão no snapshot saem uma só vez (como em iterar_reservas)
+            pendentes, _ = _ler_journal(COMPACTING_FILE)
+            novas, _ = _ler_journal(JOURNAL_FILE)
+            for origem, journal in ((1, sorted(pendentes, key=_ordem)), (2, sorted(novas, key=_ordem))):
+                for i, b in enumerate(journal):
+                    if (b.get("email") == email and _chave(b) not in chaves
+                            and no_periodo(b.get("data_inicio"), b.get("data_fim"))):
+                        chaves.add(_chave(b))
+                        encontradas.append(((b.get("data_inicio") or "", origem, i), None, b))
+
+            encontradas.sort(key=lambda ref: ref[0], reverse=True)
+            pagina_refs = encontradas[salto:salto + por_pagina]
+            reservas = []
+            abertos = {}
+            try:
+                for ref in pagina_refs:
+                    if ref[1] is None:
+                        reservas.append(ref[2])
+                        continue
+                    (filename, assinatura), posicao, tamanho = ref[1], ref[2], ref[3]
+                    f = abertos.get(filename)
+                    if f is None:
+                        f = abertos[filename] = open(filename, "rb")
+                        st = os.fstat(f.fileno())
+                        if (st.st_ino, st.st_mtime_ns, st.st_size) != assinatura:
+                            raise ValueError(f"Índice por email desatualizado: {filename}")
+                    f.seek(posicao)
+                    reservas.append(json.loads(f.read(tamanho)))
+            finally:
+                for f in abertos.values():
+                    f.close()
+            return [Booking.from_dict(b) for b in reservas], len(encontradas)
+
+    todas = [
+        b for b in iterar_reservas(ini, fim)
+        if b.email == email and no_periodo(b.data_inicio, b.data_fim)
+    ]
+    todas.reverse()
+    todas.sort(key=_ordem_registo, reverse=True)
+    return todas[salto:salto + por_pagina], len(todas)
+
+
+## Traz a sessão para a versão atual do histórico
+## Devolve as reservas novas de outras sessões, ou None se foi preciso recarregar tudo
+## (houve compactação ou reescrita completa entretanto)
+def _sincronizar(estado: Dict) -> Optional[List[Booking]]:
+    if _versao() != estado["versao"]:
+        _carregar(estado)
+        return None
+    if _sqlite():
+        novas, estado["offset"] = storage_sqlite.reservas_desde(estado["offset"])
+    else:
+        novas, estado["offset"] = _ler_journal(JOURNAL_FILE, estado["offset"])
+    novas = [Booking.from_dict(b) for b in novas]
+    for b in novas:
+        insort(estado["reservas"], b, key=_ordem_registo)
+    return novas
+
+
+def sincronizar(estado: Dict) -> Optional[List[Booking]]:
+    with _bloqueio(partilhado=True):
+        return _sincronizar(estado)
+
+
+## Reescreve o histórico completo (todas as partições) e limpa o journal
+def save_bookings(bookings: List[Booking]) -> None:
+    data = [b.to_dict() for b in sorted(bookings, key=_ordem_registo)]
+    if _sqlite():
+        storage_sqlite.gravar_tabela("bookings", data)
+        return
+
+    por_mes = {}
+    for b in data:
+        por_mes.setdefault(_mes(b), []).append(b)
+    temporarios = {}
+    resumos_tmp = None
+    try:
+        for mes, registos in por_mes.items():
+            temporarios[mes] = _escrever_particao(mes, registos)
+        resumos_tmp = _escrever_resumos({mes: resumos.resumir(registos) for mes, registos in por_mes.items()})
+        manifesto_tmp = _escrever_manifesto({mes: _entrada(mes, registos) for mes, registos in por_mes.items()})
+    except BaseException:
+        _descartar(list(temporarios.values()) + [resumos_tmp])
+        raise
+
+    with bloquear(BOOKINGS_FILE):
+        ## Partições que deixam de existir
+        anteriores = _ler_manifesto() or {}
+        remover = [
+            _ficheiro_particao(p["mes"]) for p in anteriores.get("particoes", []) if p["mes"] not in por_mes
+        ]
+        assinaturas = _instalar(
+            temporarios, resumos_tmp, manifesto_tmp, remover + [BOOKINGS_FILE, COMPACTING_FILE, JOURNAL_FILE]
+        )
+    _gravar_snapshots(por_mes, assinaturas)
+
+
+## Junta reservas gravadas por esta sessão ao histórico em memória (ordenado)
+def _juntar(estado: Dict, reservas: List[Booking]) -> None:
+    if len(reservas) == 1:
+        insort(estado["reservas"], reservas[0], key=_ordem_registo)
+        return
+    novas = sorted(reservas, key=_ordem_registo)
+    estado["reservas"][:] = heapq.merge(estado["reservas"], novas, key=_ordem_registo)
+
+
+## Acrescenta reservas ao journal com controlo otimista de concorrência:
+## sob bloqueio exclusivo lê só o que outras sessões acrescentaram desde a última
+## leitura e chama filtrar(novas) para revalidar (novas=None -> histórico recarregado);
+## filtrar devolve as reservas que continuam válidas. Devolve as reservas gravadas.
+## O bloqueio dura apenas a leitura do fim do journal e uma escrita (todas as linhas juntas).
+## Com o backend sqlite é uma transação com os INSERT (mais a verificação no índice).
+def registar_reservas(estado: Dict, reservas: List[Booking],
+                      filtrar: Callable[[Optional[List[Booking]]], List[Booking]] = None) -> List[Booking]:
+    if _sqlite():
+        return _registar_sqlite(estado, reservas, filtrar)
+
+    with bloquear(BOOKINGS_FILE):
+        novas = _sincronizar(estado)
+        if filtrar is not None:
+            reservas = filtrar(novas)
+        if not reservas:
+            return []
+        dados = b"".join(
+            (json.dumps(r.to_dict(), ensure_ascii=False) + "\n").encode("utf-8") for r in reservas
+        )
+        tamanho = _acrescentar_journal(JOURNAL_FILE, estado["offset"], dados)
+        ## A nossa própria escrita não conta como alteração de outra sessão
+        estado["versao"] = _versao()
+        estado["offset"] = tamanho
+        _juntar(estado, reservas)
+
+    if tamanho >= LIMITE_JOURNAL:
+        compactar_em_segundo_plano()
+    return reservas
+
+
+## Uma só reserva; confirmar(novas) diz se continua disponível
+def registar_reserva(estado: Dict, reserva: Booking, confirmar: Callable[[Optional[List[Booking]]], bool] = None) -> bool:
+    filtrar = None
+    if confirmar is not None:
+        filtrar = lambda novas: [reserva] if confirmar(novas) else []
+    return bool(registar_reservas(estado, [reserva], filtrar))
+
+
+def _registar_sqlite(estado: Dict, reservas: List[Booking], filtrar) -> List[Booking]:
+    with storage_sqlite.transacao(imediata=True):
+        novas = _sincronizar(estado)
+        if filtrar is not None:
+            reservas = filtrar(novas)
+        gravadas = []
+        for r in reservas:
+            ## Sem revalidação do chamador, usar o índice (matricula, data_inicio, data_fim)
+            if filtrar is None and storage_sqlite.sobrepoe(r.matricula, r.data_inicio, r.data_fim):
+                continue
+            estado["offset"] = storage_sqlite.inserir_reserva(r.to_dict())
+            gravadas.append(r)
+        if gravadas:
+            _juntar(estado, gravadas)
+    return gravadas
+
+
+## Junta o journal às partições; só as partições dos meses com reservas novas são reescritas
+## (e os respetivos resumos mensais). Um histórico no formato antigo passa todo a partições,
+## e partições sem resumo ganham-no (mesmo sem journal).
+## Devolve False se não havia nada a fazer (com o backend sqlite não há journal para compactar)
+def compactar(minimo: int = 0) -> bool:
+    if _sqlite():
+        return False
+    if not _compactacao.acquire(blocking=False):
+        return False
+    try:
+        return _compactar(minimo)
+    finally:
+        _compactacao.release()
+
+
+## Corpo de compactar (chamar com _compactacao adquirido)
+def _compactar(minimo: int) -> bool:
+    with bloquear(COMPACTING_FILE):
+        ## Congelar o journal atual; novas reservas vão para um journal novo
+        with bloquear(BOOKINGS_FILE):
+            manifesto = _ler_manifesto()
+            guardados = _ler_resumos_guardados() if manifesto is not None else {}
+            migrar = manifesto is None and os.path.exists(BOOKINGS_FILE)
+            sem_resumo = manifesto is not None and any(
+                p["mes"] not in guardados for p in manifesto.get("particoes", [])
+            )
+            if not os.path.exists(COMPACTING_FILE):
+                tamanho = os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+                if tamanho >= max(minimo, 1):
+                    os.replace(JOURNAL_FILE, COMPACTING_FILE)
+                elif not migrar and not sem_resumo:
+                    return False
+            versao = _versao()
+            pendentes, _ = _ler_journal(COMPACTING_FILE)
+
+            if manifesto is None:
+                entradas = {}
+                por_mes = {}
+                for b in _ler_lista(BOOKINGS_FILE):
+                    por_mes.setdefault(_mes(b), []).append(b)
+            else:
+                entradas = {p["mes"]: p for p in manifesto.get("particoes", [])}
+                por_mes = {
+                    mes: _ler_lista(_ficheiro_particao(mes))
+                    for mes in {_mes(b) for b in pendentes} if mes in entradas
+                }
+
+        ## A escrita das partições (parte cara) é feita sem bloquear as reservas
+        novas_por_mes = {}
+        for b in pendentes:
+            novas_por_mes.setdefault(_mes(b), []).append(b)
+        temporarios = {}
+        resumos_tmp = None
+        escritos = {}
+        por_particao = {mes: guardados[mes] for mes in entradas if mes in guardados}
+        try:
+            for mes in set(por_mes) | set(novas_por_mes):
+                existentes = por_mes.get(mes, [])
+                chaves = {_chave(b) for b in existentes}
+                novas = sorted(
+                    (b for b in novas_por_mes.get(mes, []) if _chave(b) not in chaves), key=_ordem
+                )
+                if not novas and manifesto is not None:
+                    continue
+                registos = list(heapq.merge(existentes, novas, key=_ordem))
+                escritos[mes] = registos
+                temporarios[mes] = _escrever_particao(mes, registos)
+                entradas[mes] = _entrada(mes, registos)
+                por_particao[mes] = resumos.resumir(registos)
+            ## Partições anteriores aos resumos
+            for mes in entradas:
+                if mes not in por_particao:
+                    por_particao[mes] = resumos.resumir(_ler_lista(_ficheiro_particao(mes)))
+            resumos_tmp = _escrever_resumos(por_particao)
+            manifesto_tmp = _escrever_manifesto(entradas)
+        except BaseException:
+            _descartar(list(temporarios.values()) + [resumos_tmp])
+            raise
+
+        with bloquear(BOOKINGS_FILE):
+            ## Se o histórico foi reescrito entretanto, descartar esta compactação
+            if _versao() != versao:
+                _descartar(list(temporarios.values()) + [resumos_tmp, manifesto_tmp])
+                return False
+            assinaturas = _instalar(temporarios, resumos_tmp, manifesto_tmp, [BOOKINGS_FILE, COMPACTING_FILE])
+        _gravar_snapshots(escritos, assinaturas)
+        return True
+
+
+## Lança a compactação numa thread para não atrasar a reserva
+## A thread não é daemon: à saída do programa a compactação em curso acaba (morta a meio
+## deixava ficheiros temporários das partições para trás)
+def compactar_em_segundo_plano() -> None:
+    threading.Thread(target=compactar, args=(LIMITE_JOURNAL,)).start()
+
+
+## ---------- ALTERAÇÃO DE RESERVAS GRAVADAS ----------
+
+## Duas reservas da mesma viatura com intervalos [data_inicio, data_fim) sobrepostos
+def _sobrepoem(a: Dict, b: Dict) -> bool:
+    return (
+        a.get("matricula") == b.get("matricula")
+        and (a.get("data_inicio") or "") < (b.get("data_fim") or "")
+        and (b.get("data_inicio") or "") < (a.get("data_fim") or "")
+    )
+
+
+## Altera ou remove reservas já gravadas numa só escrita: alteracoes é {chave da reserva:
+## novo dicionário, ou None para a remover}. As datas não mudam, por isso cada reserva fica na
+## sua partição: só as partições dessas reservas são reescritas (mais resumos e manifesto).
+## O journal é primeiro compactado; a escrita é feita com o histórico bloqueado.
+## ValueError (e nada é gravado) se uma reserva alterada se sobrepõe a outra da mesma viatura.
+## Devolve quantas reservas foram alteradas ou removidas
+def alterar_reservas(alteracoes: Dict[tuple, Optional[Dict]]) -> int:
+    if not alteracoes:
+        return 0
+    for chave, novo in alteracoes.items():
+        if novo is not None and (novo.get("data_inicio"), novo.get("data_fim")) != chave[1:]:
+            raise ValueError("As datas de uma reserva não podem ser alteradas.")
+    if _sqlite():
+        return storage_sqlite.alterar_reservas(alteracoes)
+
+    ## Reservas ainda no journal (ou numa compactação interrompida) passam primeiro às partições
+    ## (esperando por uma compactação em curso); se outra sessão escrever entretanto, tenta de novo
+    with _compactacao:
+        for _ in range(3):
+            _compactar(0)
+            with bloquear(COMPACTING_FILE), bloquear(BOOKINGS_FILE):
+                manifesto = _ler_manifesto()
+                novas, _ = _ler_journal(JOURNAL_FILE)
+                ## Histórico vazio
+                if manifesto is None and not novas and not os.path.exists(BOOKINGS_FILE) \
+                        and not os.path.exists(COMPACTING_FILE):
+                    return 0
+                if manifesto is None or os.path.exists(COMPACTING_FILE) or any(_chave(b) in alteracoes for b in novas):
+                    continue
+                alteradas, escritos, assinaturas = _alterar_particoes(manifesto, alteracoes, novas)
+            _gravar_snapshots(escritos, assinaturas)
+            return alteradas
+    raise ValueError("Não foi possível compactar o histórico para alterar as reservas.")
+
+
+## Parte de alterar_reservas com o histórico bloqueado e o journal já compactado
+## Devolve (reservas alteradas, partições escritas, assinaturas das instaladas)
+def _alterar_particoes(manifesto: Dict, alteracoes: Dict[tuple, Optional[Dict]], journal: List[Dict]) -> tuple:
+    entradas = {p["mes"]: p for p in manifesto.get("particoes", [])}
+    meses = {_mes({"data_inicio": chave[1]}) for chave in alteracoes} & set(entradas)
+    alteradas = 0
+    colocadas = []
+    por_mes = {}
+    for mes in meses:
+        registos = []
+        for b in _ler_lista(_ficheiro_particao(mes)):
+            chave = _chave(b)
+            if chave in alteracoes:
+                alteradas += 1
+                if alteracoes[chave] is None:
+                    continue
+                b = alteracoes[chave]
+                colocadas.append(b)
+            registos.append(b)
+        por_mes[mes] = registos
+    if not alteradas:
+        return 0, {}, {}
+
+    ## Cada reserva alterada contra as outras da mesma viatura no estado final
+    ## (as partições que podem intersetar o seu intervalo, já alteradas, mais o journal)
+    for novo in colocadas:
+        ini, fim = ordinal(novo.get("data_inicio")), ordinal(novo.get("data_fim"))
+        outras = [
+            b
+            for p in _particoes(manifesto, ini, fim)
+            for b in (por_mes[p["mes"]] if p["mes"] in por_mes else _ler_lista(_ficheiro_particao(p["mes"])))
+        ]
+        if any(b is not novo and _sobrepoem(novo, b) for b in outras + journal):
+            raise ValueError(
+                f"A reserva de {novo.get('data_inicio')} a {novo.get('data_fim')} sobrepõe-se a outra "
+                f"da viatura {novo.get('matricula')}."
+            )
+
+    por_particao = _ler_resumos_guardados()
+    temporarios = {}
+    resumos_tmp = None
+    remover = []
+    try:
+        for mes, registos in por_mes.items():
+            if registos:
+                temporarios[mes] = _escrever_particao(mes, registos)
+                entradas[mes] = _entrada(mes, registos)
+                por_particao[mes] = resumos.resumir(registos)
+            else:
+                del entradas[mes]
+                por_particao.pop(mes, None)
+                remover.append(_ficheiro_particao(mes))
+        resumos_tmp = _escrever_resumos(por_particao)
+        manifesto_tmp = _escrever_manifesto(entradas)
+    except BaseException:
+        _descartar(list(temporarios.values()) + [resumos_tmp])
+        raise
+    assinaturas = _instalar(temporarios, resumos_tmp, manifesto_tmp, remover)
+    return alteradas, por_mes, assinaturas
@@ -1,9 +1,16 @@
-from utils import read_json, save_json
-from datetime import datetime
-from typing import List, Dict, Tuple
+from utils import read_json
+import bookings_store
+import instrumentacao
+import precos
+from modelos import Booking, Vehicle, VehicleClass, ordinal, registos
+from bisect import bisect_left
+from datetime import date, datetime
+from typing import List, Dict, Optional, Tuple
 
 ## FORMATO DA DATA
 DATE_FMT = "%Y-%m-%d"
+## Reservas por página no histórico do cliente
+POR_PAGINA = 10
 
 ## Lê definições gerais como dicionário
 def load_definitions() -> Dict:
@@ -11,32 +18,20 @@ def load_definitions() -> Dict:
     return data[0]
 
 ## Lê classes como uma lista
-def load_classes() -> List[Dict]:
-    classes = read_json("data/classes.json")
-    if isinstance(classes, list):
-        return classes
-    else:
-        return []
+def load_classes() -> List[VehicleClass]:
+    return registos(read_json("data/classes.json"), VehicleClass)
 
 ## Lê veiculos como uma lista
-def load_vehicles() -> List[Dict]:
-    vehicles = read_json("data/vehicles.json")
-    if isinstance(vehicles, list):
-         return vehicles
-    else:
-         return []
-
-## Lê historico como uma lista
-def load_bookings() -> List[Dict]:
-    bookings = read_json("data/bookings.json")
-    if isinstance(bookings, list):
-        return bookings
-    else:
-        return []
-
-## Salvar historico
-def save_bookings(bookings: List[Dict]) -> None:
-    save_json("data/bookings.json", bookings)
+def load_vehicles() -> List[Vehicle]:
+    return registos(read_json("data/vehicles.json"), Vehicle)
+
+## Lê historico como uma lista (snapshot + journal)
+def load_bookings() -> List[Booking]:
+    return bookings_store.load_bookings()
+
+## Salvar historico completo
+def save_bookings(bookings: List[Booking]) -> None:
+    bookings_store.save_bookings(bookings)
 
 ## Converte string para datetime usando o formato referido antes
 def parse_date(value: str) -> datetime:
@@ -47,7 +42,7 @@ def validar_intervalo(data_inicio: str, data_fim: str, max_dias: int) -> Tuple[b
     try:
         inicio = parse_date(data_inicio)
         fim = parse_date(data_fim)
-    except ValueError:
+    except (TypeError, ValueError):
         return False, "Datas devem estar no formato YYYY-MM-DD.", 0
 
     if fim <= inicio:
@@ -58,76 +53,151 @@ def validar_intervalo(data_inicio: str, data_fim: str, max_dias: int) -> Tuple[b
         return False, f"Reserva excede o máximo de {max_dias} dias.", 0
     return True, "", dias
 
-## Verifica se a data enviada sobrepoe a que já esta reservada
-def esta_disponivel(matricula: str, data_inicio: str, data_fim: str, bookings: List[Dict]) -> bool:
-    try:
-        novo_inicio = parse_date(data_inicio)
-        novo_fim = parse_date(data_fim)
-    except ValueError:
-        return False
-
+## Constrói o índice de reservas por matrícula: matricula -> (inícios, fins) em ordinais,
+## ordenado por início e com intervalos [inicio, fim) disjuntos
+def construir_indice(bookings: List[Booking]) -> Dict[str, Tuple[List[int], List[int]]]:
+    por_matricula = {}
     for b in bookings:
-        if b.get("matricula") != matricula:
+        if b.inicio is None or b.fim is None or b.fim <= b.inicio:
             continue
-        # intervalo [inicio, fim)
-        try:
-            ini = parse_date(b["data_inicio"])
-            fim = parse_date(b["data_fim"])
-        except Exception:
-            continue
-        sobrepoe = not (novo_fim <= ini or novo_inicio >= fim)
-        if sobrepoe:
-            return False
-    return True
+        por_matricula.setdefault(b.matricula, []).append((b.inicio, b.fim))
+
+    indice = {}
+    for matricula, intervalos in por_matricula.items():
+        intervalos.sort()
+        inicios, fins = [], []
+        for ini, fim in intervalos:
+            ## Reservas antigas sobrepostas são fundidas para manter a lista disjunta
+            if fins and ini < fins[-1]:
+                fins[-1] = max(fins[-1], fim)
+            else:
+                inicios.append(ini)
+                fins.append(fim)
+        indice[matricula] = (inicios, fins)
+    return indice
+
+## Acrescenta uma reserva (já validada como disponível) ao índice
+def indexar_reserva(indice: Dict[str, Tuple[List[int], List[int]]], reserva: Booking) -> None:
+    if reserva.inicio is None or reserva.fim is None:
+        return
+    inicios, fins = indice.setdefault(reserva.matricula, ([], []))
+    pos = bisect_left(inicios, reserva.inicio)
+    inicios.insert(pos, reserva.inicio)
+    fins.insert(pos, reserva.fim)
+
+## Aplica ao índice o resultado de uma sincronização com o histórico
+## (novas=None significa que o histórico foi recarregado por inteiro)
+def atualizar_indice(indice: Dict, novas: Optional[List[Booking]], bookings: List[Booking]) -> None:
+    if novas is None:
+        indice.clear()
+        indice.update(construir_indice(bookings))
+        return
+    for b in novas:
+        indexar_reserva(indice, b)
+
+## Traz a sessão para o estado atual do histórico e garante em memória as partições que podem
+## ter reservas em [data_inicio, data_fim) (a sessão começa só com as reservas a partir de hoje)
+def preparar_periodo(estado: Dict, indice: Dict, data_inicio: Optional[str], data_fim: Optional[str]) -> None:
+    atualizar_indice(indice, bookings_store.sincronizar(estado), estado["reservas"])
+    ini, fim = ordinal(data_inicio), ordinal(data_fim)
+    if (data_inicio is not None and ini is None) or (data_fim is not None and fim is None):
+        return
+    ## Reservas antigas podem sobrepor-se: com partições novas o índice é reconstruído (fundidas)
+    if bookings_store.carregar_periodo(estado, ini, fim) != []:
+        atualizar_indice(indice, None, estado["reservas"])
+
+## Verifica se a data enviada sobrepoe a que já esta reservada (pesquisa binária no índice)
+@instrumentacao.medir("esta_disponivel")
+def esta_disponivel(matricula: str, data_inicio: str, data_fim: str, indice: Dict[str, Tuple[List[int], List[int]]]) -> bool:
+    novo_inicio = ordinal(data_inicio)
+    novo_fim = ordinal(data_fim)
+    if novo_inicio is None or novo_fim is None:
+        return False
+
+    if matricula not in indice:
+        return True
+    inicios, fins = indice[matricula]
+
+    # intervalo [inicio, fim): só a última reserva que começa antes de novo_fim pode sobrepor
+    i = bisect_left(inicios, novo_fim) - 1
+    return i < 0 or fins[i] <= novo_inicio
 
 ## Obtem o preço diario
-def obter_preco_diario(id_classe, classes: List[Dict]) -> float:
-    for cls in classes:
-        if str(cls.get("id")) == str(id_classe):
-            return float(cls.get("preco_diario", 0))
-    return 0.0
+def obter_preco_diario(id_classe, classes: List[VehicleClass]) -> float:
+    return precos.por_classe(classes).get(str(id_classe), 0.0)
 
 ## Calcula o preço com descontos
 def calcular_preco(dias: int, preco_diario: float, defs: Dict) -> Tuple[float, float]:
-    descontos = defs.get("descontos", {})
-    if dias <= 3:
-        desconto = descontos.get("ate_3_dias", 0)
-    elif dias <= 7:
-        desconto = descontos.get("de_4_a_7_dias", 10)
-    else:
-        desconto = descontos.get("mais_de_7_dias", 20)
-    fator = 1 - desconto / 100
+    desconto, fator = precos.escalao(precos.escaloes(defs), dias)
     total = round(dias * preco_diario * fator, 2)
     return desconto, total
 
 ## Mostra os carros disponíveis
-def mostrar_carros(carros: List[Dict]) -> None:
-    ativos = [c for c in carros if c.get("estado") == "ativo"]
+def mostrar_carros(carros: List[Vehicle]) -> None:
+    ativos = [c for c in carros if c.estado == "ativo"]
     print("\n--------Carros Disponíveis-------")
     if not ativos:
         print("Não temos carros disponíveis.")
         return
     for c in ativos:
-        print(f"{c['matricula']} - {c['marca']} {c['modelo']} (classe {c.get('id_classe')})")
+        print(f"{c.matricula} - {c.marca} {c.modelo} (classe {c.id_classe})")
+
+## Procura as viaturas ativas livres em todo o intervalo (opcionalmente de uma classe)
+## Devolve (viatura, desconto, total) com o preço já calculado; uma pesquisa no índice por viatura
+def procurar_disponiveis(carros: List[Vehicle], classes: List[VehicleClass], defs: Dict, indice: Dict,
+                         data_inicio: str, data_fim: str, id_classe=None) -> List[Tuple[Vehicle, float, float]]:
+    ok, msg, dias = validar_intervalo(data_inicio, data_fim, defs.get("max_dias_reserva"))
+    if not ok:
+        raise ValueError(msg)
+
+    chave = None if id_classe is None else str(id_classe)
+    livres = [
+        c for c in carros
+        if c.estado == "ativo" and (chave is None or c.classe == chave)
+        and esta_disponivel(c.matricula, data_inicio, data_fim, indice)
+    ]
+    cotacoes = precos.cotar_lote(precos.compilar(classes, defs), ((c, data_inicio, data_fim) for c in livres))
+    return [(c, desconto, total) for c, (_, _, desconto, total) in zip(livres, cotacoes)]
+
+## Pede o intervalo (e a classe) e mostra os carros livres com o preço
+def pesquisar_carros(carros: List[Vehicle], classes: List[VehicleClass], defs: Dict, estado: Dict, indice: Dict) -> None:
+    data_inicio = input("Data de início (YYYY-MM-DD): ").strip()
+    data_fim = input("Data de fim (YYYY-MM-DD): ").strip()
+    id_classe = input("ID da classe (ENTER para todas): ").strip() or None
+
+    preparar_periodo(estado, indice, data_inicio, data_fim)
+    try:
+        livres = procurar_disponiveis(carros, classes, defs, indice, data_inicio, data_fim, id_classe)
+    except ValueError as e:
+        print(f"Erro: {e}\n")
+        return
+
+    print(f"\n-----Carros livres de {data_inicio} a {data_fim}-----")
+    if not livres:
+        print("Não há carros livres nesse período.")
+        return
+    for c, desconto, total in livres:
+        print(f"{c.matricula} - {c.marca} {c.modelo} (classe {c.id_classe}) | total {total}€ (desconto {desconto}%)")
 
 ## Reserva a viatura e atualiza bookings
-def reservar_viatura(current_user: Dict, carros: List[Dict], classes: Dict, defs: Dict, bookings: List[Dict]) -> List[Dict]:
+@instrumentacao.medir("reservar_viatura")
+def reservar_viatura(current_user: Dict, carros: List[Vehicle], classes: List[VehicleClass], defs: Dict, estado: Dict, indice: Dict) -> None:
 
     ## Se não tiver ativos
-    ativos = [c for c in carros if c.get("estado") == "ativo"]
+    ativos = [c for c in carros if c.estado == "ativo"]
     if not ativos:
         print("Não há viaturas ativas para reservar.\n")
-        return bookings
+        return
 
     ## Mostra os carros para puder reservar
     mostrar_carros(carros)
     matricula = input("\nMatrícula a reservar: ").strip()
-    viatura = next((c for c in ativos if c.get("matricula") == matricula), None)
+    viatura = next((c for c in ativos if c.matricula == matricula), None)
 
     ## Se não for ativo ou não for encontrado
     if not viatura:
         print("Matrícula não encontrada ou inativa.\n")
-        return bookings
+        return
 
     ## Inserir datas
     data_inicio = input("Data de início (YYYY-MM-DD): ").strip()
@@ -137,68 +207,99 @@ def reservar_viatura(current_user: Dict, carros: List[Dict], classes: Dict, defs
     ok, msg, dias = validar_intervalo(data_inicio, data_fim, defs.get("max_dias_reserva"))
     if not ok:
         print(f"Erro: {msg}\n")
-        return bookings
+        return
 
-    ## Se não tiver disponivel nesse período
-    if not esta_disponivel(matricula, data_inicio, data_fim, bookings):
+    ## Se não tiver disponivel nesse período (trazer primeiro as reservas de outras sessões)
+    preparar_periodo(estado, indice, data_inicio, data_fim)
+    if not esta_disponivel(matricula, data_inicio, data_fim, indice):
         print("Viatura indisponível nesse período.\n")
-        return bookings
-
-    preco_diario = obter_preco_diario(viatura.get("id_classe"), classes)
-    desconto, total = calcular_preco(dias, preco_diario, defs)
-
-    reserva = {
-        "email": current_user.get("email"),
-        "matricula": matricula,
-        "data_inicio": data_inicio,
-        "data_fim": data_fim,
-        "dias": dias,
-        "preco_diario": preco_diario,
-        "desconto": desconto,
-        "total": total,
-    }
-    bookings.append(reserva)
-
-    # Manter histórico ordenado por data_inicio e salvar
-    bookings = sorted(bookings, key=lambda b: b.get("data_inicio", ""))
-    save_bookings(bookings)
+        return
+
+    preco_diario, desconto, total = precos.cotar(precos.compilar(classes, defs), viatura.classe, dias)
+
+    reserva = Booking(
+        email=current_user.get("email"),
+        matricula=matricula,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        dias=dias,
+        preco_diario=preco_diario,
+        desconto=desconto,
+        total=total,
+    )
+    ## Revalidar sob bloqueio com o que outras sessões gravaram entretanto
+    def confirmar(novas: Optional[List[Booking]]) -> bool:
+        atualizar_indice(indice, novas, estado["reservas"])
+        return esta_disponivel(matricula, data_inicio, data_fim, indice)
+
+    # Gravar só a reserva nova no journal (fica ordenada por data_inicio em memória)
+    if not bookings_store.registar_reserva(estado, reserva, confirmar):
+        print("Viatura acabou de ser reservada noutra sessão para esse período.\n")
+        return
+    indexar_reserva(indice, reserva)
     print(f"Reserva criada. Total: {total}€ (desconto {desconto}%).\n")
-    return bookings
 
-## Ver historico de reservas
-def ver_historico(bookings: List[Dict], current_user: Dict) -> None:
-    historico = [b for b in bookings if b.get("email") == current_user.get("email")]
+## Ver historico de reservas: da mais recente para a mais antiga, POR_PAGINA de cada vez
+## (só as reservas da página são lidas do histórico), opcionalmente só as de um período
+def ver_historico(current_user: Dict) -> None:
+    email = current_user.get("email")
     print("\n-----Histórico de Reservas-----")
-    if not historico:
-        print("Ainda não tem reservas.")
+    data_inicio = input("Desde (YYYY-MM-DD, ENTER para todas): ").strip() or None
+    data_fim = input("Até (YYYY-MM-DD, ENTER para todas): ").strip() or None
+    ini, fim = ordinal(data_inicio), ordinal(data_fim)
+    if (data_inicio is not None and ini is None) or (data_fim is not None and fim is None):
+        print("Erro: Datas devem estar no formato YYYY-MM-DD.\n")
         return
-    for i, b in enumerate(historico, 1):
-        print(
-            f"{i}. {b['matricula']} | {b['data_inicio']} -> {b['data_fim']} | "
-            f"{b['dias']} dias | total {b['total']}€"
-        )
+
+    pagina = 1
+    while True:
+        historico, total = bookings_store.historico_cliente(email, pagina, POR_PAGINA, ini, fim)
+        if not total:
+            print("Não tem reservas nesse período." if ini is not None or fim is not None else "Ainda não tem reservas.")
+            return
+        paginas = (total + POR_PAGINA - 1) // POR_PAGINA
+        print(f"\nPágina {pagina} de {paginas} ({total} reservas)")
+        for i, b in enumerate(historico, (pagina - 1) * POR_PAGINA + 1):
+            print(
+                f"{i}. {b.matricula} | {b.data_inicio} -> {b.data_fim} | "
+                f"{b.dias} dias | total {b.total}€"
+            )
+        if paginas == 1:
+            return
+        escolha = input("[S]eguinte, [A]nterior ou ENTER para voltar: ").strip().lower()
+        if escolha == "s" and pagina < paginas:
+            pagina += 1
+        elif escolha == "a" and pagina > 1:
+            pagina -= 1
+        elif escolha not in ("s", "a"):
+            return
 
 ## Ver o menu do cliente
 def menu_client(current_user=None):
     carros = load_vehicles()
     classes = load_classes()
     defs = load_definitions()
-    bookings = load_bookings()
+    ## Só as partições com reservas a partir de hoje; as outras são lidas quando forem precisas
+    estado = bookings_store.abrir(date.today().toordinal(), None)
+    indice = construir_indice(estado["reservas"])
 
     while True:
         print("\n--------Menu Cliente--------")
         print("1. Ver carros disponíveis")
         print("2. Efetuar reserva")
         print("3. Ver histórico de reservas")
-        print("4. Sair")
+        print("4. Procurar carros livres por datas")
+        print("5. Sair")
         escolha = input("Escolha uma opção: ").strip()
         if escolha == "1":
             mostrar_carros(carros)
         elif escolha == "2":
-            bookings = reservar_viatura(current_user or {}, carros, classes, defs, bookings)
+            reservar_viatura(current_user or {}, carros, classes, defs, estado, indice)
         elif escolha == "3":
-            ver_historico(bookings, current_user or {})
+            ver_historico(current_user or {})
         elif escolha == "4":
+            pesquisar_carros(carros, classes, defs, estado, indice)
+        elif escolha == "5":
             print("Saindo...")
             break
         else:
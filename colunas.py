@@ -0,0 +1,144 @@
+from itertools import islice
+from typing import Dict, Iterable, List
+
+from modelos import Booking
+
+## NumPy é opcional: sem ele as estatísticas usam o ciclo em Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+## Nº de reservas convertidas em colunas de cada vez (a memória depende do bloco, não do histórico)
+TAMANHO_BLOCO = 8192
+
+## ---------- REPRESENTAÇÃO EM COLUNAS ----------
+
+## Converte um bloco de reservas em colunas: inicio/fim (ordinais), total e código da viatura
+## As matrículas ficam codificadas em "codigos" pela ordem da primeira ocorrência (partilhado entre blocos)
+def construir_colunas(bookings: Iterable[Booking], codigos: Dict[str, int]) -> Dict:
+    inicio, fim, total, viatura = [], [], [], []
+
+    for b in bookings:
+        if b.inicio is None or b.fim is None:
+            continue
+        inicio.append(b.inicio)
+        fim.append(b.fim)
+        total.append(float(b.total or 0))
+        viatura.append(codigos.setdefault(b.matricula, len(codigos)))
+
+    return {
+        "inicio": np.array(inicio, dtype=np.int64),
+        "fim": np.array(fim, dtype=np.int64),
+        "total": np.array(total, dtype=np.float64),
+        "viatura": np.array(viatura, dtype=np.int64),
+    }
+
+
+## Códigos presentes por ordem da primeira ocorrência
+def _por_ordem(codigos):
+    unicos, primeiro = np.unique(codigos, return_index=True)
+    return unicos[np.argsort(primeiro, kind="stable")]
+
+
+## Contagens (ou somas de inteiros, como os cêntimos) por grupo somadas às anteriores
+## (a ordem não importa)
+def _contar(acumulado, codigos, n, pesos=None):
+    contagem = np.bincount(codigos, weights=pesos, minlength=n).astype(np.int64)
+    contagem[:len(acumulado)] += acumulado
+    return contagem
+
+
+## Acrescenta os códigos do bloco que ainda não tinham aparecido (mantém a ordem de aparição)
+def _juntar_ordem(ordem: List[int], vistos: set, codigos) -> None:
+    for cod in _por_ordem(codigos):
+        cod = int(cod)
+        if cod not in vistos:
+            vistos.add(cod)
+            ordem.append(cod)
+
+
+## Agrega as reservas que intersetam [ini, fim) (ordinais) com operações vetoriais,
+## bloco a bloco (bookings pode ser um gerador); o resultado é igual ao do ciclo em Python
+## (os totais são somados em cêntimos)
+def agregar(bookings: Iterable[Booking], ini: int, fim: int, mapa_classe_por_mat: Dict) -> Dict:
+    codigos = {}
+    ## Classe de cada viatura (-1 se a matrícula não existe na frota)
+    classe_da_viatura = []
+    ids_classe = []
+    codigo_classe = {}
+
+    total = np.zeros(0, dtype=np.int64)
+    num_reservas = 0
+    dias_total = 0
+    total_v, reservas_v, dias_v = (np.zeros(0, dtype=np.int64) for _ in range(3))
+    total_c, reservas_c, dias_c = (np.zeros(0, dtype=np.int64) for _ in range(3))
+    ordem_v, vistos_v, ordem_c, vistos_c = [], set(), [], set()
+
+    reservas = iter(bookings)
+    while True:
+        bloco = list(islice(reservas, TAMANHO_BLOCO))
+        if not bloco:
+            break
+        colunas = construir_colunas(bloco, codigos)
+        del bloco
+
+        dias_int = np.minimum(colunas["fim"], fim) - np.maximum(colunas["inicio"], ini)
+        sel = np.flatnonzero(dias_int > 0)
+        if not len(sel):
+            continue
+        dias_int = dias_int[sel]
+        ## Cêntimos como em resumos.em_centimos (np.rint arredonda como round: metades para o par)
+        valores = np.rint(colunas["total"][sel] * 100).astype(np.int64)
+        viaturas = colunas["viatura"][sel]
+
+        for mat in islice(codigos, len(classe_da_viatura), None):
+            id_classe = mapa_classe_por_mat.get(mat)
+            if id_classe is not None and id_classe not in codigo_classe:
+                codigo_classe[id_classe] = len(ids_classe)
+                ids_classe.append(id_classe)
+            classe_da_viatura.append(-1 if id_classe is None else codigo_classe[id_classe])
+
+        ## Globais
+        total = _contar(total, np.zeros(len(sel), dtype=np.int64), 1, valores)
+        num_reservas += len(sel)
+        dias_total += int(dias_int.sum())
+
+        ## Por viatura
+        n = len(codigos)
+        total_v = _contar(total_v, viaturas, n, valores)
+        reservas_v = _contar(reservas_v, viaturas, n)
+        dias_v = _contar(dias_v, viaturas, n, dias_int)
+        _juntar_ordem(ordem_v, vistos_v, viaturas)
+
+        ## Por classe (reservas de viaturas fora da frota não contam)
+        classes = np.array(classe_da_viatura, dtype=np.int64)[viaturas]
+        com_classe = classes >= 0
+        classes = classes[com_classe]
+        n = len(ids_classe)
+        total_c = _contar(total_c, classes, n, valores[com_classe])
+        reservas_c = _contar(reservas_c, classes, n)
+        dias_c = _contar(dias_c, classes, n, dias_int[com_classe])
+        _juntar_ordem(ordem_c, vistos_c, classes)
+
+    matriculas = list(codigos)
+    resultado = {
+        "total_faturado": int(total[0]) / 100 if len(total) else 0.0,
+        "num_reservas": num_reservas,
+        "dias_alugados_total": dias_total,
+        "por_classe": {},
+        "por_viatura": {},
+    }
+    for cod in ordem_v:
+        resultado["por_viatura"][matriculas[cod]] = {
+            "total": int(total_v[cod]) / 100,
+            "reservas": int(reservas_v[cod]),
+            "dias": int(dias_v[cod]),
+        }
+    for cod in ordem_c:
+        resultado["por_classe"][ids_classe[cod]] = {
+            "total": int(total_c[cod]) / 100,
+            "reservas": int(reservas_c[cod]),
+            "dias": int(dias_c[cod]),
+        }
+    return resultado
@@ -0,0 +1,280 @@
+## Sessão de edição do administrador (frota e classes): as alterações ficam em memória, marcadas
+## por chave, e são gravadas de uma só vez ao sair do menu, com "Guardar" ou periodicamente
+## (a cada FLUSH_EDICOES alterações ou FLUSH_SEGUNDOS segundos).
+## Cada alteração é também acrescentada (com fsync) a um journal da sessão,
+## ficheiro.json.<pid>.pendente; se a sessão terminar sem gravar, a próxima sessão que editar o
+## mesmo ficheiro recupera essas alterações. O journal fica bloqueado enquanto a sessão está viva.
+## Ao gravar, as alterações são aplicadas sobre a versão atual do ficheiro (utils.atualizar_json):
+## edições de outras sessões a outros registos não se perdem, e de um registo alterado só mudam
+## os campos que esta sessão alterou.
+## Sessões de ficheiros diferentes podem ser ligadas num grupo (ligar): as alterações de todas são
+## gravadas juntas, pela ordem do grupo.
+import glob
+import json
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from modelos import Vehicle, VehicleClass, registos
+from utils import atualizar_json, bloquear, read_json
+
+FLUSH_EDICOES = int(os.environ.get("RENTACAR_FLUSH_EDICOES", "50") or 0)
+FLUSH_SEGUNDOS = float(os.environ.get("RENTACAR_FLUSH_SEGUNDOS", "300") or 0)
+
+## Chave de cada tipo de registo: (do dicionário, do registo)
+CHAVES = {
+    Vehicle: (lambda d: d.get("matricula"), lambda r: r.matricula),
+    VehicleClass: (lambda d: None if d.get("id") is None else str(d.get("id")), lambda r: r.chave),
+}
+
+
+def _pendente(filename: str, pid: int) -> str:
+    return f"{filename}.{pid}.pendente"
+
+
+## Registo original desconhecido (journal de uma versão anterior): a alteração substitui o registo
+_DESCONHECIDO = object()
+
+
+## Lê as alterações completas de um journal:
+## [(chave, registo ou None se removido, registo antes da sessão o alterar ou None se é novo)]
+def _ler_pendentes(caminho: str) -> list:
+    alteracoes = []
+    try:
+        with open(caminho, "rb") as f:
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break
+                try:
+                    alteracao = json.loads(linha)
+                except ValueError:
+                    continue
+                if isinstance(alteracao, dict) and "chave" in alteracao:
+                    alteracoes.append(
+                        (alteracao["chave"], alteracao.get("registo"), alteracao.get("original", _DESCONHECIDO))
+                    )
+    except FileNotFoundError:
+        pass
+    return alteracoes
+
+
+## Apaga o journal e o seu .lock (em Windows o .lock ainda aberto fica para trás)
+def _remover(caminho: str) -> None:
+    for ficheiro in (caminho, caminho + ".lock"):
+        try:
+            os.remove(ficheiro)
+        except OSError:
+            pass
+
+
+## Campos de registo que mudaram em relação a original, aplicados sobre atual
+## (o que outra sessão gravou entretanto noutros campos fica)
+def _fundir(atual: Dict, registo: Dict, original: Dict) -> Dict:
+    fundido = {k: v for k, v in atual.items() if not (k in original and k not in registo)}
+    for k, v in registo.items():
+        if k not in original or original[k] != v:
+            fundido[k] = v
+    return fundido
+
+
+## Aplica alterações a uma lista de dicionários: gravar substitui o registo com a mesma chave
+## (ou acrescenta-o no fim), remover retira todos os registos com essa chave
+## Com o registo original (originais: chave -> dicionário antes da alteração) só os campos
+## alterados mudam no registo atual
+def aplicar(lista: List[Dict], alteracoes: Dict, chave_de: Callable, originais: Optional[Dict] = None) -> List[Dict]:
+    posicoes = {}
+    for i, d in enumerate(lista):
+        if isinstance(d, dict):
+            posicoes.setdefault(chave_de(d), i)
+    novos = []
+    for chave, registo in alteracoes.items():
+        if registo is None:
+            continue
+        if chave in posicoes:
+            original = (originais or {}).get(chave)
+            atual = lista[posicoes[chave]]
+            lista[posicoes[chave]] = registo if not isinstance(original, dict) else _fundir(atual, registo, original)
+        else:
+            novos.append(registo)
+    removidas = {chave for chave, registo in alteracoes.items() if registo is None}
+    if removidas:
+        lista = [d for d in lista if not (isinstance(d, dict) and chave_de(d) in removidas)]
+    return lista + novos
+
+
+## ---------- SESSÃO ----------
+
+## Cópias dos registos atuais do ficheiro (os de registos() são partilhados pela cache)
+def _copias(data, tipo) -> list:
+    return [tipo.from_dict(r.to_dict()) for r in registos(data, tipo)]
+
+
+## Abre uma sessão de edição do ficheiro; no fim grava o que estiver por gravar
+## (se a sessão terminar com uma exceção, as alterações ficam no journal para recuperar)
+## sessao: {"filename", "tipo", "chave", "registos", "sujos": {chave: dict ou None},
+##          "lido": conteúdo do ficheiro lido ou gravado, "lidos": {chave: dict} (de "lido", calculado ao alterar),
+##          "originais": {chave: dict antes da primeira alteração, None se é novo},
+##          "journal", "recuperadas", "gravada_em", "grupo": sessões gravadas em conjunto, "em_lote"}
+@contextmanager
+def sessao(filename: str, tipo) -> Iterator[Dict]:
+    journal = _pendente(filename, os.getpid())
+    with bloquear(journal):
+        data = read_json(filename)
+        s = {
+            "filename": filename,
+            "tipo": tipo,
+            "chave": CHAVES[tipo],
+            "registos": _copias(data, tipo),
+            "lido": data,
+            "lidos": None,
+            "sujos": {},
+            "originais": {},
+            "journal": journal,
+            "recuperadas": 0,
+            "gravada_em": time.monotonic(),
+            "grupo": None,
+            "em_lote": False,
+        }
+        for chave, registo, original in _ler_pendentes(journal):
+            _marcar(s, chave, registo, registar=False, original=original)
+            s["recuperadas"] += 1
+        _recuperar(s)
+        yield s
+        gravar(s)
+    _remover(journal)
+
+
+## Adota os journals de sessões que já terminaram (o bloqueio deles está livre)
+def _recuperar(s: Dict) -> None:
+    for caminho in sorted(glob.glob(_pendente(glob.escape(s["filename"]), "*"))):
+        if caminho == s["journal"]:
+            continue
+        with ExitStack() as pilha:
+            try:
+                pilha.enter_context(bloquear(caminho, esperar=False))
+            except OSError:
+                ## Sessão ainda ativa
+                continue
+            for chave, registo, original in _ler_pendentes(caminho):
+                _marcar(s, chave, registo, original=original)
+                s["recuperadas"] += 1
+            _remover(caminho)
+
+
+## Registo com essa chave no ficheiro como a sessão o leu (None se não existe); os registos da
+## sessão não servem, porque os menus alteram-nos antes de os guardar
+def _original(s: Dict, chave) -> Optional[Dict]:
+    if s["lidos"] is None:
+        chave_de = s["chave"][0]
+        lidos = {}
+        for d in s["lido"] if isinstance(s["lido"], list) else []:
+            if isinstance(d, dict):
+                lidos.setdefault(chave_de(d), d)
+        s["lidos"] = lidos
+    original = s["lidos"].get(chave)
+    return dict(original) if original is not None else None
+
+
+## original: o registo antes da alteração (por omissão o lido pela sessão; _DESCONHECIDO se não se sabe)
+def _marcar(s: Dict, chave, registo: Optional[Dict], registar: bool = True, original=None) -> None:
+    lista = s["registos"]
+    chave_registo = s["chave"][1]
+    atual = [i for i, r in enumerate(lista) if chave_registo(r) == chave]
+    if chave not in s["originais"]:
+        s["originais"][chave] = _original(s, chave) if original is None else original
+    original = s["originais"][chave]
+    if registar:
+        linha = {"chave": chave, "registo": registo}
+        if original is not _DESCONHECIDO:
+            linha["original"] = original
+        with open(s["journal"], "ab") as f:
+            f.write((json.dumps(linha, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+    ## A ordem de "sujos" é a da primeira alteração de cada chave
+    s["sujos"][chave] = registo
+    if registo is None:
+        s["registos"] = [r for i, r in enumerate(lista) if i not in atual]
+    elif atual:
+        lista[atual[0]] = s["tipo"].from_dict(registo)
+    else:
+        lista.append(s["tipo"].from_dict(registo))
+
+
+## Regista um registo novo ou alterado
+def guardar_registo(s: Dict, registo) -> None:
+    dados = registo.to_dict()
+    _marcar(s, s["chave"][0](dados), dados)
+    _talvez_gravar(s)
+
+
+## Regista a remoção dos registos com essa chave
+def remover_registo(s: Dict, chave) -> None:
+    _marcar(s, chave, None)
+    _talvez_gravar(s)
+
+
+def pendentes(s: Dict) -> int:
+    return sum(len(x["sujos"]) for x in _grupo(s))
+
+
+## Liga sessões de ficheiros diferentes: gravar qualquer uma grava todas, pela ordem dada
+## (ex.: classes antes das viaturas, para uma viatura nunca referir uma classe por gravar)
+def ligar(*sessoes: Dict) -> None:
+    grupo = list(sessoes)
+    for s in grupo:
+        s["grupo"] = grupo
+
+
+def _grupo(s: Dict) -> List[Dict]:
+    return s["grupo"] or [s]
+
+
+## Várias alterações (em sessões do mesmo grupo) que só podem ser gravadas juntas:
+## a gravação periódica espera pelo fim do bloco
+@contextmanager
+def lote(s: Dict) -> Iterator[None]:
+    grupo = _grupo(s)
+    for x in grupo:
+        x["em_lote"] = True
+    try:
+        yield
+    finally:
+        for x in grupo:
+            x["em_lote"] = False
+    _talvez_gravar(s)
+
+
+## Gravação periódica
+def _talvez_gravar(s: Dict) -> None:
+    if s["em_lote"]:
+        return
+    if (FLUSH_EDICOES and pendentes(s) >= FLUSH_EDICOES) or (
+        FLUSH_SEGUNDOS and time.monotonic() - s["gravada_em"] >= FLUSH_SEGUNDOS
+    ):
+        gravar(s)
+
+
+## Grava as alterações pendentes da sessão (e das sessões ligadas a ela). Devolve quantas foram gravadas
+def gravar(s: Dict) -> int:
+    return sum(_gravar(x) for x in _grupo(s))
+
+
+## Grava as alterações pendentes numa só escrita atómica e esvazia o journal da sessão;
+## os registos da sessão passam a ser os do ficheiro gravado
+## (se falhar entre as duas coisas, repetir as alterações do journal dá o mesmo resultado)
+def _gravar(s: Dict) -> int:
+    s["gravada_em"] = time.monotonic()
+    n = len(s["sujos"])
+    if not n:
+        return 0
+    sujos, originais = s["sujos"], s["originais"]
+    data = atualizar_json(s["filename"], lambda lista: aplicar(lista, sujos, s["chave"][0], originais))
+    s["registos"] = _copias(data, s["tipo"])
+    s["lido"], s["lidos"] = data, None
+    s["sujos"] = {}
+    s["originais"] = {}
+    with open(s["journal"], "wb") as f:
+        os.fsync(f.fileno())
+    return n
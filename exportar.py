@@ -0,0 +1,301 @@
+## Exportação em fluxo das reservas e dos relatórios para CSV ou JSONL (opcionalmente gzip)
+## Uso: python exportar.py reservas destino [--desde YYYY-MM-DD] [--ate YYYY-MM-DD] [--recomecar]
+##      python exportar.py extrato destino --data YYYY-MM-DD
+##      python exportar.py estatisticas destino --desde YYYY-MM-DD --ate YYYY-MM-DD
+##      (todas aceitam --bloco N)
+## O formato vem da extensão do destino: .csv, .jsonl, .csv.gz ou .jsonl.gz
+## As reservas saem por ordem de data_inicio, juntas com os dados da viatura e da classe, e são
+## escritas em blocos de BLOCO linhas: em memória fica só o bloco atual (o histórico é percorrido
+## com iterar_reservas). Comprimido, cada bloco é um membro gzip (o ficheiro lê-se como um só).
+## Depois de cada bloco a marca (destino.marca.json) guarda a última data_inicio exportada e o
+## tamanho do ficheiro: exportar outra vez para o mesmo destino continua daí, seja para retomar
+## uma exportação interrompida, seja para acrescentar só as reservas novas. Reservas gravadas
+## depois com data_inicio anterior à marca só saem com --recomecar.
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bookings_store
+from admin_menu import calcular_estatisticas_periodo, load_classes, load_vehicles, parse_date, reservas_do_dia
+from modelos import Booking, Vehicle, VehicleClass, ordinal
+from utils import escrever_atomico
+
+## Linhas escritas de cada vez
+BLOCO = 5000
+
+COLUNAS_RESERVAS = (
+    "email", "matricula", "data_inicio", "data_fim", "dias", "preco_diario", "desconto", "total",
+    "marca", "modelo", "estado_viatura", "id_classe", "classe",
+)
+## Uma linha "global", uma por classe e uma por viatura (ocupacao só nas viaturas: dias / dias do período)
+COLUNAS_ESTATISTICAS = ("nivel", "chave", "nome", "reservas", "dias", "total", "preco_medio_dia", "ocupacao")
+
+
+## (formato "csv" ou "jsonl", comprimido) pela extensão do destino
+def formato(destino: str) -> Tuple[str, bool]:
+    nome = destino.lower()
+    comprimido = nome.endswith(".gz")
+    if comprimido:
+        nome = nome[:-3]
+    for tipo in ("csv", "jsonl"):
+        if nome.endswith("." + tipo):
+            return tipo, comprimido
+    raise ValueError("O destino deve ter extensão .csv, .jsonl, .csv.gz ou .jsonl.gz.")
+
+
+def _data(valor: Optional[str]) -> Optional[datetime]:
+    if valor is None:
+        return None
+    try:
+        return parse_date(valor)
+    except ValueError:
+        raise ValueError("Datas devem estar no formato YYYY-MM-DD.")
+
+
+## ---------- ESCRITA POR BLOCOS ----------
+
+## Texto de um bloco de linhas (com o cabeçalho das colunas no início de um CSV novo)
+def _texto(linhas: List[Dict], tipo: str, colunas: Tuple[str, ...], cabecalho: bool) -> str:
+    if tipo == "jsonl":
+        return "".join(json.dumps({c: linha.get(c) for c in colunas}, ensure_ascii=False) + "\n" for linha in linhas)
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    if cabecalho:
+        escritor.writerow(colunas)
+    escritor.writerows([linha.get(c) for c in colunas] for linha in linhas)
+    return saida.getvalue()
+
+
+## Acrescenta um bloco ao ficheiro aberto (em gzip como um membro completo) e garante-o no disco;
+## devolve o tamanho do ficheiro
+def _acrescentar(f, texto: str, comprimido: bool) -> int:
+    dados = texto.encode("utf-8")
+    if comprimido:
+        dados = gzip.compress(dados)
+    f.write(dados)
+    f.flush()
+    os.fsync(f.fileno())
+    return f.tell()
+
+
+## Escreve as linhas em blocos num ficheiro temporário e substitui o destino no fim
+## (relatórios: o destino tem sempre o relatório anterior ou o novo completo). Devolve o nº de linhas
+def _exportar_tudo(destino: str, linhas: Iterable[Dict], colunas: Tuple[str, ...], bloco: int) -> int:
+    tipo, comprimido = formato(destino)
+    pasta = os.path.dirname(destino) or "."
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix=os.path.basename(destino) + ".", suffix=".tmp")
+    n = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pendentes = []
+            cabecalho = True
+            for linha in linhas:
+                pendentes.append(linha)
+                if len(pendentes) >= bloco:
+                    _acrescentar(f, _texto(pendentes, tipo, colunas, cabecalho), comprimido)
+                    n += len(pendentes)
+                    pendentes, cabecalho = [], False
+            if pendentes or cabecalho:
+                _acrescentar(f, _texto(pendentes, tipo, colunas, cabecalho), comprimido)
+                n += len(pendentes)
+        os.replace(tmp, destino)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return n
+
+
+## ---------- RESERVAS ----------
+
+## Linhas das reservas com os dados da viatura e o nome da classe
+def juntar(reservas: Iterable[Booking], vehicles: List[Vehicle], classes: List[VehicleClass]) -> Iterator[Dict]:
+    viaturas = {}
+    for v in vehicles:
+        viaturas.setdefault(v.matricula, v)
+    nomes = {}
+    for c in classes:
+        nomes.setdefault(c.chave, c.nome)
+
+    for b in reservas:
+        v = viaturas.get(b.matricula)
+        yield {
+            "email": b.email,
+            "matricula": b.matricula,
+            "data_inicio": b.data_inicio,
+            "data_fim": b.data_fim,
+            "dias": b.dias,
+            "preco_diario": b.preco_diario,
+            "desconto": b.desconto,
+            "total": b.total,
+            "marca": v.marca if v else None,
+            "modelo": v.modelo if v else None,
+            "estado_viatura": v.estado if v else None,
+            "id_classe": v.id_classe if v else None,
+            "classe": nomes.get(v.classe) if v else None,
+        }
+
+
+def ficheiro_marca(destino: str) -> str:
+    return destino + ".marca.json"
+
+
+## Marca da última exportação para o destino:
+## {"data_inicio", "chaves": reservas já exportadas com essa data_inicio, "tamanho", "reservas"}
+## None se não existe
+def ler_marca(destino: str) -> Optional[Dict]:
+    try:
+        with open(ficheiro_marca(destino), "r", encoding="utf-8") as f:
+            marca = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return marca if isinstance(marca, dict) else None
+
+
+## Exporta as reservas com data_inicio em [ini, fim) (datetime; None = sem limite) a partir da marca
+## do destino; sem marca (ou com recomecar) o destino é reescrito desde o início.
+## Devolve {"reservas": exportadas agora, "total": no ficheiro, "data_inicio": marca final}
+def exportar_reservas(destino: str, ini: Optional[datetime] = None, fim: Optional[datetime] = None,
+                      bloco: int = BLOCO, recomecar: bool = False) -> Dict:
+    if bloco < 1:
+        raise ValueError("O bloco deve ter pelo menos uma linha.")
+    tipo, comprimido = formato(destino)
+    ini = None if ini is None else ini.toordinal()
+    fim = None if fim is None else fim.toordinal()
+
+    if recomecar and os.path.exists(ficheiro_marca(destino)):
+        os.remove(ficheiro_marca(destino))
+    marca = ler_marca(destino)
+    if marca is None:
+        marca = {"data_inicio": None, "chaves": [], "tamanho": 0, "reservas": 0}
+    elif not os.path.exists(destino) or os.path.getsize(destino) < marca.get("tamanho", 0):
+        raise ValueError(f"{destino} não corresponde à marca da exportação anterior (use --recomecar).")
+    limite = marca["data_inicio"]
+    ## Chaves das reservas já exportadas com data_inicio == limite (só essas podem repetir-se)
+    vistas = {tuple(c) for c in marca["chaves"]}
+
+    ## Só são abertas as partições a partir da marca
+    leitura = ini
+    if ordinal(limite) is not None:
+        leitura = ordinal(limite) if ini is None else max(ini, ordinal(limite))
+
+    def novas() -> Iterator[Booking]:
+        for b in bookings_store.iterar_reservas(leitura, fim):
+            if (ini is not None or fim is not None) and (
+                b.inicio is None or (ini is not None and b.inicio < ini) or (fim is not None and b.inicio >= fim)
+            ):
+                continue
+            data_inicio = b.data_inicio or ""
+            if limite is not None and (
+                data_inicio < limite or (data_inicio == limite and (b.matricula, b.data_inicio, b.data_fim) in vistas)
+            ):
+                continue
+            yield b
+
+    exportadas = 0
+    ## "r+b" e truncar: o que foi escrito depois da última marca é de um bloco interrompido
+    modo = "r+b" if marca["tamanho"] else "wb"
+    with open(destino, modo) as f:
+        f.truncate(marca["tamanho"])
+        f.seek(marca["tamanho"])
+        pendentes = []
+
+        def gravar_bloco() -> None:
+            nonlocal exportadas, pendentes
+            cabecalho = marca["tamanho"] == 0
+            marca["tamanho"] = _acrescentar(f, _texto(pendentes, tipo, COLUNAS_RESERVAS, cabecalho), comprimido)
+            for linha in pendentes:
+                chave = [linha["matricula"], linha["data_inicio"], linha["data_fim"]]
+                data_inicio = linha["data_inicio"] or ""
+                if data_inicio != marca["data_inicio"]:
+                    marca["data_inicio"] = data_inicio
+                    marca["chaves"] = []
+                marca["chaves"].append(chave)
+            marca["reservas"] += len(pendentes)
+            exportadas += len(pendentes)
+            pendentes = []
+            escrever_atomico(ficheiro_marca(destino), json.dumps(marca, ensure_ascii=False))
+
+        for linha in juntar(novas(), load_vehicles(), load_classes()):
+            pendentes.append(linha)
+            if len(pendentes) >= bloco:
+                gravar_bloco()
+        if pendentes or marca["tamanho"] == 0:
+            gravar_bloco()
+
+    return {"reservas": exportadas, "total": marca["reservas"], "data_inicio": marca["data_inicio"]}
+
+
+## ---------- RELATÓRIOS ----------
+
+## Reservas ativas no dia (as do extrato diário) com os dados da viatura e da classe
+def exportar_extrato(destino: str, data: datetime, bloco: int = BLOCO) -> int:
+    linhas = juntar(reservas_do_dia(data.toordinal()), load_vehicles(), load_classes())
+    return _exportar_tudo(destino, linhas, COLUNAS_RESERVAS, bloco)
+
+
+## Linhas das estatísticas de [ini, fim): global, por classe e por viatura
+def linhas_estatisticas(resultado: Dict, vehicles: List[Vehicle], classes: List[VehicleClass],
+                        periodo_dias: int) -> Iterator[Dict]:
+    def linha(nivel, chave, nome, reservas, dias, total, ocupacao=None):
+        return {
+            "nivel": nivel, "chave": chave, "nome": nome, "reservas": reservas, "dias": dias,
+            "total": total, "preco_medio_dia": round(total / dias, 2) if dias else 0, "ocupacao": ocupacao,
+        }
+
+    yield linha("global", None, None, resultado["num_reservas"], resultado["dias_alugados_total"],
+                resultado["total_faturado"])
+    nomes = {}
+    for c in classes:
+        nomes.setdefault(c.chave, c.nome)
+    for id_classe, dados in resultado["por_classe"].items():
+        yield linha("classe", id_classe, nomes.get(str(id_classe)), dados["reservas"], dados["dias"], dados["total"])
+    viaturas = {v.matricula: v for v in vehicles}
+    for mat, dados in resultado["por_viatura"].items():
+        v = viaturas.get(mat)
+        yield linha("viatura", mat, f"{v.marca} {v.modelo}" if v else None, dados["reservas"], dados["dias"],
+                    dados["total"], round(dados["dias"] / periodo_dias, 4))
+
+
+def exportar_estatisticas(destino: str, ini: datetime, fim: datetime, bloco: int = BLOCO) -> int:
+    if fim <= ini:
+        raise ValueError("Data fim deve ser posterior à data início.")
+    vehicles = load_vehicles()
+    resultado = calcular_estatisticas_periodo(vehicles, ini, fim)
+    linhas = linhas_estatisticas(resultado, vehicles, load_classes(), (fim - ini).days)
+    return _exportar_tudo(destino, linhas, COLUNAS_ESTATISTICAS, bloco)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta reservas e relatórios para CSV/JSONL (.gz opcional)")
+    parser.add_argument("o_que", choices=("reservas", "extrato", "estatisticas"))
+    parser.add_argument("destino", help="ficheiro .csv, .jsonl, .csv.gz ou .jsonl.gz")
+    parser.add_argument("--desde", help="reservas/estatísticas: data inicial (YYYY-MM-DD)")
+    parser.add_argument("--ate", help="reservas/estatísticas: data final exclusiva (YYYY-MM-DD)")
+    parser.add_argument("--data", help="extrato: dia (YYYY-MM-DD)")
+    parser.add_argument("--bloco", type=int, default=BLOCO, help="linhas escritas de cada vez")
+    parser.add_argument("--recomecar", action="store_true", help="reservas: ignora a marca e reescreve o destino")
+    args = parser.parse_args()
+    try:
+        if args.o_que == "reservas":
+            resultado = exportar_reservas(args.destino, _data(args.desde), _data(args.ate), args.bloco, args.recomecar)
+            print(f"Reservas exportadas: {resultado['reservas']} ({resultado['total']} no ficheiro)")
+            if resultado["data_inicio"]:
+                print(f"Marca: {resultado['data_inicio']}")
+        elif args.o_que == "extrato":
+            if not args.data:
+                parser.error("o extrato precisa de --data")
+            print(f"Reservas do dia exportadas: {exportar_extrato(args.destino, _data(args.data), args.bloco)}")
+        else:
+            if not args.desde or not args.ate:
+                parser.error("as estatísticas precisam de --desde e --ate")
+            n = exportar_estatisticas(args.destino, _data(args.desde), _data(args.ate), args.bloco)
+            print(f"Linhas de estatísticas exportadas: {n}")
+    except ValueError as e:
+        print(f"Erro: {e}")
+        raise SystemExit(1)
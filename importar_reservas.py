@@ -0,0 +1,186 @@
+## Importação em lote de reservas (CSV com cabeçalho ou JSONL)
+## Uso: python importar_reservas.py ficheiro.csv|ficheiro.jsonl [relatorio_rejeicoes.csv]
+## Colunas/campos: email, matricula, data_inicio, data_fim
+import csv
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import bookings_store
+import precos
+from client_menu import load_vehicles, validar_intervalo, construir_indice, atualizar_indice
+from modelos import Booking
+
+CAMPOS = ("email", "matricula", "data_inicio", "data_fim")
+
+
+## Lê as linhas do ficheiro como (nº da linha, registo); o formato vem da extensão
+def ler_linhas(caminho: str) -> Iterator[Tuple[int, Dict]]:
+    ## utf-8-sig: os CSV exportados das folhas de cálculo começam muitas vezes com BOM
+    with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+        if caminho.lower().endswith(".csv"):
+            ## linha 1 é o cabeçalho
+            for n, registo in enumerate(csv.DictReader(f), 2):
+                yield n, registo
+            return
+        for n, linha in enumerate(f, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registo = json.loads(linha)
+            except ValueError:
+                registo = None
+            yield n, registo if isinstance(registo, dict) else None
+
+
+## Verifica cada linha (campos, viatura ativa, regras de validar_intervalo) e cota as válidas
+## de uma só vez com a tabela de preços
+## Devolve (candidatas [(linha, Booking)], rejeitadas [(linha, registo, motivo)])
+def validar_linhas(linhas, viaturas: Dict, tabela: Dict) -> Tuple[List, List]:
+    validas, rejeitadas = [], []
+    max_dias = tabela["max_dias"]
+    for n, registo in linhas:
+        if registo is None:
+            rejeitadas.append((n, {}, "Linha inválida (não é um objeto JSON)."))
+            continue
+        valores = {c: str(registo.get(c) or "").strip() for c in CAMPOS}
+        em_falta = [c for c in CAMPOS if not valores[c]]
+        if em_falta:
+            rejeitadas.append((n, registo, "Campos em falta: " + ", ".join(em_falta)))
+            continue
+
+        viatura = viaturas.get(valores["matricula"])
+        if viatura is None or viatura.estado != "ativo":
+            rejeitadas.append((n, registo, "Matrícula não encontrada ou inativa."))
+            continue
+
+        ok, msg, _ = validar_intervalo(valores["data_inicio"], valores["data_fim"], max_dias)
+        if not ok:
+            rejeitadas.append((n, registo, msg))
+            continue
+        validas.append((n, valores, viatura))
+
+    cotacoes = precos.cotar_lote(
+        tabela, ((viatura, valores["data_inicio"], valores["data_fim"]) for _, valores, viatura in validas)
+    )
+    candidatas = [
+        (n, Booking(
+            email=valores["email"],
+            matricula=valores["matricula"],
+            data_inicio=valores["data_inicio"],
+            data_fim=valores["data_fim"],
+            dias=dias,
+            preco_diario=preco_diario,
+            desconto=desconto,
+            total=total,
+        ))
+        for (n, valores, _), (dias, preco_diario, desconto, total) in zip(validas, cotacoes)
+    ]
+    return candidatas, rejeitadas
+
+
+## Deteção de conflitos num só varrimento ordenado por (matrícula, início):
+## cada linha é comparada com a próxima reserva existente da viatura (ponteiro que só avança)
+## e com a última linha aceite do lote. Em conflito dentro do lote ganha a que começa primeiro.
+def detetar_conflitos(candidatas: List, indice: Dict) -> Tuple[List, List]:
+    aceites, rejeitadas = [], []
+    candidatas = sorted(candidatas, key=lambda c: (c[1].matricula, c[1].inicio, c[0]))
+
+    matricula_atual = None
+    for n, b in candidatas:
+        if b.matricula != matricula_atual:
+            matricula_atual = b.matricula
+            inicios, fins = indice.get(b.matricula, ([], []))
+            j = 0
+            ultimo_fim, ultima_linha = None, None
+
+        while j < len(inicios) and fins[j] <= b.inicio:
+            j += 1
+        if j < len(inicios) and inicios[j] < b.fim:
+            rejeitadas.append((n, b.to_dict(), "Viatura indisponível nesse período."))
+        elif ultimo_fim is not None and b.inicio < ultimo_fim:
+            rejeitadas.append((n, b.to_dict(), f"Sobrepõe a linha {ultima_linha} do ficheiro."))
+        else:
+            aceites.append((n, b))
+            ultimo_fim, ultima_linha = b.fim, n
+    return aceites, rejeitadas
+
+
+## Importa o ficheiro: valida, deteta conflitos e grava todas as aceites numa só escrita
+def importar(caminho: str, estado: Optional[Dict] = None) -> Dict:
+    viaturas = {v.matricula: v for v in load_vehicles()}
+
+    if estado is None:
+        estado = bookings_store.abrir()
+    else:
+        bookings_store.sincronizar(estado)
+    indice = construir_indice(estado["reservas"])
+
+    candidatas, rejeitadas = validar_linhas(ler_linhas(caminho), viaturas, precos.tabela())
+    aceites, conflitos = detetar_conflitos(candidatas, indice)
+    rejeitadas.extend(conflitos)
+
+    ## Revalidar sob bloqueio contra o que outras sessões gravaram entretanto
+    linha_de = {id(b): n for n, b in aceites}
+
+    def filtrar(novas):
+        if novas is None or novas:
+            atualizar_indice(indice, novas, estado["reservas"])
+            ainda, tarde = detetar_conflitos([(n, b) for n, b in aceites], indice)
+            rejeitadas.extend((n, r, "Reservada noutra sessão durante a importação.") for n, r, _ in tarde)
+            return [b for _, b in ainda]
+        return [b for _, b in aceites]
+
+    gravadas = bookings_store.registar_reservas(estado, [b for _, b in aceites], filtrar) if aceites else []
+    rejeitadas.sort(key=lambda r: r[0])
+    return {
+        "aceites": [(linha_de[id(b)], b) for b in gravadas],
+        "rejeitadas": rejeitadas,
+    }
+
+
+## Grava o relatório de rejeições em CSV (linha, campos originais, motivo)
+def gravar_relatorio(caminho: str, rejeitadas: List) -> None:
+    with open(caminho, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(("linha",) + CAMPOS + ("motivo",))
+        for n, registo, motivo in rejeitadas:
+            escritor.writerow((n,) + tuple(registo.get(c, "") for c in CAMPOS) + (motivo,))
+
+
+## Mostra o resumo e as rejeições
+def mostrar_resultado(resultado: Dict) -> None:
+    aceites = resultado["aceites"]
+    rejeitadas = resultado["rejeitadas"]
+    total = round(sum(float(b.total) for _, b in aceites), 2)
+    print(f"Reservas importadas: {len(aceites)} (total {total}€)")
+    print(f"Linhas rejeitadas: {len(rejeitadas)}")
+    for n, _, motivo in rejeitadas:
+        print(f"  linha {n}: {motivo}")
+
+
+## Pede o ficheiro no menu de administrador
+def menu_importar() -> None:
+    caminho = input("Ficheiro a importar (CSV/JSONL): ").strip()
+    if not os.path.isfile(caminho):
+        print("Ficheiro não encontrado.")
+        return
+    resultado = importar(caminho)
+    mostrar_resultado(resultado)
+    if resultado["rejeitadas"]:
+        relatorio = input("Gravar rejeições em CSV (ENTER para não gravar): ").strip()
+        if relatorio:
+            gravar_relatorio(relatorio, resultado["rejeitadas"])
+            print(f"Relatório gravado em {relatorio}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python importar_reservas.py ficheiro.csv|ficheiro.jsonl [relatorio.csv]")
+        sys.exit(1)
+    resultado = importar(sys.argv[1])
+    mostrar_resultado(resultado)
+    if len(sys.argv) > 2:
+        gravar_relatorio(sys.argv[2], resultado["rejeitadas"])
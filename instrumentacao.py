@@ -0,0 +1,175 @@
+## Instrumentação opcional dos caminhos mais usados: nº de chamadas, tempo acumulado,
+## latências p50/p99 e bytes lidos/escritos por função medida
+## Ligada com RENTACAR_PROFILE=1 ou com a opção --profile (main.py, servidor.py);
+## o relatório é mostrado à saída do programa ou a pedido no menu do administrador
+import atexit
+import functools
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+## Nº máximo de latências guardadas por função para os percentis (amostragem por reservatório)
+AMOSTRAS = 10000
+
+_estado = {"ativo": False, "registado": False}
+## nome -> {"chamadas", "total", "amostras", "lidos", "escritos"}
+_metricas: Dict[str, Dict] = {}
+_aleatorio = random.Random(0)
+
+
+def ativo() -> bool:
+    return _estado["ativo"]
+
+
+## Liga a medição; o relatório é mostrado em stderr quando o programa termina
+def ativar(relatorio_na_saida: bool = True) -> None:
+    _estado["ativo"] = True
+    if relatorio_na_saida and not _estado["registado"]:
+        _estado["registado"] = True
+        atexit.register(_relatorio_na_saida)
+
+
+def desativar() -> None:
+    _estado["ativo"] = False
+
+
+## Esquece o que foi medido
+def limpar() -> None:
+    _metricas.clear()
+
+
+def _metrica(nome: str) -> Dict:
+    metrica = _metricas.get(nome)
+    if metrica is None:
+        metrica = _metricas[nome] = {"chamadas": 0, "total": 0.0, "amostras": [], "lidos": 0, "escritos": 0}
+    return metrica
+
+
+def _registar(nome: str, duracao: float) -> None:
+    metrica = _metrica(nome)
+    metrica["chamadas"] += 1
+    metrica["total"] += duracao
+    amostras = metrica["amostras"]
+    if len(amostras) < AMOSTRAS:
+        amostras.append(duracao)
+    else:
+        i = _aleatorio.randrange(metrica["chamadas"])
+        if i < AMOSTRAS:
+            amostras[i] = duracao
+
+
+## Decorador: mede as chamadas da função com esse nome (sem custo além de um teste se desligado)
+def medir(nome: str):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            if not _estado["ativo"]:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                _registar(nome, time.perf_counter() - inicio)
+        return medida
+    return decorador
+
+
+## Decorador para funções que devolvem um iterador (ex.: leitura em fluxo): cada chamada conta o
+## tempo gasto a produzir os elementos, registado quando o iterador acaba ou é fechado
+def medir_iterador(nome: str):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            if not _estado["ativo"]:
+                return funcao(*args, **kwargs)
+            return _iterar_medido(nome, iter(funcao(*args, **kwargs)))
+        return medida
+    return decorador
+
+
+def _iterar_medido(nome: str, iterador):
+    total = 0.0
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                valor = next(iterador)
+            except StopIteration:
+                total += time.perf_counter() - inicio
+                return
+            total += time.perf_counter() - inicio
+            yield valor
+    finally:
+        close = getattr(iterador, "close", None)
+        if close is not None:
+            close()
+        _registar(nome, total)
+
+
+## Soma bytes lidos/escritos à função com esse nome
+def transferidos(nome: str, lidos: int = 0, escritos: int = 0) -> None:
+    if not _estado["ativo"]:
+        return
+    metrica = _metrica(nome)
+    metrica["lidos"] += lidos
+    metrica["escritos"] += escritos
+
+
+## ---------- RELATÓRIO ----------
+
+def _percentil(ordenadas: List[float], p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+
+## Uma linha por função medida (tempos em ms), pelo tempo acumulado
+def relatorio() -> List[Dict]:
+    linhas = []
+    for nome, metrica in _metricas.items():
+        ordenadas = sorted(metrica["amostras"])
+        chamadas = metrica["chamadas"]
+        linhas.append({
+            "nome": nome,
+            "chamadas": chamadas,
+            "total_ms": metrica["total"] * 1000,
+            "media_ms": metrica["total"] * 1000 / chamadas if chamadas else 0.0,
+            "p50_ms": _percentil(ordenadas, 0.50) * 1000,
+            "p99_ms": _percentil(ordenadas, 0.99) * 1000,
+            "bytes_lidos": metrica["lidos"],
+            "bytes_escritos": metrica["escritos"],
+        })
+    linhas.sort(key=lambda linha: linha["total_ms"], reverse=True)
+    return linhas
+
+
+def mostrar_relatorio(saida=None) -> None:
+    saida = saida or sys.stdout
+    linhas = relatorio()
+    print("\n------ Instrumentação ------", file=saida)
+    if not linhas:
+        print("Sem medições.", file=saida)
+        return
+    print(
+        f"{'função':<20} {'chamadas':>9} {'total ms':>10} {'média ms':>9} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'lidos':>12} {'escritos':>12}",
+        file=saida,
+    )
+    for linha in linhas:
+        print(
+            f"{linha['nome']:<20} {linha['chamadas']:>9} {linha['total_ms']:>10.1f} {linha['media_ms']:>9.3f} "
+            f"{linha['p50_ms']:>9.3f} {linha['p99_ms']:>9.3f} {linha['bytes_lidos']:>12} {linha['bytes_escritos']:>12}",
+            file=saida,
+        )
+
+
+def _relatorio_na_saida() -> None:
+    if _metricas:
+        mostrar_relatorio(sys.stderr)
+
+
+## Ligado pelo ambiente
+if os.environ.get("RENTACAR_PROFILE", "") not in ("", "0"):
+    ativar()
@@ -1,25 +1,22 @@
-## Importar utils e menus
-from utils import read_json, save_json
+## Importar store de utilizadores e menus
+## Uso: python main.py [--profile]   (--profile liga a instrumentação, como RENTACAR_PROFILE=1)
+import sys
+
+import instrumentacao
+import users_store
 from client_menu import menu_client
 from admin_menu import menu_admin
 
 ## Função de login
 def login():
-    users = read_json('data/users.json')
     email = input('Enter you email: ')
-    user = None
 
-    ## Procurar user por email
-    for u in users:
-        if u['email'] == email:
-            user = u
-            break
+    ## Procurar user por email (índice email -> user)
+    user = users_store.procurar(email)
 
-    ## Se user não existe -> criar novo user
+    ## Se user não existe -> criar novo user (acrescentado ao journal de utilizadores)
     if user is None:
-        newuser = {'email': email, 'tipo': 'cliente'}
-        users.append(newuser)
-        save_json('data/users.json', users)
+        newuser = users_store.registar({'email': email, 'tipo': 'cliente'})
         return newuser, newuser['tipo']
 
     ## Se for admin -> pedir password
@@ -35,6 +32,9 @@ def login():
     return user, user['tipo']
 
 if __name__ == "__main__":
+    if "--profile" in sys.argv[1:]:
+        instrumentacao.ativar()
+
     while True:
         current_user, user_type = login()
 
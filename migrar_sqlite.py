@@ -0,0 +1,39 @@
+## Migração única dos ficheiros data/*.json (e dos journals de reservas e utilizadores) para SQLite
+## Uso: python migrar_sqlite.py [caminho da base de dados]
+## Depois da migração, arrancar com RENTACAR_BACKEND=sqlite
+import os
+import sys
+
+import bookings_store
+import storage_sqlite
+import users_store
+import utils
+
+
+def migrar(db_file: str = storage_sqlite.DB_FILE) -> dict:
+    ## Ler sempre dos ficheiros JSON, seja qual for o backend configurado
+    utils.BACKEND = "json"
+    storage_sqlite.DB_FILE = db_file
+
+    contagens = {}
+    for ficheiro, tabela in storage_sqlite.TABELAS.items():
+        if tabela == "bookings":
+            ## snapshot + journal, já ordenado por data_inicio
+            registos = [b.to_dict() for b in bookings_store.load_bookings()]
+        elif tabela == "users":
+            ## users.json + clientes registados no journal
+            registos = users_store.load_users()
+        else:
+            registos = utils.read_json(os.path.join("data", ficheiro))
+            if not isinstance(registos, list):
+                registos = []
+        storage_sqlite.gravar_tabela(tabela, registos)
+        contagens[tabela] = len(registos)
+    return contagens
+
+
+if __name__ == "__main__":
+    destino = sys.argv[1] if len(sys.argv) > 1 else storage_sqlite.DB_FILE
+    for tabela, n in migrar(destino).items():
+        print(f"{tabela}: {n} registos")
+    print(f"Migração concluída para {destino}. Use RENTACAR_BACKEND=sqlite para a usar.")
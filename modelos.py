@@ -0,0 +1,213 @@
+from datetime import date, datetime
+from typing import List, Dict, Optional
+
+## FORMATO DA DATA (igual ao dos menus)
+DATE_FMT = "%Y-%m-%d"
+
+## Datas já convertidas (texto "YYYY-MM-DD" válido -> ordinal), no máximo MAXIMO_ORDINAIS:
+## as datas vêm também de pedidos de clientes (servidor), por isso a cache não pode crescer sem limite
+_ordinais = {}
+MAXIMO_ORDINAIS = 1 << 16
+## Tuplos de chaves partilhados entre registos com o mesmo esquema
+_esquemas = {}
+## (tipo, chaves) -> plano de conversão de um dicionário com essas chaves (ver _Registo.from_dict)
+_planos = {}
+
+
+## Converte "YYYY-MM-DD" em ordinal (None se inválida), uma só vez por data distinta
+## As datas já no formato exato usam date.fromisoformat (muito mais rápido que strptime) e ficam
+## na cache; as restantes (ex.: "2024-1-5") passam pelo strptime, como antes, sem ficar na cache
+def ordinal(valor) -> Optional[int]:
+    try:
+        return _ordinais[valor]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+    try:
+        if len(valor) == 10 and valor[4] == "-" and valor[7] == "-":
+            try:
+                resultado = date.fromisoformat(valor).toordinal()
+            except ValueError:
+                return datetime.strptime(valor, DATE_FMT).toordinal()
+        else:
+            return datetime.strptime(valor, DATE_FMT).toordinal()
+    except (TypeError, ValueError):
+        return None
+    if len(_ordinais) < MAXIMO_ORDINAIS:
+        _ordinais[valor] = resultado
+    return resultado
+
+
+## ---------- REGISTOS ----------
+
+## Base dos registos: um slot por campo do JSON, chaves desconhecidas em "extra"
+## e a ordem original das chaves guardada para serializar sem perdas
+class _Registo:
+    __slots__ = ("_chaves", "extra")
+    ## chave no JSON -> atributo
+    CAMPOS: Dict[str, str] = {}
+
+    def __init__(self, **campos):
+        for atributo in self.CAMPOS.values():
+            object.__setattr__(self, atributo, None)
+        extra = None
+        for chave, valor in campos.items():
+            atributo = self.CAMPOS.get(chave)
+            if atributo is None:
+                if extra is None:
+                    extra = {}
+                extra[chave] = valor
+            else:
+                setattr(self, atributo, valor)
+        chaves = tuple(campos)
+        self._chaves = _esquemas.setdefault(chaves, chaves)
+        self.extra = extra
+
+    ## Igual a cls(**data), mas com um plano por esquema de chaves: os atributos de cada chave
+    ## (None = extra) e os que ficam a None são calculados uma só vez por esquema
+    @classmethod
+    def from_dict(cls, data: Dict):
+        chaves = tuple(data)
+        plano = _planos.get((cls, chaves))
+        if plano is None:
+            atributos = tuple(cls.CAMPOS.get(chave) for chave in chaves)
+            em_falta = tuple(a for a in cls.CAMPOS.values() if a not in atributos)
+            plano = _planos[(cls, chaves)] = (
+                atributos, em_falta, None in atributos, _esquemas.setdefault(chaves, chaves)
+            )
+        atributos, em_falta, tem_extra, chaves = plano
+
+        registo = object.__new__(cls)
+        for atributo in em_falta:
+            object.__setattr__(registo, atributo, None)
+        extra = None
+        if tem_extra:
+            for atributo, (chave, valor) in zip(atributos, data.items()):
+                if atributo is None:
+                    if extra is None:
+                        extra = {}
+                    extra[chave] = valor
+                else:
+                    setattr(registo, atributo, valor)
+        else:
+            for atributo, valor in zip(atributos, data.values()):
+                setattr(registo, atributo, valor)
+        registo._chaves = chaves
+        registo.extra = extra
+        return registo
+
+    ## Volta ao dicionário original (mesmas chaves, pela mesma ordem)
+    def to_dict(self) -> Dict:
+        data = {}
+        for chave in self._chaves:
+            atributo = self.CAMPOS.get(chave)
+            data[chave] = self.extra[chave] if atributo is None else getattr(self, atributo)
+        ## Campos preenchidos depois da leitura vão no fim
+        for chave, atributo in self.CAMPOS.items():
+            if chave not in data and getattr(self, atributo) is not None:
+                data[chave] = getattr(self, atributo)
+        return data
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+## Reserva com as datas já convertidas em ordinais (inicio/fim; None se inválidas)
+class Booking(_Registo):
+    __slots__ = (
+        "email", "matricula", "_data_inicio", "_data_fim", "dias",
+        "preco_diario", "desconto", "total", "inicio", "fim",
+    )
+    CAMPOS = {
+        "email": "email",
+        "matricula": "matricula",
+        "data_inicio": "data_inicio",
+        "data_fim": "data_fim",
+        "dias": "dias",
+        "preco_diario": "preco_diario",
+        "desconto": "desconto",
+        "total": "total",
+    }
+
+    @property
+    def data_inicio(self):
+        return self._data_inicio
+
+    @data_inicio.setter
+    def data_inicio(self, valor):
+        self._data_inicio = valor
+        self.inicio = ordinal(valor)
+
+    @property
+    def data_fim(self):
+        return self._data_fim
+
+    @data_fim.setter
+    def data_fim(self, valor):
+        self._data_fim = valor
+        self.fim = ordinal(valor)
+
+
+## Viatura; "classe" é o id da classe normalizado para texto
+class Vehicle(_Registo):
+    __slots__ = ("matricula", "marca", "modelo", "_id_classe", "estado", "classe")
+    CAMPOS = {
+        "matricula": "matricula",
+        "marca": "marca",
+        "modelo": "modelo",
+        "id_classe": "id_classe",
+        "estado": "estado",
+    }
+
+    @property
+    def id_classe(self):
+        return self._id_classe
+
+    @id_classe.setter
+    def id_classe(self, valor):
+        self._id_classe = valor
+        self.classe = None if valor is None else str(valor)
+
+
+## Classe de viaturas; "chave" é o id normalizado para texto
+class VehicleClass(_Registo):
+    __slots__ = ("_id", "nome", "descricao", "preco_diario", "chave")
+    CAMPOS = {
+        "id": "id",
+        "nome": "nome",
+        "descrição": "descricao",
+        "preco_diario": "preco_diario",
+    }
+
+    @property
+    def id(self):
+        return self._id
+
+    @id.setter
+    def id(self, valor):
+        self._id = valor
+        self.chave = None if valor is None else str(valor)
+
+
+## ---------- CONVERSÃO DE LISTAS ----------
+
+## Lista de registos -> lista de dicionários (para gravar)
+def para_dicts(registos: List[_Registo]) -> List[Dict]:
+    return [r.to_dict() for r in registos]
+
+
+## Lista lida do JSON -> registos; reaproveita a conversão enquanto o ficheiro
+## não mudar (read_json devolve o mesmo objeto) - os registos são partilhados
+_convertidos = {}
+
+
+def registos(data, tipo) -> List:
+    if not isinstance(data, list):
+        return []
+    em_cache = _convertidos.get(tipo)
+    if em_cache is not None and em_cache[0] is data:
+        return em_cache[1]
+    lista = [tipo.from_dict(d) for d in data if isinstance(d, dict)]
+    _convertidos[tipo] = (data, lista)
+    return lista
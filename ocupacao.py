@@ -0,0 +1,179 @@
+## Ocupação da frota num período [ini, fim): matriz viaturas x dias (1 = alugada nesse dia)
+## construída a partir das reservas, e as medidas tiradas dela:
+## taxa de ocupação por viatura, por classe e global, maior paragem de cada viatura,
+## pico de viaturas alugadas em simultâneo e viaturas paradas o período todo.
+## Com NumPy a matriz é um array (uma linha por viatura) e as contas são vetoriais;
+## sem ele cada linha é um bytearray.
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import colunas
+from modelos import Booking, Vehicle
+
+## NumPy é opcional (o mesmo de colunas): sem ele usa-se a matriz de bytearray
+np = colunas.np
+
+
+## Dias [a, b) de cada reserva de uma viatura da frota, cortados ao período e relativos a ini
+def _intervalos(bookings: Iterable[Booking], linha_de: Dict[str, int], ini: int, fim: int):
+    for b in bookings:
+        if b.inicio is None or b.fim is None:
+            continue
+        linha = linha_de.get(b.matricula)
+        if linha is None:
+            continue
+        a, z = max(b.inicio, ini), min(b.fim, fim)
+        if a < z:
+            yield linha, a - ini, z - ini
+
+
+## ---------- CONSTRUÇÃO ----------
+
+## Matriz de ocupação das viaturas (pela ordem dada) em [ini, fim) (ordinais):
+## {"matriculas", "ini", "fim", "linhas"} - linhas é um array booleano V x D com NumPy,
+## senão uma lista de bytearray (um byte 0/1 por dia)
+def construir(bookings: Iterable[Booking], matriculas: List[str], ini: int, fim: int) -> Dict:
+    if fim <= ini:
+        raise ValueError("O fim do período deve ser posterior ao início.")
+    dias = fim - ini
+    linha_de = {}
+    for i, mat in enumerate(matriculas):
+        linha_de.setdefault(mat, i)
+
+    if np is not None:
+        ## Reservas em colunas (como nas estatísticas) cortadas ao período; diferenças por linha
+        ## (+1 no início, -1 no fim de cada reserva) somadas com bincount: a soma acumulada
+        ## de cada linha é o nº de reservas ativas em cada dia
+        codigos = {}
+        reservas = colunas.construir_colunas(bookings, codigos)
+        linha_do_codigo = np.array([linha_de.get(mat, -1) for mat in codigos], dtype=np.int64)
+        linhas = linha_do_codigo[reservas["viatura"]] if len(codigos) else reservas["viatura"]
+        inicios = np.maximum(reservas["inicio"], ini) - ini
+        fins = np.minimum(reservas["fim"], fim) - ini
+        sel = (linhas >= 0) & (inicios < fins)
+        largura = dias + 1
+        base = linhas[sel] * largura
+        tamanho = len(matriculas) * largura
+        diferencas = (
+            np.bincount(base + inicios[sel], minlength=tamanho)
+            - np.bincount(base + fins[sel], minlength=tamanho)
+        )
+        ativas = np.cumsum(diferencas.reshape(len(matriculas), largura), axis=1)[:, :dias]
+        ocupadas = ativas > 0
+    else:
+        uns = b"\x01" * dias
+        ocupadas = [bytearray(dias) for _ in matriculas]
+        for linha, a, z in _intervalos(bookings, linha_de, ini, fim):
+            ocupadas[linha][a:z] = uns[:z - a]
+
+    return {"matriculas": list(matriculas), "ini": ini, "fim": fim, "linhas": ocupadas}
+
+
+## ---------- MEDIDAS ----------
+
+## Por viatura: (dias ocupados, maior paragem em dias, início da maior paragem relativo a ini ou None)
+def _por_linha(matriz: Dict) -> List[Tuple[int, int, Optional[int]]]:
+    linhas = matriz["linhas"]
+    dias = matriz["fim"] - matriz["ini"]
+    if not len(linhas):
+        return []
+
+    if np is None:
+        medidas = []
+        for linha in linhas:
+            paragens = bytes(linha).split(b"\x01")
+            maior = max(paragens, key=len)
+            if maior:
+                ## Posição da maior (a primeira, em empate)
+                pos = 0
+                for paragem in paragens:
+                    if paragem is maior:
+                        break
+                    pos += len(paragem) + 1
+                medidas.append((dias - linha.count(0), len(maior), pos))
+            else:
+                medidas.append((dias, 0, None))
+        return medidas
+
+    ## Cada linha entre dois dias ocupados fictícios (-1 e dias): as paragens são os intervalos
+    ## entre dias ocupados consecutivos da mesma linha
+    n = len(linhas)
+    largura = dias + 2
+    com_bordas = np.ones((n, largura), dtype=bool)
+    com_bordas[:, 1:-1] = linhas
+    posicoes = np.flatnonzero(com_bordas)
+    linha_de = posicoes // largura
+    coluna = posicoes % largura
+    ## Paragem que acaba em cada dia ocupado (0 no primeiro de cada linha)
+    paragens = np.diff(coluna, prepend=0) - 1
+    primeiros = np.searchsorted(linha_de, np.arange(n))
+    paragens[primeiros] = 0
+    maiores = np.maximum.reduceat(paragens, primeiros)
+    ## Primeira paragem com o tamanho máximo de cada linha
+    e_maior = (paragens == maiores[linha_de]) & (paragens > 0)
+    linhas_maior, onde = np.unique(linha_de[e_maior], return_index=True)
+    inicio = np.full(n, -1, dtype=np.int64)
+    inicio[linhas_maior] = coluna[e_maior][onde] - paragens[e_maior][onde] - 1
+    ocupados = linhas.sum(axis=1)
+    return [
+        (int(ocupados[i]), int(maiores[i]), int(inicio[i]) if maiores[i] else None)
+        for i in range(n)
+    ]
+
+
+## Nº de viaturas alugadas em cada dia do período
+def _por_dia(matriz: Dict) -> List[int]:
+    linhas = matriz["linhas"]
+    if np is not None:
+        return linhas.sum(axis=0).tolist() if len(linhas) else [0] * (matriz["fim"] - matriz["ini"])
+    if not linhas:
+        return [0] * (matriz["fim"] - matriz["ini"])
+    return [sum(coluna) for coluna in zip(*linhas)]
+
+
+## Relatório de ocupação da matriz; vehicles dá a classe de cada matrícula
+## {"dias", "taxa" (0..1), "pico": {"viaturas", "dia"}, "paradas": [matriculas],
+##  "por_viatura": {mat: {"dias_ocupados", "taxa", "maior_paragem", "inicio_paragem"}},
+##  "por_classe": {id_classe: {"viaturas", "dias_ocupados", "taxa"}}}
+## Os dias são ordinais; inicio_paragem é None se a viatura não teve nenhum dia parada
+def relatorio(matriz: Dict, vehicles: List[Vehicle]) -> Dict:
+    ini = matriz["ini"]
+    dias = matriz["fim"] - ini
+    classe_de = {}
+    for v in vehicles:
+        classe_de.setdefault(v.matricula, v.id_classe)
+
+    resultado = {"dias": dias, "taxa": 0.0, "pico": {"viaturas": 0, "dia": None}, "paradas": [],
+                 "por_viatura": {}, "por_classe": {}}
+    total_ocupados = 0
+    for mat, (ocupados, maior, inicio) in zip(matriz["matriculas"], _por_linha(matriz)):
+        total_ocupados += ocupados
+        resultado["por_viatura"][mat] = {
+            "dias_ocupados": ocupados,
+            "taxa": ocupados / dias,
+            "maior_paragem": maior,
+            "inicio_paragem": None if inicio is None else ini + inicio,
+        }
+        if not ocupados:
+            resultado["paradas"].append(mat)
+        dados = resultado["por_classe"].setdefault(
+            classe_de.get(mat), {"viaturas": 0, "dias_ocupados": 0, "taxa": 0.0}
+        )
+        dados["viaturas"] += 1
+        dados["dias_ocupados"] += ocupados
+
+    for dados in resultado["por_classe"].values():
+        dados["taxa"] = dados["dias_ocupados"] / (dados["viaturas"] * dias)
+    if matriz["matriculas"]:
+        resultado["taxa"] = total_ocupados / (len(matriz["matriculas"]) * dias)
+
+    por_dia = _por_dia(matriz)
+    pico = max(por_dia)
+    if pico:
+        resultado["pico"] = {"viaturas": pico, "dia": ini + por_dia.index(pico)}
+    return resultado
+
+
+## Ocupação da frota em [ini, fim) (ordinais) a partir das reservas
+def ocupacao(bookings: Iterable[Booking], vehicles: List[Vehicle], ini: int, fim: int) -> Dict:
+    matriz = construir(bookings, [v.matricula for v in vehicles], ini, fim)
+    return relatorio(matriz, vehicles)
@@ -0,0 +1,147 @@
+## Estatísticas do histórico em paralelo (ProcessPoolExecutor)
+## As partições do snapshot que intersetam o período são divididas em partes (intervalos de bytes
+## que começam numa reserva); cada processo lê a sua parte e devolve só as células por viatura
+## [cêntimos, reservas, dias, primeira] (como nos resumos mensais), que o processo principal junta.
+## Somando cêntimos (inteiros), a ordem da soma não altera o resultado; "primeira" guarda a posição
+## no histórico para as viaturas e classes saírem pela mesma ordem do caminho em série.
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import resumos
+from bookings_store import (
+    BOOKINGS_FILE, COMPACTING_FILE, JOURNAL_FILE, _chave, _fontes, _iterar_array, _ler_journal, _ordem, _sqlite,
+)
+from modelos import ordinal
+from utils import bloquear, assinatura_ficheiro
+
+## Tamanho máximo (bytes) de cada parte do snapshot (há pelo menos uma parte por processo no total)
+TAMANHO_PARTE = 4 * 1024 * 1024
+
+## Início de uma reserva no snapshot (lista gravada com indent=2: uma reserva por bloco "  {")
+_INICIOS = (b"  {\n", b"  {\r\n")
+
+
+## Soma uma reserva às células por viatura se interseta [ini, fim); primeira é a sua posição no histórico
+def _somar(por_viatura: Dict, b: dict, ini: int, fim: int, primeira: list) -> None:
+    inicio = ordinal(b.get("data_inicio"))
+    termo = ordinal(b.get("data_fim"))
+    if inicio is None or termo is None:
+        return
+    dias = min(termo, fim) - max(inicio, ini)
+    if dias <= 0:
+        return
+    dados = resumos.celula_viatura(por_viatura, b.get("matricula"), primeira)
+    dados[0] += resumos.em_centimos(b.get("total"))
+    dados[1] += 1
+    dados[2] += dias
+
+
+## Divide um ficheiro do snapshot em n partes [inicio, fim) de bytes (menos se as reservas
+## forem poucas); None se o ficheiro não tem o formato gravado pela aplicação
+## (nesse caso usa-se o caminho em série)
+def _dividir(filename: str, assinatura, n: int) -> Optional[List[Tuple[int, int]]]:
+    with open(filename, "rb") as f:
+        st = os.fstat(f.fileno())
+        if (st.st_ino, st.st_mtime_ns, st.st_size) != assinatura:
+            return None
+        if f.readline().strip() != b"[":
+            return None
+        primeiro = f.tell()
+        linha = f.readline()
+        ## Partição vazia
+        if linha.strip() == b"]":
+            return []
+        if linha not in _INICIOS:
+            return None
+
+        tamanho = st.st_size
+        limites = [primeiro]
+        for k in range(1, n):
+            f.seek(primeiro + (tamanho - primeiro) * k // n)
+            f.readline()
+            pos = f.tell()
+            linha = f.readline()
+            while linha and linha not in _INICIOS:
+                pos = f.tell()
+                linha = f.readline()
+            if linha and pos > limites[-1]:
+                limites.append(pos)
+        limites.append(tamanho)
+    return list(zip(limites, limites[1:]))
+
+
+## Trabalho de cada processo: células por viatura das reservas da parte [inicio, fim) de um ficheiro
+## do snapshot que intersetam o período e as chaves das reservas dos journals que lá aparecem.
+## tarefa é o nº da parte (as partes estão pela ordem do histórico)
+def _ler_parte(filename: str, assinatura, inicio: int, fim: int, ini: int, fim_periodo: int,
+               chaves_journal: set, tarefa: int):
+    with open(filename, "rb") as f:
+        st = os.fstat(f.fileno())
+        ## O snapshot foi substituído depois de dividido
+        if (st.st_ino, st.st_mtime_ns, st.st_size) != assinatura:
+            return None
+        f.seek(inicio)
+        texto = f.read(fim - inicio).decode("utf-8")
+
+    por_viatura, vistas = {}, []
+    for i, b in enumerate(_iterar_array(io.StringIO("[" + texto))):
+        if chaves_journal and _chave(b) in chaves_journal:
+            vistas.append(_chave(b))
+        _somar(por_viatura, b, ini, fim_periodo, [_ordem(b), 0, tarefa, i])
+    return por_viatura, vistas
+
+
+## Estatísticas das reservas do histórico que intersetam [ini, fim) (ordinais), no formato de
+## calcular_estatisticas; None se não for possível ler em paralelo
+## (backend sqlite, snapshot noutro formato ou substituído durante a leitura)
+def estatisticas_do_periodo(ini: int, fim: int, processos: int, mapa_classe_por_mat: Dict) -> Optional[Dict]:
+    if _sqlite():
+        return None
+    with bloquear(BOOKINGS_FILE, partilhado=True):
+        ficheiros = [(filename, assinatura_ficheiro(filename)) for _, filename in _fontes(ini, fim)]
+        pendentes, _ = _ler_journal(COMPACTING_FILE)
+        novas, _ = _ler_journal(JOURNAL_FILE)
+
+    ## Partes proporcionais ao tamanho de cada ficheiro
+    existentes = [(filename, assinatura) for filename, assinatura in ficheiros if assinatura is not None]
+    tamanho_total = sum(assinatura[2] for _, assinatura in existentes) or 1
+    tarefas = []
+    for filename, assinatura in existentes:
+        tamanho = assinatura[2]
+        n = max(-(-processos * tamanho // tamanho_total), -(-tamanho // TAMANHO_PARTE), 1)
+        partes = _dividir(filename, assinatura, n)
+        if partes is None:
+            return None
+        tarefas.extend((filename, assinatura, a, b) for a, b in partes)
+
+    chaves_journal = {_chave(b) for b in pendentes + novas}
+    resultados = []
+    if tarefas:
+        with ProcessPoolExecutor(processos) as executor:
+            resultados = list(executor.map(
+                _ler_parte,
+                *zip(*(
+                    (filename, assinatura, a, b, ini, fim, chaves_journal, tarefa)
+                    for tarefa, (filename, assinatura, a, b) in enumerate(tarefas)
+                )),
+            ))
+    if any(r is None for r in resultados):
+        return None
+
+    por_viatura = {}
+    for celulas, _ in resultados:
+        for mat, (centimos, reservas, dias, primeira) in celulas.items():
+            dados = resumos.celula_viatura(por_viatura, mat, primeira)
+            dados[0] += centimos
+            dados[1] += reservas
+            dados[2] += dias
+
+    ## Reservas dos journals que não estão no snapshot, depois dele em empate (como em iterar_reservas)
+    vistas = {chave for _, chaves in resultados for chave in chaves}
+    for origem, journal in ((1, pendentes), (2, novas)):
+        journal = sorted((b for b in journal if _chave(b) not in vistas), key=_ordem)
+        for i, b in enumerate(journal):
+            _somar(por_viatura, b, ini, fim, [_ordem(b), origem, 0, i])
+    return resumos.relatorio(por_viatura, mapa_classe_por_mat)
@@ -0,0 +1,108 @@
+## Tabela de preços compilada a partir de classes.json e settings.json:
+## {"por_classe": {chave da classe: preço diário}, "escaloes": [(até dias, desconto, fator)],
+##  "max_dias": max_dias_reserva}
+## tabela() só volta a compilar quando os ficheiros mudam (read_json devolve os mesmos objetos)
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from modelos import Vehicle, VehicleClass, ordinal, registos
+from utils import read_json
+
+CLASSES_FILE = "data/classes.json"
+SETTINGS_FILE = "data/settings.json"
+
+## Escalões de desconto por ordem: (chave em settings["descontos"], até quantos dias, desconto por omissão)
+ESCALOES = (
+    ("ate_3_dias", 3, 0),
+    ("de_4_a_7_dias", 7, 10),
+    ("mais_de_7_dias", None, 20),
+)
+
+## Cotação de uma reserva: (dias, preço diário, desconto, total)
+Cotacao = Tuple[int, float, float, float]
+
+## Última compilação (pelos objetos de origem)
+_compilada = {"classes": None, "definicoes": None, "tabela": None}
+_por_classe = {"classes": None, "precos": None}
+
+
+## ---------- COMPILAÇÃO ----------
+
+## Preço diário por chave da classe (com ids repetidos ganha a primeira classe)
+## Reaproveitado enquanto a lista de classes for a mesma (load_classes devolve a mesma lista)
+def por_classe(classes: List[VehicleClass]) -> Dict[str, float]:
+    if _por_classe["classes"] is not classes:
+        precos = {}
+        for cls in classes:
+            precos.setdefault(cls.chave, float(cls.preco_diario or 0))
+        _por_classe["classes"] = classes
+        _por_classe["precos"] = precos
+    return _por_classe["precos"]
+
+
+## Escalões de desconto das definições: [(até dias ou None, desconto, fator)]
+def escaloes(defs: Dict) -> List[Tuple[Optional[int], float, float]]:
+    descontos = defs.get("descontos", {})
+    lista = []
+    for chave, limite, omissao in ESCALOES:
+        desconto = descontos.get(chave, omissao)
+        lista.append((limite, desconto, 1 - desconto / 100))
+    return lista
+
+
+def compilar(classes: List[VehicleClass], defs: Dict) -> Dict:
+    return {
+        "por_classe": por_classe(classes),
+        "escaloes": escaloes(defs),
+        "max_dias": defs.get("max_dias_reserva"),
+    }
+
+
+## Tabela dos ficheiros atuais
+def tabela() -> Dict:
+    classes = read_json(CLASSES_FILE)
+    definicoes = read_json(SETTINGS_FILE)
+    if _compilada["classes"] is not classes or _compilada["definicoes"] is not definicoes:
+        defs = definicoes[0] if isinstance(definicoes, list) and definicoes else {}
+        _compilada["tabela"] = compilar(registos(classes, VehicleClass), defs)
+        _compilada["classes"] = classes
+        _compilada["definicoes"] = definicoes
+    return _compilada["tabela"]
+
+
+## ---------- COTAÇÕES ----------
+
+## (desconto, fator) do escalão de uma reserva com esse nº de dias
+def escalao(lista: List[Tuple[Optional[int], float, float]], dias: int) -> Tuple[float, float]:
+    for limite, desconto, fator in lista:
+        if limite is None or dias <= limite:
+            return desconto, fator
+    return 0, 1
+
+
+## Preço de uma reserva da classe (chave) com esse nº de dias: (preço diário, desconto, total)
+def cotar(tabela: Dict, classe: str, dias: int) -> Tuple[float, float, float]:
+    preco_diario = tabela["por_classe"].get(classe, 0.0)
+    desconto, fator = escalao(tabela["escaloes"], dias)
+    return preco_diario, desconto, round(dias * preco_diario * fator, 2)
+
+
+## Cota vários pedidos (viatura, data_inicio, data_fim) de uma vez: por pedido a Cotacao,
+## ou None se o intervalo não é válido (datas, fim <= início ou acima de max_dias)
+## Pedidos da mesma classe com o mesmo nº de dias são calculados uma só vez
+def cotar_lote(tabela: Dict, pedidos: Iterable[Tuple[Vehicle, str, str]]) -> List[Optional[Cotacao]]:
+    max_dias = tabela["max_dias"]
+    calculadas = {}
+    cotacoes = []
+    for viatura, data_inicio, data_fim in pedidos:
+        inicio = ordinal(data_inicio)
+        fim = ordinal(data_fim)
+        if inicio is None or fim is None or fim <= inicio or (max_dias is not None and fim - inicio > max_dias):
+            cotacoes.append(None)
+            continue
+        dias = fim - inicio
+        chave = (viatura.classe, dias)
+        cotacao = calculadas.get(chave)
+        if cotacao is None:
+            cotacao = calculadas[chave] = (dias,) + cotar(tabela, viatura.classe, dias)
+        cotacoes.append(cotacao)
+    return cotacoes
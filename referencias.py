@@ -0,0 +1,73 @@
+## Índices inversos para a integridade referencial nas remoções do administrador:
+## - id da classe -> matrículas das viaturas dessa classe;
+## - chave das classes (para validar mudanças de classe);
+## - matrícula -> reservas ativas ou futuras (data_fim depois de hoje).
+## Os dois primeiros são refeitos só quando a lista lida muda (read_json devolve a mesma lista
+## enquanto o ficheiro não muda); o das reservas acompanha o histórico de forma incremental
+## (bookings_store.sincronizar), lendo só as partições a partir de hoje.
+from datetime import date
+from typing import Dict, List, Set
+
+import bookings_store
+from modelos import Booking, Vehicle, VehicleClass
+
+_por_classe = {"vehicles": None, "indice": {}}
+_chaves = {"classes": None, "chaves": set()}
+_futuras = {"estado": None, "dia": None, "por_matricula": {}}
+
+
+## ---------- FROTA E CLASSES ----------
+
+## Matrículas das viaturas de cada classe (pela chave da classe)
+def viaturas_por_classe(vehicles: List[Vehicle]) -> Dict[str, List[str]]:
+    if _por_classe["vehicles"] is not vehicles:
+        indice = {}
+        for v in vehicles:
+            indice.setdefault(v.classe, []).append(v.matricula)
+        _por_classe["vehicles"] = vehicles
+        _por_classe["indice"] = indice
+    return _por_classe["indice"]
+
+
+def viaturas_da_classe(vehicles: List[Vehicle], id_classe) -> List[str]:
+    return viaturas_por_classe(vehicles).get(str(id_classe), [])
+
+
+## Chaves das classes existentes
+def chaves_classes(classes: List[VehicleClass]) -> Set[str]:
+    if _chaves["classes"] is not classes:
+        _chaves["classes"] = classes
+        _chaves["chaves"] = {c.chave for c in classes}
+    return _chaves["chaves"]
+
+
+## ---------- RESERVAS ATIVAS OU FUTURAS ----------
+
+def _indexar(reservas: List[Booking], hoje: int) -> None:
+    por_matricula = _futuras["por_matricula"]
+    for b in reservas:
+        if b.fim is not None and b.fim > hoje:
+            por_matricula.setdefault(b.matricula, []).append(b)
+
+
+## Traz o índice para o estado atual do histórico: reconstruído ao mudar de dia ou quando
+## o histórico foi reescrito; senão junta só as reservas novas
+def _atualizar() -> None:
+    hoje = date.today().toordinal()
+    if _futuras["estado"] is None or _futuras["dia"] != hoje:
+        _futuras["estado"] = bookings_store.abrir(hoje, None)
+        _futuras["dia"] = hoje
+        novas = None
+    else:
+        novas = bookings_store.sincronizar(_futuras["estado"])
+    if novas is None:
+        _futuras["por_matricula"] = {}
+        _indexar(_futuras["estado"]["reservas"], hoje)
+    else:
+        _indexar(novas, hoje)
+
+
+## Reservas ativas ou futuras da viatura (por ordem de data_inicio)
+def reservas_futuras(matricula: str) -> List[Booking]:
+    _atualizar()
+    return sorted(_futuras["por_matricula"].get(matricula, []), key=lambda b: b.data_inicio or "")
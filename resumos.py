@@ -0,0 +1,167 @@
+## Resumos mensais das reservas para as estatísticas
+## Um resumo é {"YYYY-MM": {matricula: [cêntimos, reservas, dias, primeira]}}:
+## - faturação (em cêntimos) e nº de reservas contam no mês de data_inicio;
+## - dias alugados são repartidos pelos meses que a reserva ocupa;
+## - "primeira" é a posição no histórico da primeira reserva da célula, [data_inicio, origem, índice]
+##   (origem 0 = partição, 1 = journal), para apresentar as viaturas pela ordem do histórico.
+## A classe de cada viatura não é guardada: vem da frota no momento da consulta.
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+from modelos import Booking, ordinal
+
+
+## ---------- MESES ----------
+
+## "YYYY-MM" do dia (ordinal)
+def mes_de(dia: int) -> str:
+    d = date.fromordinal(dia)
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+## Primeiro dia (ordinal) do mês seguinte ao do dia
+def mes_seguinte(dia: int) -> int:
+    d = date.fromordinal(dia)
+    if d.month == 12:
+        return date(d.year + 1, 1, 1).toordinal()
+    return date(d.year, d.month + 1, 1).toordinal()
+
+
+## Meses inteiros dentro de [ini, fim) como [a, b) (ordinais); None se não houver nenhum
+def meses_inteiros(ini: int, fim: int) -> Optional[Tuple[int, int]]:
+    a = ini if date.fromordinal(ini).day == 1 else mes_seguinte(ini)
+    b = a
+    while mes_seguinte(b) <= fim:
+        b = mes_seguinte(b)
+    return (a, b) if a < b else None
+
+
+## ---------- CONSTRUÇÃO ----------
+
+## Valor em cêntimos: todas as estatísticas somam cêntimos (inteiros), por isso o total de um
+## período é o mesmo seja qual for o caminho que o calcula
+def em_centimos(total) -> int:
+    return round(float(total or 0) * 100)
+
+
+## Célula de uma viatura em {matricula: [cêntimos, reservas, dias, primeira]} (criada se não existe;
+## fica com a primeira posição no histórico das duas)
+def celula_viatura(por_viatura: Dict, mat, primeira: list) -> list:
+    dados = por_viatura.get(mat)
+    if dados is None:
+        dados = por_viatura[mat] = [0, 0, 0, primeira]
+    elif primeira < dados[3]:
+        dados[3] = primeira
+    return dados
+
+
+def _celula(resumo: Dict, mes: str, mat, primeira: list) -> list:
+    return celula_viatura(resumo.setdefault(mes, {}), mat, primeira)
+
+
+## Resumo de uma lista de reservas (dicionários, como no journal e nas partições),
+## pela ordem em que estão no histórico
+def resumir(registos: Iterable[Dict], origem: int = 0) -> Dict:
+    resumo = {}
+    for i, b in enumerate(registos):
+        inicio = ordinal(b.get("data_inicio"))
+        termo = ordinal(b.get("data_fim"))
+        if inicio is None or termo is None or termo <= inicio:
+            continue
+        mat = b.get("matricula")
+        primeira = [b["data_inicio"], origem, i]
+
+        celula = _celula(resumo, mes_de(inicio), mat, primeira)
+        celula[0] += em_centimos(b.get("total"))
+        celula[1] += 1
+
+        dia = inicio
+        while dia < termo:
+            seguinte = min(mes_seguinte(dia), termo)
+            _celula(resumo, mes_de(dia), mat, primeira)[2] += seguinte - dia
+            dia = seguinte
+    return resumo
+
+
+## Soma o resumo origem ao destino (as células do destino são sempre cópias)
+def juntar(destino: Dict, origem: Dict) -> Dict:
+    for mes, celulas in origem.items():
+        for mat, (centimos, reservas, dias, primeira) in celulas.items():
+            celula = _celula(destino, mes, mat, primeira)
+            celula[0] += centimos
+            celula[1] += reservas
+            celula[2] += dias
+    return destino
+
+
+## ---------- CONSULTA ----------
+
+## Estatísticas de [ini, fim) (ordinais) no formato de calcular_estatisticas:
+## os meses inteiros vêm do resumo; as reservas das bordas (parte do período fora dos meses
+## inteiros, ou que começam antes deles) são percorridas uma a uma.
+## bordas deve trazer cada reserva uma só vez: as que começam antes dos meses inteiros
+## e terminam depois de ini, mais as que começam depois deles e antes de fim.
+## Faturação somada em cêntimos; viaturas e classes pela ordem do histórico, como no cálculo completo.
+def agregar(resumo: Dict, ini: int, fim: int, bordas: Iterable[Booking], mapa_classe_por_mat: Dict) -> Dict:
+    a, b = meses_inteiros(ini, fim)
+    por_viatura = {}
+    ## Meses inteiros
+    dia = a
+    while dia < b:
+        for mat, (centimos, reservas, dias, primeira) in resumo.get(mes_de(dia), {}).items():
+            dados = celula_viatura(por_viatura, mat, primeira)
+            dados[0] += centimos
+            dados[1] += reservas
+            dados[2] += dias
+        dia = mes_seguinte(dia)
+
+    ## Bordas, pela ordem do histórico. As que começam fora dos meses inteiros contam com a sua
+    ## posição na sequência (antes de células com a mesma data: essas vêm das mesmas reservas);
+    ## as que começam dentro deles já estão nas células e só acrescentam dias
+    for seq, r in enumerate(bordas):
+        if r.inicio is None or r.fim is None or r.fim <= r.inicio:
+            continue
+        if r.fim <= ini or fim <= r.inicio:
+            continue
+        dias = max(0, min(r.fim, a) - max(r.inicio, ini)) + max(0, min(r.fim, fim) - max(r.inicio, b))
+        conta = not a <= r.inicio < b
+        if not conta and not dias:
+            continue
+        dados = celula_viatura(por_viatura, r.matricula, [r.data_inicio, -1 if conta else 2, seq])
+        if conta:
+            dados[0] += em_centimos(r.total)
+            dados[1] += 1
+        dados[2] += dias
+
+    return relatorio(por_viatura, mapa_classe_por_mat)
+
+
+## Estatísticas no formato de calcular_estatisticas a partir das células por viatura
+## {matricula: [cêntimos, reservas, dias, primeira]}: viaturas e classes pela ordem de "primeira"
+def relatorio(por_viatura: Dict, mapa_classe_por_mat: Dict) -> Dict:
+    resultado = {
+        "total_faturado": 0.0,
+        "num_reservas": 0,
+        "dias_alugados_total": 0,
+        "por_classe": {},
+        "por_viatura": {},
+    }
+    centimos_total = 0
+    por_classe = {}
+    for mat, (centimos, reservas, dias, _) in sorted(por_viatura.items(), key=lambda item: item[1][3]):
+        centimos_total += centimos
+        resultado["num_reservas"] += reservas
+        resultado["dias_alugados_total"] += dias
+        resultado["por_viatura"][mat] = {"total": centimos / 100, "reservas": reservas, "dias": dias}
+
+        id_classe = mapa_classe_por_mat.get(mat)
+        if id_classe is not None:
+            dados = por_classe.setdefault(id_classe, [0, 0, 0])
+            dados[0] += centimos
+            dados[1] += reservas
+            dados[2] += dias
+
+    resultado["total_faturado"] = centimos_total / 100
+    for id_classe, (centimos, reservas, dias) in por_classe.items():
+        resultado["por_classe"][id_classe] = {"total": centimos / 100, "reservas": reservas, "dias": dias}
+    return resultado
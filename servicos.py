@@ -0,0 +1,204 @@
+## Camada de serviço: as operações dos menus sem input()/print()
+## Os erros de validação são ValueError com a mesma mensagem que os menus mostram
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import bookings_store
+import precos
+import users_store
+from admin_menu import calcular_estatisticas, calcular_extrato, construir_indice_diario, indexar_dia
+from client_menu import (
+    load_definitions, load_vehicles, load_classes, parse_date, validar_intervalo,
+    construir_indice, indexar_reserva, atualizar_indice, esta_disponivel, procurar_disponiveis,
+)
+from modelos import Booking, Vehicle
+
+## Pedido de reserva: (email, matricula, data_inicio, data_fim)
+Pedido = Tuple[str, str, str, str]
+
+
+## ---------- CONTEXTO ----------
+
+## Abre o histórico uma vez: {"estado": sessão do bookings_store, "indice": por matrícula,
+## "dias": índice diário (construído no primeiro extrato)}
+## Catálogo e definições são lidos a cada pedido (read_json revalida pela assinatura do ficheiro)
+def abrir() -> Dict:
+    estado = bookings_store.abrir()
+    return {"estado": estado, "indice": construir_indice(estado["reservas"]), "dias": None}
+
+
+## Aplica aos índices as reservas novas (novas=None -> histórico recarregado)
+def _aplicar(contexto: Dict, novas: Optional[List[Booking]]) -> None:
+    reservas = contexto["estado"]["reservas"]
+    atualizar_indice(contexto["indice"], novas, reservas)
+    if contexto["dias"] is None:
+        return
+    if novas is None:
+        contexto["dias"] = construir_indice_diario(reservas)
+    else:
+        for b in novas:
+            indexar_dia(contexto["dias"], b)
+
+
+## Traz o contexto para a versão atual do histórico (reservas de outros processos)
+def sincronizar(contexto: Dict) -> None:
+    _aplicar(contexto, bookings_store.sincronizar(contexto["estado"]))
+
+
+## ---------- UTILIZADORES ----------
+
+## Entra com o email (cria cliente se não existir); administradores precisam da password
+def autenticar(email: str, senha: Optional[str] = None) -> Dict:
+    if not email:
+        raise ValueError("Email em falta.")
+    user = users_store.procurar(email)
+    if user is None:
+        return users_store.registar({"email": email, "tipo": "cliente"})
+    if user.get("tipo") == "admin" and senha != user.get("senha"):
+        raise ValueError("Password incorreto!")
+    return user
+
+
+## ---------- CLIENTE ----------
+
+## Viaturas ativas
+def listar_carros() -> List[Vehicle]:
+    return [c for c in load_vehicles() if c.estado == "ativo"]
+
+
+def disponivel(contexto: Dict, matricula: str, data_inicio: str, data_fim: str) -> bool:
+    sincronizar(contexto)
+    return esta_disponivel(matricula, data_inicio, data_fim, contexto["indice"])
+
+
+## Viaturas livres em [data_inicio, data_fim) com o preço: [(viatura, desconto, total)]
+def procurar(contexto: Dict, data_inicio: str, data_fim: str, id_classe=None) -> List[Tuple[Vehicle, float, float]]:
+    sincronizar(contexto)
+    return procurar_disponiveis(
+        load_vehicles(), load_classes(), load_definitions(), contexto["indice"],
+        data_inicio, data_fim, id_classe,
+    )
+
+
+## Valida um pedido e calcula o preço (sem ver a disponibilidade)
+def _preparar(pedido: Pedido, ativos: Dict[str, Vehicle], tabela: Dict) -> Booking:
+    email, matricula, data_inicio, data_fim = pedido
+    viatura = ativos.get(matricula)
+    if viatura is None:
+        raise ValueError("Matrícula não encontrada ou inativa.")
+    ok, msg, dias = validar_intervalo(data_inicio, data_fim, tabela["max_dias"])
+    if not ok:
+        raise ValueError(msg)
+    preco_diario, desconto, total = precos.cotar(tabela, viatura.classe, dias)
+    return Booking(
+        email=email,
+        matricula=matricula,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        dias=dias,
+        preco_diario=preco_diario,
+        desconto=desconto,
+        total=total,
+    )
+
+
+## Reserva vários pedidos numa só escrita (por ordem de chegada: em conflito ganha o primeiro)
+## Devolve, por pedido, (reserva gravada, "") ou (None, motivo)
+def reservar_lote(contexto: Dict, pedidos: List[Pedido]) -> List[Tuple[Optional[Booking], str]]:
+    ativos = {c.matricula: c for c in listar_carros()}
+    tabela = precos.tabela()
+
+    resultados = [(None, "")] * len(pedidos)
+    candidatas = []
+    for i, pedido in enumerate(pedidos):
+        try:
+            candidatas.append((i, _preparar(pedido, ativos, tabela)))
+        except ValueError as e:
+            resultados[i] = (None, str(e))
+
+    ## Sob bloqueio: índice atualizado com as outras sessões e as candidatas anteriores do lote
+    def filtrar(novas: Optional[List[Booking]]) -> List[Booking]:
+        _aplicar(contexto, novas)
+        aceites = []
+        no_lote = {}
+        for i, b in candidatas:
+            livre = esta_disponivel(b.matricula, b.data_inicio, b.data_fim, contexto["indice"]) and all(
+                fim <= b.inicio or b.fim <= ini for ini, fim in no_lote.get(b.matricula, ())
+            )
+            if livre:
+                no_lote.setdefault(b.matricula, []).append((b.inicio, b.fim))
+                aceites.append(b)
+                resultados[i] = (b, "")
+            else:
+                resultados[i] = (None, "Viatura indisponível nesse período.")
+        return aceites
+
+    if candidatas:
+        gravadas = bookings_store.registar_reservas(contexto["estado"], [b for _, b in candidatas], filtrar)
+        for b in gravadas:
+            indexar_reserva(contexto["indice"], b)
+            if contexto["dias"] is not None:
+                indexar_dia(contexto["dias"], b)
+    return resultados
+
+
+## Uma reserva; ValueError com o motivo se não for possível
+def reservar(contexto: Dict, email: str, matricula: str, data_inicio: str, data_fim: str) -> Booking:
+    reserva, motivo = reservar_lote(contexto, [(email, matricula, data_inicio, data_fim)])[0]
+    if reserva is None:
+        raise ValueError(motivo)
+    return reserva
+
+
+## Reservas de um cliente (ordenadas por data_inicio)
+def historico(contexto: Dict, email: str) -> List[Booking]:
+    sincronizar(contexto)
+    return [b for b in contexto["estado"]["reservas"] if b.email == email]
+
+
+## Página do histórico de um cliente, da mais recente para a mais antiga, opcionalmente só com
+## as reservas que intersetam [data_inicio, data_fim): {"reservas", "total", "pagina", "paginas"}
+## Lida do histórico em disco pelo índice por email (não percorre as reservas em memória)
+def pagina_historico(email: str, pagina: int = 1, por_pagina: int = 10,
+                     data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> Dict:
+    try:
+        pagina, por_pagina = int(pagina), int(por_pagina)
+    except (TypeError, ValueError):
+        raise ValueError("Página inválida.")
+    ini = None if data_inicio is None else _data(data_inicio).toordinal()
+    fim = None if data_fim is None else _data(data_fim).toordinal()
+    reservas, total = bookings_store.historico_cliente(email, pagina, por_pagina, ini, fim)
+    return {
+        "reservas": reservas,
+        "total": total,
+        "pagina": pagina,
+        "paginas": (total + por_pagina - 1) // por_pagina,
+    }
+
+
+## ---------- ADMINISTRADOR ----------
+
+def _data(valor: str) -> datetime:
+    try:
+        return parse_date(valor)
+    except (TypeError, ValueError):
+        raise ValueError("Data inválida. Use o formato YYYY-MM-DD.")
+
+
+## Extrato de um dia: {"reservas", "total", "dias", "por_classe"}
+def extrato(contexto: Dict, data: str) -> Dict:
+    dia = _data(data).toordinal()
+    sincronizar(contexto)
+    if contexto["dias"] is None:
+        contexto["dias"] = construir_indice_diario(contexto["estado"]["reservas"])
+    return calcular_extrato(contexto["dias"].get(dia, []), load_vehicles())
+
+
+## Estatísticas das reservas que intersetam [data_inicio, data_fim)
+def estatisticas(contexto: Dict, data_inicio: str, data_fim: str) -> Dict:
+    ini = _data(data_inicio)
+    fim = _data(data_fim)
+    if fim <= ini:
+        raise ValueError("Data fim deve ser posterior à data início.")
+    sincronizar(contexto)
+    return calcular_estatisticas(contexto["estado"]["reservas"], load_vehicles(), ini, fim)
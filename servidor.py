@@ -0,0 +1,209 @@
+## Servidor de reservas assíncrono (JSON lines) sobre a camada de serviço
+## Uso: python servidor.py [--host 127.0.0.1] [--porta 8765] | [--socket /tmp/rentacar.sock] [--profile]
+## Cada linha é um pedido {"id": 1, "op": "...", ...}; a resposta tem o mesmo "id" e
+## {"ok": true, "resultado": ...} ou {"ok": false, "erro": "..."}
+## Operações: ping, login (email[, senha]), carros, disponivel, procurar, reservar,
+##            historico ([pagina, por_pagina, data_inicio, data_fim]),
+##            extrato (admin), estatisticas (admin)
+import argparse
+import asyncio
+import functools
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import instrumentacao
+import servicos
+
+## Nº máximo de reservas gravadas numa só escrita pelo escritor
+LOTE_MAXIMO = 256
+## Ligações pendentes aceites pelo socket (muitas sessões a ligar ao mesmo tempo)
+LIGACOES_PENDENTES = 1024
+
+
+## Converte registos (Booking/Vehicle) e tuplos para JSON
+def _para_json(valor):
+    if hasattr(valor, "to_dict"):
+        return valor.to_dict()
+    raise TypeError(f"{type(valor).__name__} não é serializável")
+
+
+## Campo de texto do pedido; ValueError se falta (obrigatório) ou não é texto
+def _campo(pedido: Dict, nome: str, obrigatorio: bool = True) -> Optional[str]:
+    valor = pedido.get(nome)
+    if valor is None and not obrigatorio:
+        return None
+    if not isinstance(valor, str):
+        raise ValueError(f"Campo em falta ou inválido: {nome}.")
+    return valor
+
+
+def _utilizador(sessao: Dict) -> Dict:
+    user = sessao.get("user")
+    if user is None:
+        raise ValueError("Faça login primeiro.")
+    return user
+
+
+## Estado partilhado: contexto do serviço (em memória), fila do escritor e a thread do serviço.
+## As chamadas ao serviço bloqueiam (flock, fsync, agregações sobre o histórico) e o contexto
+## não é partilhável entre threads: correm todas, por ordem, numa só thread fora do ciclo
+class Servidor:
+    def __init__(self):
+        self.contexto = servicos.abrir()
+        self.fila: asyncio.Queue = asyncio.Queue()
+        self.servico = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servico")
+
+    async def _no_servico(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.servico, functools.partial(funcao, *args))
+
+    ## Escritor único: junta os pedidos de reserva pendentes e grava-os numa só escrita
+    ## Se o lote falhar, cada pedido é gravado sozinho: um pedido com erro não faz falhar os outros
+    async def escritor(self) -> None:
+        while True:
+            lote: List[Tuple[servicos.Pedido, asyncio.Future]] = [await self.fila.get()]
+            while len(lote) < LOTE_MAXIMO and not self.fila.empty():
+                lote.append(self.fila.get_nowait())
+            pedidos = [p for p, _ in lote]
+            try:
+                resultados = await self._no_servico(servicos.reservar_lote, self.contexto, pedidos)
+            except Exception:
+                resultados = []
+                for pedido in pedidos:
+                    try:
+                        resultados.append((await self._no_servico(servicos.reservar_lote, self.contexto, [pedido]))[0])
+                    except Exception as e:
+                        resultados.append(e)
+            for (_, futuro), resultado in zip(lote, resultados):
+                if futuro.done():
+                    continue
+                if isinstance(resultado, Exception):
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+
+    async def reservar(self, email: str, matricula: str, data_inicio: str, data_fim: str):
+        futuro = asyncio.get_running_loop().create_future()
+        await self.fila.put(((email, matricula, data_inicio, data_fim), futuro))
+        reserva, motivo = await futuro
+        if reserva is None:
+            raise ValueError(motivo)
+        return reserva
+
+    ## Executa um pedido da sessão: as reservas passam pelo escritor, o resto corre na thread do serviço
+    async def executar(self, sessao: Dict, pedido: Dict):
+        op = pedido.get("op")
+        if op == "ping":
+            return "pong"
+        if op == "reservar":
+            user = _utilizador(sessao)
+            return await self.reservar(
+                user["email"], _campo(pedido, "matricula"), _campo(pedido, "data_inicio"), _campo(pedido, "data_fim")
+            )
+        return await self._no_servico(self._executar, sessao, pedido)
+
+    def _executar(self, sessao: Dict, pedido: Dict):
+        op = pedido.get("op")
+        if op == "login":
+            sessao["user"] = servicos.autenticar(_campo(pedido, "email"), _campo(pedido, "senha", obrigatorio=False))
+            return {"email": sessao["user"]["email"], "tipo": sessao["user"]["tipo"]}
+
+        user = _utilizador(sessao)
+        contexto = self.contexto
+
+        if op == "carros":
+            return servicos.listar_carros()
+        if op == "disponivel":
+            return servicos.disponivel(
+                contexto, _campo(pedido, "matricula"), _campo(pedido, "data_inicio"), _campo(pedido, "data_fim")
+            )
+        if op == "procurar":
+            livres = servicos.procurar(
+                contexto, _campo(pedido, "data_inicio"), _campo(pedido, "data_fim"), pedido.get("id_classe")
+            )
+            return [{"viatura": c, "desconto": desconto, "total": total} for c, desconto, total in livres]
+        if op == "historico":
+            if "pagina" in pedido:
+                return servicos.pagina_historico(
+                    user["email"], pedido.get("pagina"), pedido.get("por_pagina", 10),
+                    _campo(pedido, "data_inicio", obrigatorio=False), _campo(pedido, "data_fim", obrigatorio=False),
+                )
+            return servicos.historico(contexto, user["email"])
+
+        if op in ("extrato", "estatisticas"):
+            if user.get("tipo") != "admin":
+                raise ValueError("Operação reservada a administradores.")
+            if op == "extrato":
+                return servicos.extrato(contexto, _campo(pedido, "data"))
+            return servicos.estatisticas(contexto, _campo(pedido, "data_inicio"), _campo(pedido, "data_fim"))
+
+        raise ValueError(f"Operação desconhecida: {op}")
+
+    ## Uma ligação = uma sessão; os pedidos de cada ligação são respondidos por ordem
+    async def atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        sessao = {"user": None}
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                if not linha.strip():
+                    continue
+                resposta = {"id": None}
+                try:
+                    try:
+                        pedido = json.loads(linha)
+                    except ValueError:
+                        raise ValueError("Pedido JSON inválido.")
+                    if not isinstance(pedido, dict):
+                        raise ValueError("O pedido deve ser um objeto JSON.")
+                    resposta["id"] = pedido.get("id")
+                    resposta["resultado"] = await self.executar(sessao, pedido)
+                    resposta["ok"] = True
+                except ValueError as e:
+                    resposta["ok"] = False
+                    resposta["erro"] = str(e)
+                except Exception as e:
+                    ## Erro inesperado: responde só a este pedido e a ligação continua
+                    traceback.print_exc()
+                    resposta["ok"] = False
+                    resposta["erro"] = f"Erro interno ({type(e).__name__})."
+                writer.write((json.dumps(resposta, ensure_ascii=False, default=_para_json) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def servir(host: str = "127.0.0.1", porta: int = 8765, socket: str = None) -> None:
+    servidor = Servidor()
+    escritor = asyncio.create_task(servidor.escritor())
+    if socket:
+        server = await asyncio.start_unix_server(servidor.atender, path=socket, backlog=LIGACOES_PENDENTES)
+        print(f"A servir em {socket}")
+    else:
+        server = await asyncio.start_server(servidor.atender, host, porta, backlog=LIGACOES_PENDENTES)
+        print(f"A servir em {host}:{porta}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        escritor.cancel()
+        servidor.servico.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de reservas (JSON lines)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--socket", help="caminho de um socket Unix (em vez de TCP)")
+    parser.add_argument("--profile", action="store_true", help="liga a instrumentação (relatório à saída)")
+    args = parser.parse_args()
+    if args.profile:
+        instrumentacao.ativar()
+    try:
+        asyncio.run(servir(args.host, args.porta, args.socket))
+    except KeyboardInterrupt:
+        pass
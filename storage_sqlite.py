@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+## BACKEND SQLITE (ativado com RENTACAR_BACKEND=sqlite)
+## Cada registo é guardado completo em "dados" (JSON) para não perder campos;
+## as colunas extraídas servem só para os índices e consultas
+DB_FILE = os.environ.get("RENTACAR_DB", "data/rentacar.db")
+
+## ficheiro JSON -> tabela
+TABELAS = {
+    "users.json": "users",
+    "vehicles.json": "vehicles",
+    "classes.json": "classes",
+    "settings.json": "settings",
+    "bookings.json": "bookings",
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS users (pos INTEGER PRIMARY KEY, email TEXT, dados TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS users_email ON users(email);
+CREATE TABLE IF NOT EXISTS vehicles (pos INTEGER PRIMARY KEY, matricula TEXT, id_classe TEXT, dados TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS vehicles_matricula ON vehicles(matricula);
+CREATE INDEX IF NOT EXISTS vehicles_id_classe ON vehicles(id_classe);
+CREATE TABLE IF NOT EXISTS classes (pos INTEGER PRIMARY KEY, id TEXT, dados TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS classes_id ON classes(id);
+CREATE TABLE IF NOT EXISTS settings (pos INTEGER PRIMARY KEY, dados TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT,
+    matricula TEXT,
+    data_inicio TEXT,
+    data_fim TEXT,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_periodo ON bookings(matricula, data_inicio, data_fim);
+CREATE INDEX IF NOT EXISTS bookings_email_inicio ON bookings(email, data_inicio);
+CREATE INDEX IF NOT EXISTS bookings_data_inicio ON bookings(data_inicio);
+"""
+
+## Uma ligação por thread (a compactação/servidor podem usar outras threads)
+_local = threading.local()
+
+
+## Id normalizado para texto (igual a Vehicle.classe / VehicleClass.chave)
+def _texto(valor) -> Optional[str]:
+    return None if valor is None else str(valor)
+
+
+## Colunas indexadas de cada tabela, extraídas do registo
+_COLUNAS = {
+    "users": ("email",),
+    "vehicles": ("matricula", "id_classe"),
+    "classes": ("id",),
+    "settings": (),
+    "bookings": ("email", "matricula", "data_inicio", "data_fim"),
+}
+
+
+def _linha(tabela: str, registo: Dict) -> tuple:
+    valores = tuple(_texto(registo.get(c)) for c in _COLUNAS[tabela])
+    return valores + (json.dumps(registo, ensure_ascii=False),)
+
+
+## Abre (e cria, se preciso) a base de dados
+def ligar() -> sqlite3.Connection:
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = sqlite3.connect(DB_FILE, isolation_level=None, timeout=30)
+        ## WAL: leitores não bloqueiam o escritor nem vice-versa
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.executescript(ESQUEMA)
+        _local.con = con
+    return con
+
+
+## Tabela correspondente a um ficheiro de dados (None se não houver)
+def tabela_de(filename: str) -> Optional[str]:
+    return TABELAS.get(os.path.basename(filename))
+
+
+## Transação: imediata=True reserva a escrita logo no início (serializa escritores)
+@contextmanager
+def transacao(imediata: bool = False):
+    con = ligar()
+    con.execute("BEGIN IMMEDIATE" if imediata else "BEGIN")
+    try:
+        yield con
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+## ---------- TABELAS COMPLETAS (equivalente a read_json/save_json) ----------
+
+def ler_tabela(tabela: str) -> List[Dict]:
+    ordem = "data_inicio, id" if tabela == "bookings" else "pos"
+    cursor = ligar().execute(f"SELECT dados FROM {tabela} ORDER BY {ordem}")
+    return [json.loads(dados) for (dados,) in cursor]
+
+
+def _substituir(con: sqlite3.Connection, tabela: str, registos: List[Dict]) -> None:
+    colunas = _COLUNAS[tabela] + ("dados",)
+    marcas = ", ".join("?" for _ in colunas)
+    con.execute(f"DELETE FROM {tabela}")
+    con.executemany(
+        f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcas})",
+        (_linha(tabela, r) for r in registos),
+    )
+    if tabela == "bookings":
+        _incrementar_geracao(con)
+
+
+def gravar_tabela(tabela: str, registos: List[Dict]) -> None:
+    with transacao(imediata=True) as con:
+        _substituir(con, tabela, registos)
+
+
+## Lê, altera e grava a tabela na mesma transação (equivalente a utils.atualizar_json)
+def atualizar_tabela(tabela: str, alterar) -> List[Dict]:
+    with transacao(imediata=True) as con:
+        registos = alterar(ler_tabela(tabela))
+        _substituir(con, tabela, registos)
+    return registos
+
+
+## ---------- RESERVAS ----------
+
+## Geração do histórico: muda quando é reescrito por inteiro
+def geracao(con: sqlite3.Connection = None) -> int:
+    con = con or ligar()
+    linha = con.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+    return linha[0] if linha else 0
+
+
+def _incrementar_geracao(con: sqlite3.Connection) -> None:
+    con.execute(
+        "INSERT INTO meta (chave, valor) VALUES ('geracao', 1) "
+        "ON CONFLICT(chave) DO UPDATE SET valor = valor + 1"
+    )
+
+
+## Todas as reservas ordenadas e o último id lido
+def ler_reservas() -> Tuple[List[Dict], int]:
+    con = ligar()
+    ultimo = con.execute("SELECT COALESCE(MAX(id), 0) FROM bookings").fetchone()[0]
+    return ler_tabela("bookings"), ultimo
+
+
+## Percorre as reservas pela ordem do histórico sem as carregar todas
+def iterar_reservas():
+    cursor = ligar().execute("SELECT dados FROM bookings ORDER BY data_inicio, id")
+    for (dados,) in cursor:
+        yield json.loads(dados)
+
+
+## Reservas gravadas depois de ultimo_id (por ordem de gravação)
+def reservas_desde(ultimo_id: int) -> Tuple[List[Dict], int]:
+    cursor = ligar().execute(
+        "SELECT id, dados FROM bookings WHERE id > ? ORDER BY id", (ultimo_id,)
+    )
+    novas = []
+    for id_, dados in cursor:
+        novas.append(json.loads(dados))
+        ultimo_id = id_
+    return novas, ultimo_id
+
+
+## Página do histórico de um cliente pelo índice (email, data_inicio), da mais recente para a
+## mais antiga; inicio/fim (YYYY-MM-DD) limitam às reservas que intersetam [inicio, fim).
+## Devolve (registos da página, total)
+def historico_cliente(email: str, inicio: Optional[str], fim: Optional[str], limite: int, salto: int) -> Tuple[List[Dict], int]:
+    condicoes = "email = ?"
+    parametros = [email]
+    if fim is not None:
+        condicoes += " AND data_inicio < ?"
+        parametros.append(fim)
+    if inicio is not None:
+        condicoes += " AND data_fim > ?"
+        parametros.append(inicio)
+    with transacao() as con:
+        total = con.execute(f"SELECT COUNT(*) FROM bookings WHERE {condicoes}", parametros).fetchone()[0]
+        cursor = con.execute(
+            f"SELECT dados FROM bookings WHERE {condicoes} ORDER BY data_inicio DESC, id DESC LIMIT ? OFFSET ?",
+            parametros + [limite, salto],
+        )
+        registos = [json.loads(dados) for (dados,) in cursor]
+    return registos, total
+
+
+## Verifica no índice (matricula, data_inicio, data_fim) se o intervalo [inicio, fim) está ocupado
+def sobrepoe(matricula: str, data_inicio: str, data_fim: str) -> bool:
+    linha = ligar().execute(
+        "SELECT 1 FROM bookings WHERE matricula = ? AND data_inicio < ? AND data_fim > ? LIMIT 1",
+        (matricula, data_fim, data_inicio),
+    ).fetchone()
+    return linha is not None
+
+
+## Insere uma reserva (chamar dentro de transacao(imediata=True)); devolve o id
+def inserir_reserva(registo: Dict) -> int:
+    cursor = ligar().execute(
+        "INSERT INTO bookings (email, matricula, data_inicio, data_fim, dados) VALUES (?, ?, ?, ?, ?)",
+        _linha("bookings", registo),
+    )
+    return cursor.lastrowid
+
+
+## Altera ou remove reservas (chave (matricula, data_inicio, data_fim) -> novo registo ou None)
+## numa só transação; ValueError (e nada muda) se uma alterada fica sobreposta a outra da mesma viatura.
+## Muda a geração: as sessões recarregam o histórico. Devolve quantas foram alteradas ou removidas
+def alterar_reservas(alteracoes: Dict[tuple, Optional[Dict]]) -> int:
+    alteradas = 0
+    encontradas = []
+    with transacao(imediata=True) as con:
+        for chave, novo in alteracoes.items():
+            ids = [
+                id_ for (id_,) in con.execute(
+                    "SELECT id FROM bookings WHERE matricula = ? AND data_inicio = ? AND data_fim = ?", chave
+                )
+            ]
+            alteradas += len(ids)
+            if ids and novo is not None:
+                encontradas.append(novo)
+            for id_ in ids:
+                if novo is None:
+                    con.execute("DELETE FROM bookings WHERE id = ?", (id_,))
+                else:
+                    con.execute(
+                        "UPDATE bookings SET email = ?, matricula = ?, data_inicio = ?, data_fim = ?, dados = ? "
+                        "WHERE id = ?",
+                        _linha("bookings", novo) + (id_,),
+                    )
+        for novo in encontradas:
+            (sobrepostas,) = con.execute(
+                "SELECT COUNT(*) FROM bookings WHERE matricula = ? AND data_inicio < ? AND data_fim > ?",
+                (_texto(novo.get("matricula")), novo.get("data_fim"), novo.get("data_inicio")),
+            ).fetchone()
+            if sobrepostas > 1:
+                raise ValueError(
+                    f"A reserva de {novo.get('data_inicio')} a {novo.get('data_fim')} sobrepõe-se a outra "
+                    f"da viatura {novo.get('matricula')}."
+                )
+        if alteradas:
+            _incrementar_geracao(con)
+    return alteradas
+
+
+## ---------- UTILIZADORES ----------
+
+## Procura pelo índice users(email); devolve o registo ou None
+def procurar_utilizador(email: str) -> Optional[Dict]:
+    linha = ligar().execute(
+        "SELECT dados FROM users WHERE email = ? ORDER BY pos LIMIT 1", (email,)
+    ).fetchone()
+    return json.loads(linha[0]) if linha else None
+
+
+## Acrescenta um utilizador no fim da tabela (chamar dentro de transacao(imediata=True))
+def inserir_utilizador(registo: Dict) -> None:
+    ligar().execute("INSERT INTO users (email, dados) VALUES (?, ?)", _linha("users", registo))
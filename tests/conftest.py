@@ -0,0 +1,69 @@
+## Os testes correm numa cópia da pasta data/ (os módulos usam caminhos relativos "data/...")
+import os
+import random
+import shutil
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import storage_sqlite
+import utils
+from modelos import Booking
+
+## Ficheiros de definição copiados para cada teste (as reservas são geradas por cada um)
+DEFINICOES = ("classes.json", "settings.json", "users.json", "vehicles.json")
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "data")
+    for nome in DEFINICOES:
+        shutil.copy(os.path.join(RAIZ, "data", nome), tmp_path / "data" / nome)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "BACKEND", "json")
+    monkeypatch.setattr(storage_sqlite, "DB_FILE", "data/rentacar.db")
+    utils.limpar_cache()
+    yield tmp_path
+    con = getattr(storage_sqlite._local, "con", None)
+    if con is not None:
+        con.close()
+        storage_sqlite._local.con = None
+    utils.limpar_cache()
+
+
+## Matrículas da frota de data/vehicles.json
+def matriculas():
+    return [v["matricula"] for v in utils.read_json(os.path.join(RAIZ, "data", "vehicles.json"))]
+
+
+## n reservas sem sobreposições por viatura, de 2024-11 a 2026-02, com totais em cêntimos
+## (e algumas de matrículas fora da frota, que só contam nos totais globais e por viatura)
+def gerar_reservas(n: int, semente: int = 0, emails: int = 20):
+    aleatorio = random.Random(semente)
+    frota = matriculas() + ["XX-00-00"]
+    livre = {m: date(2024, 11, 1) + timedelta(days=aleatorio.randrange(5)) for m in frota}
+    reservas = []
+    while len(reservas) < n and frota:
+        m = aleatorio.choice(frota)
+        inicio = livre[m] + timedelta(days=aleatorio.randrange(3))
+        dias = aleatorio.randint(1, 9)
+        fim = inicio + timedelta(days=dias)
+        if fim > date(2026, 2, 28):
+            frota.remove(m)
+            continue
+        livre[m] = fim
+        reservas.append(Booking(
+            email=f"cliente{aleatorio.randrange(emails)}@teste.pt",
+            matricula=m,
+            data_inicio=inicio.isoformat(),
+            data_fim=fim.isoformat(),
+            dias=dias,
+            preco_diario=50,
+            desconto=0,
+            total=round(aleatorio.uniform(10, 900), 2),
+        ))
+    return reservas
@@ -0,0 +1,167 @@
+## Compactação do journal nas partições mensais e recuperação de compactações e escritas interrompidas
+import json
+import os
+
+import pytest
+
+import bookings_store
+import resumos
+from conftest import gerar_reservas
+from modelos import Booking
+
+
+## n reservas de janeiro de 2027 (depois de todas as geradas)
+def reservas_novas(n):
+    return [
+        Booking(email="nova@teste.pt", matricula="NV-00-00", data_inicio=f"2027-01-{i + 1:02d}",
+                data_fim=f"2027-01-{i + 2:02d}", dias=1, preco_diario=30, desconto=0, total=30.05)
+        for i in range(n)
+    ]
+
+
+def chaves(reservas):
+    return sorted((b.matricula, b.data_inicio, b.data_fim, b.email, b.total) for b in reservas)
+
+
+## Ficheiros temporários (de escrever_temporario) esquecidos na pasta de dados
+def temporarios():
+    return [
+        os.path.join(raiz, nome) for raiz, _, nomes in os.walk("data") for nome in nomes if nome.endswith(".tmp")
+    ]
+
+
+@pytest.fixture
+def reservas(pasta):
+    reservas = gerar_reservas(400)
+    bookings_store.save_bookings(reservas[:300])
+    estado = bookings_store.abrir()
+    bookings_store.registar_reservas(estado, reservas[300:])
+    return reservas
+
+
+def test_compactar_junta_o_journal_as_particoes(reservas):
+    assert os.path.exists(bookings_store.JOURNAL_FILE)
+    assert bookings_store.compactar()
+    assert not os.path.exists(bookings_store.JOURNAL_FILE)
+    assert not os.path.exists(bookings_store.COMPACTING_FILE)
+    assert not bookings_store.compactar()
+
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+    ## Partições, manifesto e resumos batem certo com as reservas de cada mês
+    manifesto = bookings_store._ler_manifesto()
+    guardados = bookings_store._ler_resumos_guardados()
+    por_mes = {}
+    for b in reservas:
+        por_mes.setdefault(b.data_inicio[:7], []).append(b.to_dict())
+    assert [p["mes"] for p in manifesto["particoes"]] == sorted(por_mes)
+    for p in manifesto["particoes"]:
+        registos = bookings_store._ler_lista(bookings_store._ficheiro_particao(p["mes"]))
+        assert p["reservas"] == len(registos) == len(por_mes[p["mes"]])
+        assert [b["data_inicio"] for b in registos] == sorted(b["data_inicio"] for b in registos)
+        assert guardados[p["mes"]] == json.loads(json.dumps(resumos.resumir(registos)))
+    assert temporarios() == []
+
+
+def test_compactacao_interrompida_depois_de_congelar_o_journal(reservas):
+    ## A compactação morreu logo depois de passar o journal a .compactar
+    os.replace(bookings_store.JOURNAL_FILE, bookings_store.COMPACTING_FILE)
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+
+    ## Reservas novas vão para um journal novo e também se leem
+    extra = reservas_novas(5)
+    bookings_store.registar_reservas(bookings_store.abrir(), extra)
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas + extra)
+
+    ## A compactação seguinte termina a interrompida; a outra junta o journal novo
+    assert bookings_store.compactar()
+    assert not os.path.exists(bookings_store.COMPACTING_FILE)
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas + extra)
+    assert bookings_store.compactar()
+    assert not os.path.exists(bookings_store.JOURNAL_FILE)
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas + extra)
+
+
+def test_compactacao_interrompida_depois_de_instalar(reservas):
+    ## A compactação morreu depois de instalar as partições mas antes de apagar o .compactar:
+    ## as reservas pendentes já estão nas partições e não podem aparecer duas vezes
+    with open(bookings_store.JOURNAL_FILE, "rb") as f:
+        journal = f.read()
+    assert bookings_store.compactar()
+    with open(bookings_store.COMPACTING_FILE, "wb") as f:
+        f.write(journal)
+
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+    assert chaves(bookings_store.iterar_reservas()) == chaves(reservas)
+    assert bookings_store.compactar()
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+    assert sum(p["reservas"] for p in bookings_store._ler_manifesto()["particoes"]) == len(reservas)
+
+
+@pytest.mark.parametrize("falha", ["_escrever_particao", "_escrever_resumos", "_escrever_manifesto"])
+def test_falha_a_escrever_nao_perde_reservas_nem_deixa_temporarios(reservas, monkeypatch, falha):
+    def escrever(*args):
+        raise OSError("disco cheio")
+
+    with monkeypatch.context() as m:
+        m.setattr(bookings_store, falha, escrever)
+        with pytest.raises(OSError):
+            bookings_store.compactar()
+    assert temporarios() == []
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+
+    assert bookings_store.compactar()
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+    assert not os.path.exists(bookings_store.COMPACTING_FILE)
+
+
+@pytest.mark.parametrize("falha", ["_escrever_particao", "_escrever_resumos", "_escrever_manifesto"])
+def test_falha_a_alterar_nao_muda_reservas_nem_deixa_temporarios(reservas, monkeypatch, falha):
+    assert bookings_store.compactar()
+    ## Uma remoção e uma edição (outro cliente) de reservas já nas partições
+    removida, editada = reservas[0], reservas[1]
+    alteracoes = {
+        (removida.matricula, removida.data_inicio, removida.data_fim): None,
+        (editada.matricula, editada.data_inicio, editada.data_fim): dict(editada.to_dict(), email="outro@teste.pt"),
+    }
+
+    def escrever(*args):
+        raise OSError("disco cheio")
+
+    with monkeypatch.context() as m:
+        m.setattr(bookings_store, falha, escrever)
+        with pytest.raises(OSError):
+            bookings_store.alterar_reservas(alteracoes)
+    assert temporarios() == []
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+
+    assert bookings_store.alterar_reservas(alteracoes) == 2
+    esperadas = [b for b in reservas if b is not removida and b is not editada]
+    esperadas.append(Booking.from_dict(dict(editada.to_dict(), email="outro@teste.pt")))
+    assert chaves(bookings_store.load_bookings()) == chaves(esperadas)
+    assert temporarios() == []
+
+
+def test_escrita_interrompida_no_journal(reservas):
+    ## Uma sessão morreu a meio de acrescentar uma linha ao journal
+    with open(bookings_store.JOURNAL_FILE, "ab") as f:
+        f.write(b'{"email": "meia@teste.pt", "matric')
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
+
+    ## As reservas gravadas a seguir não se perdem com a linha incompleta
+    extra = reservas_novas(3)
+    bookings_store.registar_reservas(bookings_store.abrir(), extra)
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas + extra)
+    assert bookings_store.compactar()
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas + extra)
+
+
+def test_migra_o_formato_antigo(pasta):
+    reservas = gerar_reservas(150)
+    with open(bookings_store.BOOKINGS_FILE, "w", encoding="utf-8") as f:
+        json.dump([b.to_dict() for b in reservas], f, ensure_ascii=False, indent=2)
+    assert chaves(bookings_store.iterar_reservas()) == chaves(reservas)
+
+    assert bookings_store.compactar()
+    assert not os.path.exists(bookings_store.BOOKINGS_FILE)
+    assert bookings_store._ler_manifesto() is not None
+    assert chaves(bookings_store.load_bookings()) == chaves(reservas)
@@ -0,0 +1,80 @@
+## Várias sessões (processos) a reservar as mesmas viaturas ao mesmo tempo nunca gravam
+## duas reservas sobrepostas da mesma viatura
+import multiprocessing
+import random
+from datetime import date, timedelta
+
+import bookings_store
+import servicos
+from conftest import gerar_reservas, matriculas
+
+SESSOES = 4
+
+
+## Pedidos que se sobrepõem entre si: cada viatura com intervalos desencontrados de 1 a 4 dias
+def pedidos(semente: int):
+    aleatorio = random.Random(semente)
+    lista = []
+    for m in matriculas()[:4]:
+        for _ in range(25):
+            inicio = date(2026, 6, 1) + timedelta(days=aleatorio.randrange(40))
+            fim = inicio + timedelta(days=aleatorio.randint(1, 4))
+            lista.append((f"sessao{semente}@teste.pt", m, inicio.isoformat(), fim.isoformat()))
+    return lista
+
+
+def sessao(semente, barreira, fila):
+    contexto = servicos.abrir()
+    barreira.wait()
+    aceites = []
+    for i, pedido in enumerate(pedidos(semente)):
+        ## Uns sozinhos, outros em lote
+        if i % 3:
+            try:
+                aceites.append(servicos.reservar(contexto, *pedido).to_dict())
+            except ValueError:
+                pass
+        else:
+            aceites.extend(b.to_dict() for b, _ in servicos.reservar_lote(contexto, [pedido]) if b is not None)
+    fila.put(aceites)
+
+
+def sem_sobreposicoes(reservas):
+    por_matricula = {}
+    for b in reservas:
+        por_matricula.setdefault(b.matricula, []).append((b.inicio, b.fim))
+    for intervalos in por_matricula.values():
+        intervalos.sort()
+        for (_, fim), (inicio, _) in zip(intervalos, intervalos[1:]):
+            if inicio < fim:
+                return False
+    return True
+
+
+def test_sessoes_concorrentes_nunca_sobrepoem(pasta, monkeypatch):
+    bookings_store.save_bookings(gerar_reservas(200))
+    ## Journal pequeno: as sessões compactam em segundo plano enquanto as outras reservam
+    monkeypatch.setattr(bookings_store, "LIMITE_JOURNAL", 4 * 1024)
+
+    ctx = multiprocessing.get_context("fork")
+    barreira = ctx.Barrier(SESSOES)
+    fila = ctx.Queue()
+    processos = [ctx.Process(target=sessao, args=(i, barreira, fila)) for i in range(SESSOES)]
+    for p in processos:
+        p.start()
+    aceites = [b for _ in processos for b in fila.get(timeout=120)]
+    for p in processos:
+        p.join(timeout=120)
+        assert p.exitcode == 0
+
+    novas = [b for b in bookings_store.load_bookings() if b.data_inicio >= "2026-06-01"]
+    chaves = sorted((b.matricula, b.data_inicio, b.data_fim, b.email) for b in novas)
+    assert chaves == sorted((b["matricula"], b["data_inicio"], b["data_fim"], b["email"]) for b in aceites)
+    assert sem_sobreposicoes(bookings_store.load_bookings())
+    ## Houve mesmo disputa: nem todos os pedidos foram aceites
+    assert 0 < len(aceites) < SESSOES * len(pedidos(0))
+
+    ## O mesmo depois de compactar tudo
+    bookings_store.compactar()
+    assert sorted((b.matricula, b.data_inicio, b.data_fim, b.email) for b in bookings_store.load_bookings()
+                  if b.data_inicio >= "2026-06-01") == chaves
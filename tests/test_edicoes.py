@@ -0,0 +1,93 @@
+## Sessões de edição (edicoes): remover uma classe muda as viaturas na sessão da frota, gravadas
+## com a classe; uma sessão que falha não deixa nada a meio e a edição de outra sessão ao mesmo
+## registo só muda os campos que essa sessão alterou
+from contextlib import ExitStack
+
+import pytest
+
+import admin_menu
+import edicoes
+import utils
+from modelos import Vehicle, VehicleClass
+
+
+def ler(filename):
+    utils.limpar_cache()
+    return utils.read_json(filename)
+
+
+def classes_das_viaturas():
+    return {d["matricula"]: d["id_classe"] for d in ler("data/vehicles.json")}
+
+
+def remover_classe(monkeypatch, sessao, frota, *respostas):
+    respostas = iter(respostas)
+    monkeypatch.setattr("builtins.input", lambda *_: next(respostas))
+    admin_menu.remover_classe(sessao, frota)
+
+
+## Sessões das classes e da frota como as abre menu_classes
+def sessoes(pilha):
+    sessao = pilha.enter_context(edicoes.sessao("data/classes.json", VehicleClass))
+    frota = pilha.enter_context(edicoes.sessao("data/vehicles.json", Vehicle))
+    edicoes.ligar(sessao, frota)
+    return sessao, frota
+
+
+@pytest.mark.parametrize("modo", ["2", "3"])
+def test_viaturas_gravadas_com_a_remocao_da_classe(pasta, monkeypatch, modo):
+    antes = classes_das_viaturas()
+    da_classe = sorted(mat for mat, id_classe in antes.items() if id_classe == 3)
+    assert da_classe
+
+    with ExitStack() as pilha:
+        sessao, frota = sessoes(pilha)
+        remover_classe(monkeypatch, sessao, frota, "3", modo, "2")
+        ## Nada gravado antes do fim da sessão
+        assert classes_das_viaturas() == antes
+        assert edicoes.pendentes(sessao) == len(da_classe) + 1
+
+    assert 3 not in [d["id"] for d in ler("data/classes.json")]
+    if modo == "2":
+        assert classes_das_viaturas() == {mat: 2 if mat in da_classe else c for mat, c in antes.items()}
+    else:
+        assert classes_das_viaturas() == {mat: c for mat, c in antes.items() if mat not in da_classe}
+
+
+def test_sessao_que_falha_nao_muda_as_viaturas(pasta, monkeypatch):
+    antes = classes_das_viaturas()
+    classes = ler("data/classes.json")
+    with pytest.raises(KeyboardInterrupt):
+        with ExitStack() as pilha:
+            sessao, frota = sessoes(pilha)
+            remover_classe(monkeypatch, sessao, frota, "3", "2", "2")
+            raise KeyboardInterrupt
+    assert classes_das_viaturas() == antes
+    assert ler("data/classes.json") == classes
+
+    ## A sessão seguinte recupera as duas partes e grava-as juntas
+    with ExitStack() as pilha:
+        sessao, frota = sessoes(pilha)
+        assert sessao["recuperadas"] == 1 and frota["recuperadas"] == sum(c == 3 for c in antes.values())
+    assert 3 not in [d["id"] for d in ler("data/classes.json")]
+    assert 3 not in classes_das_viaturas().values()
+
+
+def test_edicao_de_outra_sessao_nao_desfaz_a_reatribuicao(pasta, monkeypatch):
+    mat = next(mat for mat, id_classe in classes_das_viaturas().items() if id_classe == 3)
+    with ExitStack() as pilha:
+        ## Outro administrador (outro processo) edita a marca da viatura antes de a classe mudar
+        with monkeypatch.context() as m:
+            m.setattr(edicoes.os, "getpid", lambda: 1)
+            outra = pilha.enter_context(edicoes.sessao("data/vehicles.json", Vehicle))
+        v = next(x for x in outra["registos"] if x.matricula == mat)
+        v.marca = "Outra"
+        edicoes.guardar_registo(outra, v)
+
+        with ExitStack() as menu:
+            sessao, frota = sessoes(menu)
+            remover_classe(monkeypatch, sessao, frota, "3", "2", "2")
+        assert classes_das_viaturas()[mat] == 2
+
+    viatura = next(d for d in ler("data/vehicles.json") if d["matricula"] == mat)
+    assert viatura["id_classe"] == 2 and viatura["marca"] == "Outra"
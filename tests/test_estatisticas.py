@@ -0,0 +1,149 @@
+## Todos os caminhos das estatísticas (fluxo com e sem NumPy, vários processos, resumos mensais
+## e SQLite) dão o relatório do cálculo original, que percorria todas as reservas
+from datetime import datetime
+
+import pytest
+
+import admin_menu
+import bookings_store
+import colunas
+import migrar_sqlite
+import utils
+from conftest import gerar_reservas
+
+PERIODOS = [
+    ("2024-11-01", "2026-03-01"),  # todo o histórico
+    ("2025-01-01", "2025-04-01"),  # meses inteiros
+    ("2024-12-17", "2025-06-09"),  # meses inteiros e bordas
+    ("2025-03-04", "2025-03-21"),  # dentro de um mês
+    ("2025-07-31", "2025-08-01"),  # um dia
+]
+
+
+## Relatório como o calculava estatisticas() antes dos motores novos
+def relatorio_base(reservas, vehicles, ini, fim):
+    mapa_classe_por_mat = {v.matricula: v.id_classe for v in vehicles}
+    ini, fim = ini.toordinal(), fim.toordinal()
+    total_faturado = 0.0
+    num_reservas = 0
+    dias_alugados_total = 0
+    por_classe = {}
+    por_viatura = {}
+    for b in reservas:
+        dias_int = admin_menu.dias_intersecao(b.inicio, b.fim, ini, fim)
+        if dias_int <= 0:
+            continue
+        valor = float(b.total)
+        num_reservas += 1
+        total_faturado += valor
+        dias_alugados_total += dias_int
+        id_classe = mapa_classe_por_mat.get(b.matricula)
+        if id_classe is not None:
+            dados = por_classe.setdefault(id_classe, {"total": 0.0, "reservas": 0, "dias": 0})
+            dados["total"] += valor
+            dados["reservas"] += 1
+            dados["dias"] += dias_int
+        dados_v = por_viatura.setdefault(b.matricula, {"total": 0.0, "reservas": 0, "dias": 0})
+        dados_v["total"] += valor
+        dados_v["reservas"] += 1
+        dados_v["dias"] += dias_int
+    return {
+        "total_faturado": total_faturado,
+        "num_reservas": num_reservas,
+        "dias_alugados_total": dias_alugados_total,
+        "por_classe": por_classe,
+        "por_viatura": por_viatura,
+    }
+
+
+## Totais arredondados ao cêntimo (o cálculo original somava floats)
+def normalizar(resultado):
+    def grupo(dados):
+        return {
+            chave: {"total": round(d["total"], 2), "reservas": d["reservas"], "dias": d["dias"]}
+            for chave, d in dados.items()
+        }
+    return {
+        "total_faturado": round(resultado["total_faturado"], 2),
+        "num_reservas": resultado["num_reservas"],
+        "dias_alugados_total": resultado["dias_alugados_total"],
+        "por_classe": grupo(resultado["por_classe"]),
+        "por_viatura": grupo(resultado["por_viatura"]),
+    }
+
+
+@pytest.fixture
+def historico(pasta):
+    reservas = gerar_reservas(900)
+    ## A maior parte nas partições e o resto no journal (como entre duas compactações)
+    bookings_store.save_bookings(reservas[:700])
+    estado = bookings_store.abrir()
+    bookings_store.registar_reservas(estado, reservas[700:])
+    return reservas
+
+
+def periodo(texto_ini, texto_fim):
+    return datetime.strptime(texto_ini, "%Y-%m-%d"), datetime.strptime(texto_fim, "%Y-%m-%d")
+
+
+@pytest.mark.parametrize("texto_ini,texto_fim", PERIODOS)
+def test_caminhos_iguais_ao_relatorio_original(historico, texto_ini, texto_fim, monkeypatch):
+    vehicles = admin_menu.load_vehicles()
+    ini, fim = periodo(texto_ini, texto_fim)
+    esperado = normalizar(relatorio_base(historico, vehicles, ini, fim))
+    assert esperado["num_reservas"] > 0
+
+    ## Em fluxo, pelo motor em colunas e pelo ciclo
+    reservas = bookings_store.iterar_reservas(ini.toordinal(), fim.toordinal())
+    assert normalizar(admin_menu.calcular_estatisticas(reservas, vehicles, ini, fim)) == esperado
+    with monkeypatch.context() as m:
+        m.setattr(colunas, "np", None)
+        reservas = bookings_store.iterar_reservas(ini.toordinal(), fim.toordinal())
+        serie = admin_menu.calcular_estatisticas(reservas, vehicles, ini, fim)
+        assert normalizar(serie) == esperado
+
+    ## Por vários processos (cada um devolve só células por viatura), com viaturas e classes
+    ## pela mesma ordem do caminho em série
+    resultado = admin_menu.calcular_estatisticas_paralelo(vehicles, ini, fim, 2)
+    assert resultado is not None
+    assert normalizar(resultado) == esperado
+    assert list(resultado["por_viatura"]) == list(serie["por_viatura"])
+    assert list(resultado["por_classe"]) == list(serie["por_classe"])
+
+    ## Pelos resumos mensais (só há resumos a usar se o período tem algum mês inteiro)
+    resultado = admin_menu.calcular_estatisticas_resumos(vehicles, ini, fim)
+    if texto_ini[8:] == "01" or (fim - ini).days > 31:
+        assert resultado is not None
+    if resultado is not None:
+        assert normalizar(resultado) == esperado
+
+    assert normalizar(admin_menu.calcular_estatisticas_periodo(vehicles, ini, fim)) == esperado
+
+
+@pytest.mark.parametrize("texto_ini,texto_fim", PERIODOS)
+def test_sqlite_igual_ao_relatorio_original(historico, texto_ini, texto_fim, monkeypatch):
+    vehicles = admin_menu.load_vehicles()
+    ini, fim = periodo(texto_ini, texto_fim)
+    esperado = normalizar(relatorio_base(historico, vehicles, ini, fim))
+
+    migrar_sqlite.migrar()
+    monkeypatch.setattr(utils, "BACKEND", "sqlite")
+    reservas = bookings_store.iterar_reservas(ini.toordinal(), fim.toordinal())
+    assert normalizar(admin_menu.calcular_estatisticas(reservas, vehicles, ini, fim)) == esperado
+    assert normalizar(admin_menu.calcular_estatisticas_periodo(vehicles, ini, fim)) == esperado
+
+
+def test_totais_somados_em_centimos(pasta):
+    ## 0.1 + 0.2 em float não é 0.3: todos os caminhos somam cêntimos
+    reservas = gerar_reservas(3)
+    for b, total in zip(reservas, (0.1, 0.2, 0.3)):
+        b.total = total
+    bookings_store.save_bookings(reservas)
+    vehicles = admin_menu.load_vehicles()
+    ini, fim = periodo("2024-11-01", "2026-03-01")
+    resultados = [
+        admin_menu.calcular_estatisticas(bookings_store.iterar_reservas(), vehicles, ini, fim),
+        admin_menu.calcular_estatisticas_paralelo(vehicles, ini, fim, 2),
+        admin_menu.calcular_estatisticas_resumos(vehicles, ini, fim),
+    ]
+    assert [r["total_faturado"] for r in resultados] == [0.6, 0.6, 0.6]
@@ -0,0 +1,100 @@
+## Exportação das reservas: uma exportação interrompida retoma da marca sem repetir nem perder
+## linhas, e exportar outra vez para o mesmo destino só acrescenta as reservas novas
+import csv
+import gzip
+import json
+
+import pytest
+
+import bookings_store
+import exportar
+from conftest import gerar_reservas
+from modelos import Booking
+
+DESTINOS = ["reservas.csv", "reservas.jsonl", "reservas.csv.gz", "reservas.jsonl.gz"]
+
+
+## (matricula, data_inicio, data_fim, email) das linhas do ficheiro exportado
+def ler_exportacao(destino):
+    tipo, comprimido = exportar.formato(destino)
+    abrir = gzip.open if comprimido else open
+    with abrir(destino, "rt", encoding="utf-8", newline="") as f:
+        linhas = [json.loads(l) for l in f] if tipo == "jsonl" else list(csv.DictReader(f))
+    return [(l["matricula"], l["data_inicio"], l["data_fim"], l["email"]) for l in linhas]
+
+
+def esperadas():
+    return [(b.matricula, b.data_inicio, b.data_fim, b.email) for b in bookings_store.iterar_reservas()]
+
+
+@pytest.fixture
+def historico(pasta):
+    reservas = gerar_reservas(400)
+    bookings_store.save_bookings(reservas[:350])
+    bookings_store.registar_reservas(bookings_store.abrir(), reservas[350:])
+    return reservas
+
+
+@pytest.mark.parametrize("destino", DESTINOS)
+def test_retoma_uma_exportacao_interrompida(historico, monkeypatch, destino):
+    original = exportar._acrescentar
+    blocos = []
+
+    ## O processo morre a meio do terceiro bloco (parte dele já no disco)
+    def acrescentar(f, texto, comprimido):
+        blocos.append(texto)
+        if len(blocos) == 3:
+            dados = texto.encode("utf-8")
+            f.write((gzip.compress(dados) if comprimido else dados)[:50])
+            raise KeyboardInterrupt
+        return original(f, texto, comprimido)
+
+    with monkeypatch.context() as m:
+        m.setattr(exportar, "_acrescentar", acrescentar)
+        with pytest.raises(KeyboardInterrupt):
+            exportar.exportar_reservas(destino, bloco=37)
+    assert exportar.ler_marca(destino)["reservas"] == 2 * 37
+
+    resultado = exportar.exportar_reservas(destino, bloco=37)
+    assert resultado["reservas"] == len(historico) - 2 * 37
+    assert resultado["total"] == len(historico)
+    assert ler_exportacao(destino) == esperadas()
+
+    ## Igual a uma exportação feita de uma só vez
+    inteira = "inteira." + destino.split(".", 1)[1]
+    exportar.exportar_reservas(inteira, bloco=37)
+    assert ler_exportacao(inteira) == ler_exportacao(destino)
+
+
+@pytest.mark.parametrize("destino", DESTINOS)
+def test_acrescenta_so_as_reservas_novas(historico, destino):
+    exportar.exportar_reservas(destino, bloco=50)
+    marca = exportar.ler_marca(destino)["data_inicio"]
+    assert exportar.exportar_reservas(destino)["reservas"] == 0
+
+    def reserva(matricula, data_inicio, data_fim):
+        return Booking(email="nova@teste.pt", matricula=matricula, data_inicio=data_inicio, data_fim=data_fim,
+                       dias=1, preco_diario=30, desconto=0, total=30)
+
+    ## Uma com a data da marca (ainda não exportada), uma depois e uma antes (só com --recomecar)
+    novas = [reserva("NV-00-01", marca, "2026-03-10"), reserva("NV-00-02", "2026-03-01", "2026-03-02"),
+             reserva("NV-00-03", "2025-01-01", "2025-01-02")]
+    bookings_store.registar_reservas(bookings_store.abrir(), novas)
+
+    resultado = exportar.exportar_reservas(destino)
+    assert resultado["reservas"] == 2
+    assert resultado["total"] == len(historico) + 2
+    linhas = ler_exportacao(destino)
+    assert len(linhas) == len(set(linhas)) == len(historico) + 2
+    assert sorted(linhas) == sorted(l for l in esperadas() if l[0] != "NV-00-03")
+
+    exportar.exportar_reservas(destino, recomecar=True)
+    assert ler_exportacao(destino) == esperadas()
+
+
+def test_destino_que_nao_corresponde_a_marca(historico):
+    exportar.exportar_reservas("reservas.csv", bloco=100)
+    with open("reservas.csv", "r+b") as f:
+        f.truncate(10)
+    with pytest.raises(ValueError):
+        exportar.exportar_reservas("reservas.csv")
@@ -0,0 +1,159 @@
+## Página do histórico de um cliente: igual a filtrar e ordenar todas as reservas, com o histórico
+## em partições, no journal, depois de compactar, alterar ou reescrever, e com o backend SQLite
+import os
+
+import pytest
+
+import bookings_store
+import migrar_sqlite
+import servicos
+import utils
+from conftest import gerar_reservas
+from modelos import Booking, ordinal
+
+POR_PAGINA = 7
+PERIODOS = [(None, None), ("2025-03-01", "2025-09-15"), ("2025-12-20", None), (None, "2025-01-10")]
+
+
+## Todas as reservas do cliente que intersetam [ini, fim), da mais recente para a mais antiga
+## (em empate a gravada depois primeiro)
+def esperadas(email, ini=None, fim=None):
+    ini, fim = ordinal(ini), ordinal(fim)
+    reservas = [
+        b for b in bookings_store.iterar_reservas()
+        if b.email == email and (fim is None or b.inicio < fim) and (ini is None or b.fim > ini)
+    ]
+    reservas.reverse()
+    reservas.sort(key=lambda b: b.data_inicio, reverse=True)
+    return [b.to_dict() for b in reservas]
+
+
+def confirmar(emails):
+    for email in emails:
+        for ini, fim in PERIODOS:
+            lista = esperadas(email, ini, fim)
+            paginas = max(1, -(-len(lista) // POR_PAGINA))
+            for pagina in range(1, paginas + 2):
+                reservas, total = bookings_store.historico_cliente(
+                    email, pagina, POR_PAGINA, ordinal(ini), ordinal(fim)
+                )
+                assert total == len(lista)
+                assert [b.to_dict() for b in reservas] == lista[(pagina - 1) * POR_PAGINA:pagina * POR_PAGINA]
+
+
+@pytest.fixture
+def historico(pasta):
+    reservas = gerar_reservas(600, emails=12)
+    bookings_store.save_bookings(reservas[:500])
+    bookings_store.registar_reservas(bookings_store.abrir(), reservas[500:])
+    return reservas
+
+
+def emails(reservas):
+    return sorted({b.email for b in reservas}) + ["ninguem@teste.pt"]
+
+
+def test_paginas_iguais_ao_filtro_completo(historico):
+    ## Partições e journal
+    confirmar(emails(historico))
+
+    ## Depois de compactar (o índice é posto em dia só nos meses reescritos)
+    assert bookings_store.compactar()
+    confirmar(emails(historico))
+
+    ## Com reservas novas no journal, uma com a mesma data_inicio de outra do mesmo cliente
+    primeira = historico[0]
+    novas = [
+        Booking(email=primeira.email, matricula="NV-00-00", data_inicio=primeira.data_inicio,
+                data_fim=primeira.data_fim, dias=1, preco_diario=30, desconto=0, total=30),
+        Booking(email=primeira.email, matricula="NV-00-01", data_inicio="2026-05-01",
+                data_fim="2026-05-03", dias=2, preco_diario=30, desconto=0, total=60),
+    ]
+    bookings_store.registar_reservas(bookings_store.abrir(), novas)
+    confirmar([primeira.email])
+
+    ## Depois de alterar e remover reservas gravadas
+    segunda = historico[1]
+    alterada = dict(segunda.to_dict(), email=primeira.email)
+    bookings_store.alterar_reservas({
+        (primeira.matricula, primeira.data_inicio, primeira.data_fim): None,
+        (segunda.matricula, segunda.data_inicio, segunda.data_fim): alterada,
+    })
+    confirmar([primeira.email, segunda.email])
+
+    ## Depois de reescrever o histórico todo
+    bookings_store.save_bookings(bookings_store.load_bookings()[::2])
+    confirmar(emails(historico))
+
+
+def test_indices_em_falta_sao_refeitos(historico):
+    confirmar(emails(historico)[:3])
+    for raiz, _, nomes in os.walk("data/bookings"):
+        for nome in nomes:
+            if nome.endswith(".emails.json") or raiz.endswith("emails"):
+                os.remove(os.path.join(raiz, nome))
+    utils.limpar_cache()
+    confirmar(emails(historico))
+
+
+def test_pagina_le_e_grava_so_o_fragmento_do_cliente(historico, monkeypatch):
+    assert bookings_store.compactar()
+    email, outro = emails(historico)[:2]
+    fragmentos = {bookings_store._fragmento(e): bookings_store._ficheiro_fragmento(bookings_store._fragmento(e))
+                  for e in (email, outro)}
+    assert len(fragmentos) == 2
+
+    ## A primeira página de cada cliente grava só o seu fragmento
+    bookings_store.historico_cliente(email)
+    bookings_store.historico_cliente(outro)
+    gravados = sorted(os.path.join(bookings_store.EMAILS_DIR, nome)
+                      for nome in os.listdir(bookings_store.EMAILS_DIR) if nome.endswith(".json"))
+    assert gravados == sorted(fragmentos.values())
+
+    lidos = []
+    ler = bookings_store.read_json
+
+    def read_json(filename):
+        lidos.append(filename)
+        return ler(filename)
+
+    monkeypatch.setattr(bookings_store, "read_json", read_json)
+
+    ## Com o fragmento em dia não se lê mais nenhum índice nem partição
+    bookings_store.historico_cliente(outro)
+    assert lidos == [bookings_store.MANIFEST_FILE, fragmentos[bookings_store._fragmento(outro)]]
+
+    ## Depois de compactar um mês só se lê o índice desse mês
+    nova = Booking(email=outro, matricula="NV-00-00", data_inicio="2025-06-10", data_fim="2025-06-11",
+                   dias=1, preco_diario=30, desconto=0, total=30)
+    bookings_store.registar_reservas(bookings_store.abrir(), [nova])
+    assert bookings_store.compactar()
+    lidos.clear()
+    reservas, _ = bookings_store.historico_cliente(outro, por_pagina=1000)
+    assert nova.to_dict() in [b.to_dict() for b in reservas]
+    assert lidos == [bookings_store.MANIFEST_FILE, fragmentos[bookings_store._fragmento(outro)],
+                     "data/bookings/2025-06.emails.json"]
+
+
+def test_sqlite_igual_ao_filtro_completo(historico, monkeypatch):
+    lista = {email: {p: esperadas(email, *p) for p in PERIODOS} for email in emails(historico)}
+    migrar_sqlite.migrar()
+    monkeypatch.setattr(utils, "BACKEND", "sqlite")
+    for email, por_periodo in lista.items():
+        for (ini, fim), reservas in por_periodo.items():
+            pagina, total = bookings_store.historico_cliente(email, 2, POR_PAGINA, ordinal(ini), ordinal(fim))
+            assert total == len(reservas)
+            assert [b.to_dict() for b in pagina] == reservas[POR_PAGINA:2 * POR_PAGINA]
+
+
+def test_pagina_do_servico(historico):
+    email = historico[0].email
+    lista = esperadas(email, "2025-03-01", "2025-09-15")
+    resultado = servicos.pagina_historico(email, "2", "5", "2025-03-01", "2025-09-15")
+    assert [b.to_dict() for b in resultado["reservas"]] == lista[5:10]
+    assert resultado["total"] == len(lista)
+    assert resultado["paginas"] == -(-len(lista) // 5)
+    with pytest.raises(ValueError):
+        servicos.pagina_historico(email, 0)
+    with pytest.raises(ValueError):
+        servicos.pagina_historico(email, 1, 10, "01-03-2025")
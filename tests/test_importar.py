@@ -0,0 +1,100 @@
+## Importação em lote: CSV com BOM, motivos de rejeição (linhas sobrepostas no ficheiro, matrícula
+## desconhecida, datas trocadas, conflito com o histórico...), relatório de rejeições em CSV e
+## as aceites gravadas numa só escrita do journal
+import csv
+import json
+
+import pytest
+
+import bookings_store
+import importar_reservas
+from modelos import Booking
+
+LINHAS = [
+    ("ana@teste.pt", "AA-00-AA", "2026-05-01", "2026-05-04"),   # 2 aceite
+    ("rui@teste.pt", "AA-00-AA", "2026-05-03", "2026-05-06"),   # 3 sobrepõe a linha 2
+    ("eva@teste.pt", "ZZ-99-99", "2026-05-01", "2026-05-02"),   # 4 matrícula desconhecida
+    ("eva@teste.pt", "HY-56-PR", "2026-05-01", "2026-05-02"),   # 5 viatura inativa
+    ("rui@teste.pt", "BB-11-BB", "2026-05-10", "2026-05-08"),   # 6 datas trocadas
+    ("ana@teste.pt", "XX-88-XX", "2026-05-03", "2026-05-07"),   # 7 conflito com o histórico
+    ("", "CC-22-CC", "2026-05-01", "2026-05-02"),               # 8 sem email
+    ("rui@teste.pt", "XX-88-XX", "2026-05-05", "2026-05-07"),   # 9 aceite (começa no fim da existente)
+]
+REJEITADAS = {
+    3: "Sobrepõe a linha 2 do ficheiro.",
+    4: "Matrícula não encontrada ou inativa.",
+    5: "Matrícula não encontrada ou inativa.",
+    6: "data_fim deve ser posterior a data_inicio.",
+    7: "Viatura indisponível nesse período.",
+    8: "Campos em falta: email",
+}
+
+
+@pytest.fixture
+def historico(pasta):
+    existente = Booking(email="ja@teste.pt", matricula="XX-88-XX", data_inicio="2026-05-01",
+                        data_fim="2026-05-05", dias=4, preco_diario=200, desconto=0, total=800)
+    bookings_store.save_bookings([existente])
+    return existente
+
+
+## Conta as escritas no journal das reservas
+@pytest.fixture
+def escritas(monkeypatch):
+    chamadas = []
+    original = bookings_store._acrescentar_journal
+
+    def acrescentar_journal(filename, offset, dados):
+        chamadas.append(dados.count(b"\n"))
+        return original(filename, offset, dados)
+
+    monkeypatch.setattr(bookings_store, "_acrescentar_journal", acrescentar_journal)
+    return chamadas
+
+
+def test_importar_csv(historico, escritas):
+    ## Exportado de uma folha de cálculo: começa com BOM
+    with open("reservas.csv", "w", encoding="utf-8-sig", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(importar_reservas.CAMPOS)
+        escritor.writerows(LINHAS)
+
+    resultado = importar_reservas.importar("reservas.csv")
+    assert [(n, b.email, b.matricula) for n, b in resultado["aceites"]] == [
+        (2, "ana@teste.pt", "AA-00-AA"), (9, "rui@teste.pt", "XX-88-XX"),
+    ]
+    assert {n: motivo for n, _, motivo in resultado["rejeitadas"]} == REJEITADAS
+    assert [n for n, _, _ in resultado["rejeitadas"]] == sorted(REJEITADAS)
+
+    ## As aceites cotadas e gravadas numa só escrita
+    assert escritas == [2]
+    gravadas = {(b.matricula, b.data_inicio): b for b in bookings_store.load_bookings()}
+    assert len(gravadas) == 3
+    assert gravadas[("AA-00-AA", "2026-05-01")].dias == 3
+    assert float(gravadas[("AA-00-AA", "2026-05-01")].total) > 0
+
+    ## Relatório de rejeições: linha, campos originais e motivo
+    importar_reservas.gravar_relatorio("rejeicoes.csv", resultado["rejeitadas"])
+    with open("rejeicoes.csv", encoding="utf-8", newline="") as f:
+        relatorio = list(csv.DictReader(f))
+    assert [(int(r["linha"]), r["motivo"]) for r in relatorio] == sorted(REJEITADAS.items())
+    assert [r["matricula"] for r in relatorio] == [LINHAS[n - 2][1] for n in sorted(REJEITADAS)]
+
+    ## Importar outra vez: tudo em conflito com o que já foi gravado e nenhuma escrita
+    resultado = importar_reservas.importar("reservas.csv")
+    assert resultado["aceites"] == []
+    assert escritas == [2]
+
+
+def test_importar_jsonl(historico, escritas):
+    with open("reservas.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps(dict(zip(importar_reservas.CAMPOS, LINHAS[0]))) + "\n")
+        f.write("isto não é json\n")
+        f.write("\n")
+        f.write(json.dumps(dict(zip(importar_reservas.CAMPOS, LINHAS[5]))) + "\n")
+    resultado = importar_reservas.importar("reservas.jsonl")
+    assert [n for n, _ in resultado["aceites"]] == [1]
+    assert [(n, motivo) for n, _, motivo in resultado["rejeitadas"]] == [
+        (2, "Linha inválida (não é um objeto JSON)."), (4, "Viatura indisponível nesse período."),
+    ]
+    assert escritas == [1]
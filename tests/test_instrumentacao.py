@@ -0,0 +1,35 @@
+## Instrumentação: além de read_json/save_json/atualizar_json, contam os acrescentos ao journal das
+## reservas e as leituras das partições e dos fragmentos do índice por email
+import pytest
+
+import bookings_store
+import instrumentacao
+from conftest import gerar_reservas
+
+
+@pytest.fixture
+def medir():
+    instrumentacao.limpar()
+    instrumentacao.ativar(relatorio_na_saida=False)
+    yield lambda: {linha["nome"]: linha for linha in instrumentacao.relatorio()}
+    instrumentacao.desativar()
+    instrumentacao.limpar()
+
+
+def test_caminhos_do_historico_medidos(pasta, medir):
+    reservas = gerar_reservas(300)
+    bookings_store.save_bookings(reservas[:250])
+    bookings_store.registar_reservas(bookings_store.abrir(), reservas[250:])
+    assert sum(1 for _ in bookings_store.iterar_reservas()) == len(reservas)
+    bookings_store.historico_cliente(reservas[0].email)
+    bookings_store.compactar()
+    bookings_store.historico_cliente(reservas[0].email)
+
+    linhas = medir()
+    for nome in ("acrescentar_journal", "ler_journal", "iterar_array", "ler_lista", "indexar_emails",
+                 "emails_particao", "ler_fragmento"):
+        assert linhas[nome]["chamadas"] > 0, nome
+    assert linhas["acrescentar_journal"]["chamadas"] == 1
+    assert linhas["acrescentar_journal"]["bytes_escritos"] > 0
+    for nome in ("ler_journal", "iterar_array", "indexar_emails"):
+        assert linhas[nome]["bytes_lidos"] > 0, nome
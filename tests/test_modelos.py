@@ -0,0 +1,22 @@
+## Conversão de datas: mesmos resultados com e sem cache, e a cache não cresce sem limite
+import modelos
+
+
+def test_ordinal():
+    assert modelos.ordinal("2025-01-05") == modelos.ordinal("2025-1-5") == 739256
+    for invalida in ("2025-02-30", "05-01-2025", "abcdefghij", "", None, 20250105, ["2025-01-05"]):
+        assert modelos.ordinal(invalida) is None
+
+
+def test_cache_de_ordinais_limitada(monkeypatch):
+    monkeypatch.setattr(modelos, "_ordinais", {})
+    monkeypatch.setattr(modelos, "MAXIMO_ORDINAIS", 100)
+    ## Texto vindo de clientes: inválido ou fora do formato exato não fica na cache
+    for i in range(500):
+        assert modelos.ordinal(f"lixo-{i}") is None
+        assert modelos.ordinal(f"2025-1-{i % 28 + 1}") is not None
+    assert modelos._ordinais == {}
+    ## Datas válidas ficam até ao limite e depois continuam a ser convertidas
+    for i in range(500):
+        assert modelos.ordinal(f"{2000 + i}-01-01") == modelos.date(2000 + i, 1, 1).toordinal()
+    assert len(modelos._ordinais) == 100
@@ -0,0 +1,108 @@
+## Servidor JSON lines: cada linha tem uma resposta com o mesmo "id", por ordem; pedidos inválidos
+## (JSON malformado, campos em falta, operação desconhecida, sem login) têm uma resposta de erro e
+## a ligação continua; reservas concorrentes do mesmo carro passam pelo escritor e só uma fica
+import asyncio
+import json
+
+import bookings_store
+import servidor
+
+PERIODO = {"data_inicio": "2027-03-01", "data_fim": "2027-03-04"}
+
+
+## Corre cliente(host, porta) contra um servidor numa porta livre
+def com_servidor(cliente):
+    async def correr():
+        s = servidor.Servidor()
+        escritor = asyncio.create_task(s.escritor())
+        server = await asyncio.start_server(s.atender, "127.0.0.1", 0)
+        try:
+            async with server:
+                return await cliente(*server.sockets[0].getsockname()[:2])
+        finally:
+            escritor.cancel()
+            s.servico.shutdown(wait=True)
+    return asyncio.run(correr())
+
+
+## Envia as linhas numa ligação e devolve as respostas (uma por linha não vazia)
+async def conversa(host, porta, linhas):
+    reader, writer = await asyncio.open_connection(host, porta)
+    try:
+        writer.write("".join(linha + "\n" for linha in linhas).encode("utf-8"))
+        await writer.drain()
+        return [json.loads(await reader.readline()) for linha in linhas if linha.strip()]
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def pedido(id, op, **campos):
+    return json.dumps({"id": id, "op": op, **campos})
+
+
+def test_protocolo_e_respostas_de_erro(pasta):
+    linhas = [
+        pedido(1, "ping"),
+        pedido(2, "historico"),
+        "{isto não é json",
+        "",
+        "[1, 2]",
+        pedido(3, "login", email="ana@teste.pt"),
+        pedido(4, "reservar", matricula="AA-00-AA", **PERIODO),
+        pedido(5, "reservar", matricula="AA-00-AA", data_inicio="2027-03-02"),
+        pedido(6, "reservar", matricula="AA-00-AA", **PERIODO),
+        pedido(7, "historico", pagina=1, por_pagina=5),
+        pedido(8, "disponivel", matricula="AA-00-AA", data_inicio=20270301, data_fim="2027-03-04"),
+        pedido(9, "voar"),
+        pedido(10, "estatisticas", **PERIODO),
+        pedido("fim", "ping"),
+    ]
+    respostas = com_servidor(lambda host, porta: conversa(host, porta, linhas))
+
+    assert [r["id"] for r in respostas] == [1, 2, None, None, 3, 4, 5, 6, 7, 8, 9, 10, "fim"]
+    por_id = {r["id"]: r for r in respostas if r["id"] is not None}
+    assert por_id[1] == {"id": 1, "ok": True, "resultado": "pong"}
+    assert por_id[2] == {"id": 2, "ok": False, "erro": "Faça login primeiro."}
+    assert respostas[2] == {"id": None, "ok": False, "erro": "Pedido JSON inválido."}
+    assert respostas[3] == {"id": None, "ok": False, "erro": "O pedido deve ser um objeto JSON."}
+    assert por_id[3]["resultado"] == {"email": "ana@teste.pt", "tipo": "cliente"}
+
+    reserva = por_id[4]["resultado"]
+    assert por_id[4]["ok"] and reserva["matricula"] == "AA-00-AA" and reserva["email"] == "ana@teste.pt"
+    assert por_id[5] == {"id": 5, "ok": False, "erro": "Campo em falta ou inválido: data_fim."}
+    assert not por_id[6]["ok"] and por_id[6]["erro"]
+
+    pagina = por_id[7]["resultado"]
+    assert pagina["total"] == 1 and pagina["reservas"] == [reserva]
+    assert por_id[8] == {"id": 8, "ok": False, "erro": "Campo em falta ou inválido: data_inicio."}
+    assert por_id[9] == {"id": 9, "ok": False, "erro": "Operação desconhecida: voar"}
+    assert por_id[10] == {"id": 10, "ok": False, "erro": "Operação reservada a administradores."}
+    assert por_id["fim"]["ok"]
+
+    assert [b.to_dict() for b in bookings_store.load_bookings()] == [reserva]
+
+
+def test_admin_e_reservas_concorrentes(pasta):
+    async def cliente(host, porta):
+        admin = await conversa(host, porta, [
+            pedido(1, "login", email="rentacar@staff.pt", senha="errada"),
+            pedido(2, "login", email="rentacar@staff.pt", senha="portugal"),
+        ])
+        ## Várias sessões a reservar o mesmo carro ao mesmo tempo
+        sessoes = await asyncio.gather(*(
+            conversa(host, porta, [pedido(1, "login", email=f"c{i}@teste.pt"),
+                                   pedido(2, "reservar", matricula="BB-11-BB", **PERIODO)])
+            for i in range(8)
+        ))
+        return admin, sessoes
+
+    admin, sessoes = com_servidor(cliente)
+    assert admin[0] == {"id": 1, "ok": False, "erro": "Password incorreto!"}
+    assert admin[1]["resultado"] == {"email": "rentacar@staff.pt", "tipo": "admin"}
+
+    reservas = [respostas[1] for respostas in sessoes]
+    assert sum(r["ok"] for r in reservas) == 1
+    assert all(r["erro"] for r in reservas if not r["ok"])
+    gravadas = bookings_store.load_bookings()
+    assert len(gravadas) == 1 and gravadas[0].to_dict() == next(r["resultado"] for r in reservas if r["ok"])
@@ -0,0 +1,48 @@
+## Journal dos utilizadores: uma última linha cortada (escrita interrompida) não estraga o registo
+## seguinte nem a leitura, com o índice em memória vazio ou já carregado
+import json
+
+import pytest
+
+import users_store
+
+
+def utilizador(email):
+    return {"email": email, "senha": "x", "tipo": "cliente", "nome": email.split("@")[0]}
+
+
+@pytest.fixture
+def indice(pasta, monkeypatch):
+    monkeypatch.setattr(users_store, "_indice", {"versao": None, "offset": 0, "por_email": {}})
+
+
+def esquecer_indice():
+    users_store._indice.update(versao=None, offset=0, por_email={})
+
+
+@pytest.mark.parametrize("indice_carregado", [False, True])
+def test_linha_cortada_no_fim_do_journal(indice, indice_carregado):
+    users_store.registar(utilizador("antes@teste.pt"))
+    if not indice_carregado:
+        esquecer_indice()
+
+    ## Outro processo morreu a meio de acrescentar uma linha
+    cortada = (json.dumps(utilizador("cortado@teste.pt")) + "\n").encode("utf-8")
+    with open(users_store.JOURNAL_FILE, "ab") as f:
+        f.write(cortada[:len(cortada) // 2])
+
+    assert users_store.procurar("cortado@teste.pt") is None
+    assert users_store.registar(utilizador("depois@teste.pt"))["email"] == "depois@teste.pt"
+
+    with open(users_store.JOURNAL_FILE, "rb") as f:
+        linhas = f.read().split(b"\n")
+    assert linhas[-1] == b""
+    assert [json.loads(linha)["email"] for linha in linhas[:-1]] == ["antes@teste.pt", "depois@teste.pt"]
+
+    esquecer_indice()
+    for email in ("antes@teste.pt", "depois@teste.pt"):
+        assert users_store.procurar(email)["email"] == email
+    assert users_store.procurar("cortado@teste.pt") is None
+    emails = [u["email"] for u in users_store.load_users()]
+    assert emails[-2:] == ["antes@teste.pt", "depois@teste.pt"]
+    assert "cortado@teste.pt" not in emails
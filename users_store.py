@@ -0,0 +1,110 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import storage_sqlite
+import utils
+from utils import read_json, bloquear, assinatura_ficheiro
+
+## FICHEIROS DOS UTILIZADORES
+## users.json (lista completa) + journal append-only com os clientes registados no login
+USERS_FILE = "data/users.json"
+JOURNAL_FILE = "data/users.jsonl"
+
+## Índice em memória email -> utilizador, válido para uma versão de users.json
+## (o journal só cresce; a posição já lida fica em "offset")
+_indice = {"versao": None, "offset": 0, "por_email": {}}
+
+
+def _sqlite() -> bool:
+    return utils.BACKEND == "sqlite"
+
+
+## Lê as linhas completas do journal a partir de um offset; devolve (registos, offset final)
+def _ler_journal(offset: int = 0) -> tuple:
+    registos = []
+    if not os.path.exists(JOURNAL_FILE):
+        return registos, 0
+    with open(JOURNAL_FILE, "rb") as f:
+        f.seek(offset)
+        for linha in f:
+            if not linha.endswith(b"\n"):
+                break
+            offset += len(linha)
+            try:
+                registo = json.loads(linha)
+            except ValueError:
+                continue
+            if isinstance(registo, dict):
+                registos.append(registo)
+    return registos, offset
+
+
+## Junta utilizadores ao índice (o primeiro com cada email ganha, como na procura linear)
+def _indexar(utilizadores) -> None:
+    por_email = _indice["por_email"]
+    for u in utilizadores:
+        if isinstance(u, dict) and "email" in u:
+            por_email.setdefault(u["email"], u)
+
+
+## Traz o índice para o estado atual dos ficheiros:
+## users.json reescrito ou journal apagado -> reconstruir; senão ler só o fim do journal
+def _atualizar() -> None:
+    versao = assinatura_ficheiro(USERS_FILE)
+    tamanho = os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+    if versao != _indice["versao"] or tamanho < _indice["offset"]:
+        _indice["versao"] = versao
+        _indice["offset"] = 0
+        _indice["por_email"] = {}
+        utilizadores = read_json(USERS_FILE)
+        _indexar(utilizadores if isinstance(utilizadores, list) else [])
+    novos, _indice["offset"] = _ler_journal(_indice["offset"])
+    _indexar(novos)
+
+
+## Procura um utilizador pelo email (None se não existir)
+def procurar(email: str) -> Optional[Dict]:
+    if _sqlite():
+        return storage_sqlite.procurar_utilizador(email)
+    _atualizar()
+    return _indice["por_email"].get(email)
+
+
+## Regista um utilizador novo acrescentando uma linha ao journal (sem reescrever users.json)
+## Se entretanto outra sessão registou o mesmo email, devolve esse registo
+def registar(utilizador: Dict) -> Dict:
+    if _sqlite():
+        with storage_sqlite.transacao(imediata=True):
+            existente = storage_sqlite.procurar_utilizador(utilizador["email"])
+            if existente is not None:
+                return existente
+            storage_sqlite.inserir_utilizador(utilizador)
+        return utilizador
+
+    with bloquear(USERS_FILE):
+        _atualizar()
+        existente = _indice["por_email"].get(utilizador["email"])
+        if existente is not None:
+            return existente
+        with open(JOURNAL_FILE, "ab") as f:
+            ## Linha incompleta de uma escrita interrompida: sai antes de acrescentar
+            if f.tell() > _indice["offset"]:
+                f.truncate(_indice["offset"])
+            f.write((json.dumps(utilizador, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            _indice["offset"] = f.tell()
+        _indice["por_email"][utilizador["email"]] = utilizador
+    return utilizador
+
+
+## Lista completa: users.json seguido dos registos do journal
+def load_users() -> List[Dict]:
+    if _sqlite():
+        return storage_sqlite.ler_tabela("users")
+    utilizadores = read_json(USERS_FILE)
+    if not isinstance(utilizadores, list):
+        utilizadores = []
+    novos, _ = _ler_journal()
+    return utilizadores + novos
@@ -1,15 +1,219 @@
 import json
+import marshal
 import os
+import tempfile
+from contextlib import contextmanager
+
+import instrumentacao
+import storage_sqlite
+
+## Backend de armazenamento: "json" (ficheiros em data/) ou "sqlite" (storage_sqlite)
+BACKEND = os.environ.get("RENTACAR_BACKEND", "json")
+
+## Snapshots binários (marshal) dos ficheiros JSON grandes para arrancar mais depressa
+## (RENTACAR_SNAPSHOT=0 desliga); só para ficheiros com pelo menos MINIMO_SNAPSHOT bytes
+SNAPSHOTS = os.environ.get("RENTACAR_SNAPSHOT", "1") != "0"
+MINIMO_SNAPSHOT = 64 * 1024
+## Muda se o formato do snapshot mudar (os antigos deixam de ser válidos)
+VERSAO_SNAPSHOT = 1
+
+## Bloqueio entre processos: fcntl em Linux/macOS, msvcrt em Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+## Bloqueia um ficheiro de dados (através de um ficheiro .lock ao lado) entre sessões
+## partilhado=True permite vários leitores em simultâneo (em Windows é sempre exclusivo)
+## esperar=False não espera: lança OSError se outra sessão tem o bloqueio
+@contextmanager
+def bloquear(filename, partilhado=False, esperar=True):
+    with open(filename + ".lock", "a+") as lock:
+        if fcntl:
+            modo = fcntl.LOCK_SH if partilhado else fcntl.LOCK_EX
+            fcntl.flock(lock.fileno(), modo if esperar else modo | fcntl.LOCK_NB)
+        else:
+            lock.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK if esperar else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not esperar:
+                        raise
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+## Escreve o texto num ficheiro temporário na mesma pasta e devolve o caminho
+def escrever_temporario(filename, texto):
+    pasta = os.path.dirname(filename) or "."
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix=os.path.basename(filename) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(texto)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+
+## Substitui o ficheiro de uma só vez: quem lê vê sempre a versão antiga ou a nova
+def escrever_atomico(filename, texto):
+    tmp = escrever_temporario(filename, texto)
+    try:
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+## ---------- CACHE DE FICHEIROS JSON ----------
+
+## caminho absoluto -> (assinatura do ficheiro, dados lidos)
+## Os objetos devolvidos são partilhados: quem os altera deve gravá-los com save_json
+_cache = {}
+_contadores = {"hits": 0, "misses": 0}
+
+
+## Assinatura usada para revalidar a cache (o rename atómico muda o inode)
+def assinatura_ficheiro(filename):
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+## Contadores de acessos à cache
+def estatisticas_cache():
+    return {"hits": _contadores["hits"], "misses": _contadores["misses"], "ficheiros": len(_cache)}
+
+
+## Esquece um ficheiro (ou todos) da cache
+def limpar_cache(filename=None):
+    if filename is None:
+        _cache.clear()
+    else:
+        _cache.pop(os.path.abspath(filename), None)
+
+
+## ---------- SNAPSHOTS BINÁRIOS ----------
+
+## Snapshot de um ficheiro JSON: ficheiro.json.bin ao lado, com a assinatura da fonte
+def ficheiro_snapshot(filename):
+    return filename + ".bin"
+
+
+## Dados do snapshot se ainda corresponde à fonte com essa assinatura (None se não existe ou está velho)
+def ler_snapshot(filename, assinatura):
+    if not SNAPSHOTS or assinatura is None or assinatura[2] < MINIMO_SNAPSHOT:
+        return None
+    try:
+        with open(ficheiro_snapshot(filename), "rb") as f:
+            conteudo = f.read()
+        versao, origem, data = marshal.loads(conteudo)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if versao != VERSAO_SNAPSHOT or tuple(origem) != assinatura:
+        return None
+    instrumentacao.transferidos("read_json", lidos=len(conteudo))
+    return data
+
+
+## Grava o snapshot dos dados do ficheiro (com a assinatura atual da fonte)
+## É só uma cache: falhas são ignoradas e não precisa de fsync
+def gravar_snapshot(filename, data, assinatura=None):
+    assinatura = assinatura or assinatura_ficheiro(filename)
+    if not SNAPSHOTS or assinatura is None or assinatura[2] < MINIMO_SNAPSHOT:
+        return
+    destino = ficheiro_snapshot(filename)
+    try:
+        conteudo = marshal.dumps((VERSAO_SNAPSHOT, assinatura, data))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino) or ".", prefix=os.path.basename(destino) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(conteudo)
+            os.replace(tmp, destino)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except (OSError, ValueError):
+        pass
+
 
 ## Ler ficheiro json
+## (não precisa de bloqueio: as escritas são atómicas)
+## Se o ficheiro não mudou desde a última leitura devolve os dados já lidos;
+## senão usa o snapshot binário quando ainda é válido (e cria-o quando não é)
+## Com o backend sqlite lê a tabela correspondente ao ficheiro
+@instrumentacao.medir("read_json")
 def read_json(filename):
-    if os.path.exists(filename):
+    if BACKEND == "sqlite" and storage_sqlite.tabela_de(filename):
+        return storage_sqlite.ler_tabela(storage_sqlite.tabela_de(filename))
+
+    chave = os.path.abspath(filename)
+    assinatura = assinatura_ficheiro(filename)
+    if assinatura is None:
+        _cache.pop(chave, None)
+        return []
+
+    em_cache = _cache.get(chave)
+    if em_cache is not None and em_cache[0] == assinatura:
+        _contadores["hits"] += 1
+        return em_cache[1]
+
+    _contadores["misses"] += 1
+    data = ler_snapshot(filename, assinatura)
+    if data is None:
         with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+            data = json.load(f)
+        instrumentacao.transferidos("read_json", lidos=assinatura[2])
+        gravar_snapshot(filename, data, assinatura)
+    _cache[chave] = (assinatura, data)
+    return data
+
+## Lê, altera e grava o ficheiro debaixo do mesmo bloqueio (sem perder escritas de outras sessões)
+## alterar recebe uma cópia da lista atual e devolve a lista a gravar; devolve essa lista
+@instrumentacao.medir("atualizar_json")
+def atualizar_json(filename, alterar):
+    if BACKEND == "sqlite" and storage_sqlite.tabela_de(filename):
+        return storage_sqlite.atualizar_tabela(storage_sqlite.tabela_de(filename), alterar)
+    with bloquear(filename):
+        atual = read_json(filename)
+        data = alterar(list(atual) if isinstance(atual, list) else [])
+        texto = json.dumps(data, ensure_ascii=False, indent=2)
+        if instrumentacao.ativo():
+            instrumentacao.transferidos("atualizar_json", escritos=len(texto.encode("utf-8")))
+        escrever_atomico(filename, texto)
+        assinatura = assinatura_ficheiro(filename)
+        _cache[os.path.abspath(filename)] = (assinatura, data)
+    gravar_snapshot(filename, data, assinatura)
+    return data
+
 
-## Escrever ficheiro json
+## Escrever ficheiro json (bloqueado + escrita atómica) e atualizar a cache
+@instrumentacao.medir("save_json")
 def save_json(filename, data):
+    if BACKEND == "sqlite" and storage_sqlite.tabela_de(filename):
+        storage_sqlite.gravar_tabela(storage_sqlite.tabela_de(filename), data)
+        return
     if os.path.isfile(filename):
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        texto = json.dumps(data, ensure_ascii=False, indent=2)
+        if instrumentacao.ativo():
+            instrumentacao.transferidos("save_json", escritos=len(texto.encode("utf-8")))
+        with bloquear(filename):
+            escrever_atomico(filename, texto)
+            assinatura = assinatura_ficheiro(filename)
+            _cache[os.path.abspath(filename)] = (assinatura, data)
+        gravar_snapshot(filename, data, assinatura)